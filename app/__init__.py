@@ -1,9 +1,10 @@
+import os
 from flask import Flask
-from config.config import Config
+from config.config import config
 
-def create_app():
+def create_app(config_name=None):
     app = Flask(__name__)
-    app.config.from_object(Config)
+    app.config.from_object(config[config_name or os.environ.get('FLASK_ENV') or 'default'])
     
     # Setup logging
     from app.utils.logger import setup_logger
@@ -13,9 +14,23 @@ def create_app():
     from app.utils.error_handlers import register_error_handlers
     register_error_handlers(app)
     
+    # Request timing and the /metrics endpoint
+    from app.routes.metrics import init_metrics
+    init_metrics(app)
+    
+    # Compressed responses and fingerprinted, precompressed static files;
+    # registered after the metrics so compression counts towards request time
+    from app.utils.compression import init_compression
+    from app.utils.static_assets import init_static_assets
+    init_compression(app)
+    init_static_assets(app)
+    
     # Register blueprints
-    from app.routes.troubleshooting import troubleshooting_bp
+    from app.routes.troubleshooting import troubleshooting_bp, service
+    from app.routes.health import health_bp
+    service.init_app(app)
     app.register_blueprint(troubleshooting_bp)
+    app.register_blueprint(health_bp)
     
     app.logger.info('ResolvIQ application started')
     return app
\ No newline at end of file
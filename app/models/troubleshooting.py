@@ -1,21 +1,63 @@
+from array import array
 from datetime import datetime
-from dataclasses import dataclass, field
-from typing import List, Optional
+from dataclasses import dataclass, field, replace
+from enum import StrEnum
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union, TYPE_CHECKING
+import time
 import uuid
 
-@dataclass
+if TYPE_CHECKING:
+    from app.services.blob_store import BlobRef
+
+class Priority(StrEnum):
+    LOW = "Low"
+    MEDIUM = "Medium"
+    HIGH = "High"
+    CRITICAL = "Critical"
+    
+    @classmethod
+    def parse(cls, value: Optional[str]) -> 'Priority':
+        """Case-insensitive lookup; unknown or missing values fall back to Medium"""
+        try:
+            return cls(str(value).capitalize())
+        except ValueError:
+            return cls.MEDIUM
+
+def parse_timestamp(value: Union[str, float, int]) -> float:
+    """Accept a POSIX timestamp or a (local time) ISO 8601 string"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(value).timestamp()
+
+def format_timestamp(value: float) -> str:
+    return datetime.fromtimestamp(value).isoformat()
+
+def format_duration(seconds: float) -> str:
+    """Days, hours and minutes such as ``1d 2h 5m``; durations under a minute in seconds"""
+    seconds = int(seconds)
+    if seconds < 60:
+        return f'{seconds}s'
+    hours, minutes = divmod(seconds // 60, 60)
+    days, hours = divmod(hours, 24)
+    parts = [f'{days}d'] if days else []
+    if days or hours:
+        parts.append(f'{hours}h')
+    parts.append(f'{minutes}m')
+    return ' '.join(parts)
+
+@dataclass(slots=True)
 class IssueInfo:
     title: str = ""
     server: str = ""
     symptoms: str = ""
-    priority: str = "Medium"
+    priority: Priority = Priority.MEDIUM
     
     def to_dict(self) -> dict:
         return {
             'title': self.title,
             'server': self.server,
             'symptoms': self.symptoms,
-            'priority': self.priority
+            'priority': self.priority.value
         }
     
     @classmethod
@@ -24,24 +66,47 @@ class IssueInfo:
             title=data.get('title', ''),
             server=data.get('server', ''),
             symptoms=data.get('symptoms', ''),
-            priority=data.get('priority', 'Medium')
+            priority=Priority.parse(data.get('priority'))
         )
 
-@dataclass
+@dataclass(slots=True)
 class Step:
     id: int
     command: str = ""
     output: str = ""
     analysis: str = ""
-    timestamp: str = field(default_factory=lambda: datetime.now().isoformat())
+    # POSIX time; formatted only when the step is serialized
+    timestamp: float = field(default_factory=time.time)
+    # Large outputs live in the blob store; ``output`` is empty when this is set
+    output_ref: Optional['BlobRef'] = None
+    
+    @property
+    def timestamp_iso(self) -> str:
+        return format_timestamp(self.timestamp)
+    
+    @property
+    def output_length(self) -> int:
+        return self.output_ref.size if self.output_ref else len(self.output)
+    
+    def read_output(self) -> str:
+        return self.output_ref.read() if self.output_ref else self.output
+    
+    def iter_output(self) -> Iterator[str]:
+        if self.output_ref:
+            yield from self.output_ref.iter_chunks()
+        elif self.output:
+            yield self.output
+    
+    def output_preview(self, limit: int) -> str:
+        return self.output_ref.preview(limit) if self.output_ref else self.output[:limit]
     
     def to_dict(self) -> dict:
         return {
             'id': self.id,
             'command': self.command,
-            'output': self.output,
+            'output': self.read_output(),
             'analysis': self.analysis,
-            'timestamp': self.timestamp
+            'timestamp': self.timestamp_iso
         }
     
     @classmethod
@@ -51,10 +116,10 @@ class Step:
             command=data.get('command', ''),
             output=data.get('output', ''),
             analysis=data.get('analysis', ''),
-            timestamp=data.get('timestamp', datetime.now().isoformat())
+            timestamp=parse_timestamp(data['timestamp']) if 'timestamp' in data else time.time()
         )
 
-@dataclass
+@dataclass(slots=True)
 class Resolution:
     root_cause: str = ""
     solution: str = ""
@@ -81,25 +146,310 @@ class Resolution:
             prevention=data.get('prevention', '')
         )
 
-@dataclass
+# StepList slots per block, as a shift; copies of a list share blocks
+BLOCK_SHIFT = 8
+BLOCK_SIZE = 1 << BLOCK_SHIFT
+BLOCK_MASK = BLOCK_SIZE - 1
+
+class _Block:
+    """Up to BLOCK_SIZE consecutive slots of a StepList: their steps and links.
+    
+    A block may only be written by the list whose ``owner`` token it carries;
+    any other list sharing it copies it first.
+    """
+    
+    __slots__ = ('steps', 'prev', 'next', 'owner')
+    
+    def __init__(self, owner: object, steps: Optional[List[Optional[Step]]] = None,
+                 prev: Optional[array] = None, next_: Optional[array] = None):
+        self.steps = steps if steps is not None else []
+        self.prev = prev if prev is not None else array('i')
+        self.next = next_ if next_ is not None else array('i')
+        self.owner = owner
+    
+    def copy(self, owner: object) -> '_Block':
+        return _Block(owner, self.steps.copy(), self.prev[:], self.next[:])
+
+class _IdBlock(dict):
+    """Slots of the step IDs that share their high bits, with the owner token of its list"""
+    
+    __slots__ = ('owner',)
+
+class StepList:
+    """Ordered steps with an ID index.
+    
+    Steps are kept in a doubly linked list next to a dict from step ID to
+    list slot, so lookup, removal, insertion before another step and
+    reordering are all O(1). The links are two integer arrays indexed by
+    slot rather than a node object per step, which keeps very long sessions
+    compact; slot 0 is the list head. IDs come from a monotonic counter and
+    are never reused after a step is removed.
+    
+    Slots and the ID index are split into blocks of BLOCK_SIZE. ``copy``
+    shares all blocks with the original, and each list copies a block only
+    before it first writes to it, so a copy that is changed in one place
+    costs O(n / BLOCK_SIZE) instead of O(n).
+    """
+    
+    __slots__ = ('_blocks', '_ids', '_free', '_size', '_count', '_owner', 'next_id')
+    
+    def __init__(self, steps: Iterable[Step] = (), next_id: int = 1):
+        self._owner = object()
+        self._blocks: List[_Block] = [_Block(self._owner, [None], array('i', [0]), array('i', [0]))]
+        self._ids: Dict[int, _IdBlock] = {}
+        # Free slots as a linked stack of (slot, rest) pairs, so copies can share it
+        self._free: Optional[Tuple[int, tuple]] = None
+        self._size = 1
+        self._count = 0
+        self.next_id = next_id
+        for step in steps:
+            self.append(step)
+    
+    def allocate_id(self) -> int:
+        step_id = self.next_id
+        self.next_id += 1
+        return step_id
+    
+    def append(self, step: Step) -> Step:
+        return self.insert(step)
+    
+    def insert(self, step: Step, before: Optional[int] = None) -> Step:
+        """Insert a step before the step with ID ``before``, or at the end"""
+        if self._slot(step.id) is not None:
+            raise ValueError(f'Duplicate step ID {step.id}')
+        anchor = self._slot(before) if before is not None else 0
+        if anchor is None:
+            raise KeyError(before)
+        if self._free is not None:
+            slot, self._free = self._free
+            self._block(slot).steps[slot & BLOCK_MASK] = step
+        else:
+            slot = self._size
+            self._size += 1
+            if slot >> BLOCK_SHIFT == len(self._blocks):
+                self._blocks.append(_Block(self._owner))
+            block = self._block(slot)
+            block.steps.append(step)
+            block.prev.append(0)
+            block.next.append(0)
+        self._link(slot, anchor)
+        self._set_slot(step.id, slot)
+        self._count += 1
+        self.next_id = max(self.next_id, step.id + 1)
+        return step
+    
+    def move(self, step_id: int, before: Optional[int] = None) -> bool:
+        """Move a step before the step with ID ``before``, or to the end"""
+        slot = self._slot(step_id)
+        anchor = self._slot(before) if before is not None else 0
+        if slot is None or anchor is None or step_id == before:
+            return False
+        self._unlink(slot)
+        self._link(slot, anchor)
+        return True
+    
+    def get(self, step_id: int) -> Optional[Step]:
+        # _slot and _step inlined, this is the hot path of step lookups
+        ids = self._ids.get(step_id >> BLOCK_SHIFT)
+        slot = ids.get(step_id) if ids is not None else None
+        return self._blocks[slot >> BLOCK_SHIFT].steps[slot & BLOCK_MASK] if slot is not None else None
+    
+    def replace(self, step: Step) -> None:
+        """Swap in a new version of the step with the same ID, keeping its position"""
+        slot = self._slot(step.id)
+        if slot is None:
+            raise KeyError(step.id)
+        self._block(slot).steps[slot & BLOCK_MASK] = step
+    
+    def copy(self) -> 'StepList':
+        """Independent list over the same Step objects, sharing all blocks with this one"""
+        steps = StepList.__new__(StepList)
+        steps._blocks = self._blocks.copy()
+        steps._ids = self._ids.copy()
+        steps._free = self._free
+        steps._size = self._size
+        steps._count = self._count
+        steps._owner = object()
+        steps.next_id = self.next_id
+        # The blocks are shared now, so this list has to copy them before writing as well
+        self._owner = object()
+        return steps
+    
+    def remove(self, step_id: int) -> Optional[Step]:
+        slot = self._slot(step_id)
+        if slot is None:
+            return None
+        self._set_slot(step_id, None)
+        self._unlink(slot)
+        block = self._block(slot)
+        step = block.steps[slot & BLOCK_MASK]
+        block.steps[slot & BLOCK_MASK] = None
+        self._free = (slot, self._free)
+        self._count -= 1
+        return step
+    
+    def previous_id(self, step_id: int) -> Optional[int]:
+        slot = self._slot(step_id)
+        if slot is None:
+            raise KeyError(step_id)
+        prev = self._prev(slot)
+        return self._step(prev).id if prev else None
+    
+    def page(self, before: Optional[int] = None, limit: int = 20) -> Tuple[List[Step], bool]:
+        """Return up to ``limit`` steps preceding ``before`` (or the last steps),
+        oldest first, and whether earlier steps exist"""
+        anchor = self._slot(before) if before is not None else 0
+        if anchor is None:
+            return [], False
+        slot = self._prev(anchor)
+        steps = []
+        while slot and len(steps) < limit:
+            steps.append(self._step(slot))
+            slot = self._prev(slot)
+        steps.reverse()
+        return steps, slot != 0
+    
+    def page_after(self, after: Optional[int] = None, limit: int = 20) -> Tuple[List[Step], bool]:
+        """Return up to ``limit`` steps following ``after`` (or the first steps)
+        and whether later steps exist"""
+        anchor = self._slot(after) if after is not None else 0
+        if anchor is None:
+            return [], False
+        slot = self._next(anchor)
+        steps = []
+        while slot and len(steps) < limit:
+            steps.append(self._step(slot))
+            slot = self._next(slot)
+        return steps, slot != 0
+    
+    def _slot(self, step_id: int) -> Optional[int]:
+        ids = self._ids.get(step_id >> BLOCK_SHIFT)
+        return ids.get(step_id) if ids is not None else None
+    
+    def _set_slot(self, step_id: int, slot: Optional[int]) -> None:
+        """Point a step ID at a slot, or drop it with None"""
+        key = step_id >> BLOCK_SHIFT
+        ids = self._ids.get(key)
+        if ids is None or ids.owner is not self._owner:
+            ids = _IdBlock(ids or ())
+            ids.owner = self._owner
+            self._ids[key] = ids
+        if slot is not None:
+            ids[step_id] = slot
+        else:
+            del ids[step_id]
+            if not ids:
+                del self._ids[key]
+    
+    def _block(self, slot: int) -> _Block:
+        """The block holding a slot, copied first unless this list owns it"""
+        index = slot >> BLOCK_SHIFT
+        block = self._blocks[index]
+        if block.owner is not self._owner:
+            block = block.copy(self._owner)
+            self._blocks[index] = block
+        return block
+    
+    def _step(self, slot: int) -> Optional[Step]:
+        return self._blocks[slot >> BLOCK_SHIFT].steps[slot & BLOCK_MASK]
+    
+    def _prev(self, slot: int) -> int:
+        return self._blocks[slot >> BLOCK_SHIFT].prev[slot & BLOCK_MASK]
+    
+    def _next(self, slot: int) -> int:
+        return self._blocks[slot >> BLOCK_SHIFT].next[slot & BLOCK_MASK]
+    
+    def _link(self, slot: int, anchor: int) -> None:
+        prev = self._prev(anchor)
+        block = self._block(slot)
+        block.prev[slot & BLOCK_MASK] = prev
+        block.next[slot & BLOCK_MASK] = anchor
+        self._block(prev).next[prev & BLOCK_MASK] = slot
+        self._block(anchor).prev[anchor & BLOCK_MASK] = slot
+    
+    def _unlink(self, slot: int) -> None:
+        prev, next_ = self._prev(slot), self._next(slot)
+        self._block(prev).next[prev & BLOCK_MASK] = next_
+        self._block(next_).prev[next_ & BLOCK_MASK] = prev
+    
+    def __iter__(self) -> Iterator[Step]:
+        blocks = self._blocks
+        slot = blocks[0].next[0]
+        while slot:
+            block = blocks[slot >> BLOCK_SHIFT]
+            yield block.steps[slot & BLOCK_MASK]
+            slot = block.next[slot & BLOCK_MASK]
+    
+    def __len__(self) -> int:
+        return self._count
+    
+    def __contains__(self, step_id: int) -> bool:
+        return self._slot(step_id) is not None
+
+@dataclass(slots=True)
 class TroubleshootingSession:
     session_id: str = field(default_factory=lambda: str(uuid.uuid4()))
     issue_info: IssueInfo = field(default_factory=IssueInfo)
-    steps: List[Step] = field(default_factory=list)
+    steps: StepList = field(default_factory=StepList)
     resolution: Resolution = field(default_factory=Resolution)
     created_at: str = field(default_factory=lambda: datetime.now().isoformat())
     completed_at: Optional[datetime] = None
+    version: int = 0
+    updated_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    
+    @property
+    def resolution_seconds(self) -> Optional[float]:
+        """Seconds from opening the session to completing it, or None while it is open"""
+        if self.completed_at is None:
+            return None
+        return max(0.0, self.completed_at.timestamp() - parse_timestamp(self.created_at))
+    
+    def touch(self) -> None:
+        """Record a change so cached renderings of the session are invalidated"""
+        self.version += 1
+        self.updated_at = datetime.now().isoformat()
     
-    def add_step(self, command: str = "", output: str = "", analysis: str = "") -> Step:
-        step_id = len(self.steps) + 1
-        step = Step(id=step_id, command=command, output=output, analysis=analysis)
+    def copy(self) -> 'TroubleshootingSession':
+        """Copy that can be modified without affecting this session.
+        
+        Steps are shared, so they are never modified in place: update_step
+        swaps in a new Step instead.
+        """
+        return replace(self, issue_info=replace(self.issue_info), resolution=replace(self.resolution),
+                       steps=self.steps.copy())
+    
+    def add_step(self, command: str = "", output: str = "", analysis: str = "",
+                 output_ref: Optional['BlobRef'] = None, step_id: Optional[int] = None) -> Step:
+        if step_id is None:
+            step_id = self.steps.allocate_id()
+        step = Step(id=step_id, command=command, output=output, analysis=analysis, output_ref=output_ref)
         self.steps.append(step)
+        self.touch()
+        return step
+    
+    def get_step(self, step_id: int) -> Optional[Step]:
+        return self.steps.get(step_id)
+    
+    def update_step(self, step_id: int, **changes) -> Optional[Step]:
+        step = self.steps.get(step_id)
+        if step is None:
+            return None
+        step = replace(step, **changes)
+        self.steps.replace(step)
+        self.touch()
         return step
     
+    def move_step(self, step_id: int, before: Optional[int] = None) -> bool:
+        if not self.steps.move(step_id, before):
+            return False
+        self.touch()
+        return True
+    
     def remove_step(self, step_id: int) -> bool:
-        original_length = len(self.steps)
-        self.steps = [step for step in self.steps if step.id != step_id]
-        return len(self.steps) < original_length
+        if self.steps.remove(step_id) is None:
+            return False
+        self.touch()
+        return True
     
     def to_dict(self) -> dict:
         return {
@@ -107,16 +457,27 @@ class TroubleshootingSession:
             'issue_info': self.issue_info.to_dict(),
             'steps': [step.to_dict() for step in self.steps],
             'resolution': self.resolution.to_dict(),
-            'created_at': self.created_at
+            'created_at': self.created_at,
+            'updated_at': self.updated_at,
+            'version': self.version,
+            'next_step_id': self.steps.next_id,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None
         }
     
     @classmethod
     def from_dict(cls, data: dict) -> 'TroubleshootingSession':
-        session = cls(
-            session_id=data.get('session_id', str(uuid.uuid4())),
+        created_at = data['created_at'] if 'created_at' in data else datetime.now().isoformat()
+        completed_at = data.get('completed_at')
+        return cls(
+            session_id=data['session_id'] if 'session_id' in data else str(uuid.uuid4()),
             issue_info=IssueInfo.from_dict(data.get('issue_info', {})),
+            steps=StepList(
+                (Step.from_dict(step_data) for step_data in data.get('steps', [])),
+                next_id=data.get('next_step_id', 1)
+            ),
             resolution=Resolution.from_dict(data.get('resolution', {})),
-            created_at=data.get('created_at', datetime.now().isoformat())
-        )
-        session.steps = [Step.from_dict(step_data) for step_data in data.get('steps', [])]
-        return session
\ No newline at end of file
+            created_at=created_at,
+            completed_at=datetime.fromisoformat(completed_at) if completed_at else None,
+            version=data.get('version', 0),
+            updated_at=data.get('updated_at', created_at)
+        )
\ No newline at end of file
@@ -0,0 +1,25 @@
+import os
+from flask import Blueprint, current_app, jsonify
+from app.routes.troubleshooting import service
+
+health_bp = Blueprint('health', __name__)
+
+@health_bp.route('/healthz')
+def healthz():
+    """Liveness: the worker is up and answering requests"""
+    return jsonify({'status': 'ok'})
+
+@health_bp.route('/readyz')
+def readyz():
+    """Readiness: the worker can serve traffic and is not being drained"""
+    drain_file = current_app.config.get('DRAIN_FILE')
+    if drain_file and os.path.exists(drain_file):
+        return jsonify({'status': 'draining'}), 503
+
+    try:
+        service.check_ready()
+    except Exception as e:
+        current_app.logger.warning(f'Readiness check failed: {e}')
+        return jsonify({'status': 'unavailable', 'error': str(e)}), 503
+
+    return jsonify({'status': 'ready'})
@@ -0,0 +1,34 @@
+import time
+from flask import Blueprint, Response, g, request
+from app.services.metrics import CONTENT_TYPE, metrics
+
+metrics_bp = Blueprint('metrics', __name__)
+
+REQUEST_SECONDS = metrics.histogram(
+    'resolviq_request_duration_seconds',
+    'Time until the response is ready to send, by endpoint; streamed bodies are not included',
+    ('endpoint', 'method', 'status')
+)
+
+def _start_timer():
+    g.request_started = time.perf_counter()
+
+def _observe_request(response):
+    started = g.get('request_started')
+    if started is not None:
+        # Label by endpoint rather than path so IDs in URLs do not create new series
+        REQUEST_SECONDS.observe(time.perf_counter() - started, request.endpoint or 'unmatched',
+                                request.method, str(response.status_code))
+    return response
+
+def init_metrics(app):
+    """Time every request and serve the collected metrics at /metrics"""
+    metrics.init_app(app)
+    app.before_request(_start_timer)
+    app.after_request(_observe_request)
+    app.register_blueprint(metrics_bp)
+
+@metrics_bp.route('/metrics')
+def export_metrics():
+    """Prometheus text exposition of all registered metrics"""
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
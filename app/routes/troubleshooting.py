@@ -1,29 +1,128 @@
-from flask import Blueprint, render_template, request, session, jsonify, redirect, url_for
-from app.services.troubleshooting_service import TroubleshootingService
+import hmac
+from datetime import date, datetime, timedelta, timezone
+from flask import (Blueprint, Response, current_app, render_template, request, session, jsonify, redirect,
+                   url_for, stream_template, stream_with_context)
+from app.models.troubleshooting import TroubleshootingSession, format_duration
+from app.services.session_store import SessionFilter, VersionConflictError
+from app.services.session_view import SessionView
+from app.services.troubleshooting_service import CAPTURE_CHUNK_SIZE, OutputTooLargeError, TroubleshootingService
 
 troubleshooting_bp = Blueprint('troubleshooting', __name__)
 service = TroubleshootingService()
 
+def _writable_session_id():
+    """Return the caller's session ID, creating the session on first write"""
+    session_id = session.get('session_id')
+    if session_id and service.session_exists(session_id):
+        return session_id
+    
+    ts_session = service.create_session()
+    session['session_id'] = ts_session.session_id
+    session.permanent = True
+    return ts_session.session_id
+
+def _last_modified(ts_session):
+    # HTTP dates have second resolution
+    updated_at = datetime.fromisoformat(ts_session.updated_at)
+    return updated_at.astimezone(timezone.utc).replace(microsecond=0)
+
+def _set_validators(response, ts_session, etag):
+    response.set_etag(etag)
+    response.last_modified = _last_modified(ts_session)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def _not_modified(ts_session, etag):
+    """Return a 304 response if the client already has this session version"""
+    if request.if_none_match:
+        # Compressed responses carry the weak form of the same ETag
+        fresh = request.if_none_match.contains_weak(etag)
+    else:
+        fresh = (request.if_modified_since is not None and
+                 _last_modified(ts_session) <= request.if_modified_since)
+    
+    if not fresh:
+        return None
+    return _set_validators(Response(status=304), ts_session, etag)
+
+def _conflict():
+    return jsonify({'success': False, 'error': 'Session is being modified by another request, try again'}), 409
+
+def _session_not_found():
+    return jsonify({'success': False, 'error': 'Session not found'}), 404
+
+def _is_admin():
+    """Whether the request carries ADMIN_TOKEN as a bearer token; without a
+    configured token no request is, and bulk operations are left to the CLI"""
+    token = current_app.config.get('ADMIN_TOKEN')
+    scheme, _, given = request.headers.get('Authorization', '').partition(' ')
+    if not token or scheme.lower() != 'bearer':
+        return False
+    return hmac.compare_digest(given.strip().encode(), token.encode())
+
+def _admin_required():
+    return jsonify({'success': False, 'error': 'This operation requires the admin token'}), 403
+
 @troubleshooting_bp.route('/')
 def index():
+    # Anonymous visits render an unsaved blank session; one is only
+    # created once the user actually writes something
+    session_id = session.get('session_id')
+    ts_session = service.get_session(session_id) if session_id else None
+    if not ts_session:
+        session.pop('session_id', None)
+        session_id = None
+        ts_session = TroubleshootingSession()
+    
+    # Only the latest page of steps is rendered; older ones are loaded on demand
+    visible_steps, has_more_steps = service.get_steps_page(
+        ts_session, limit=current_app.config.get('STEPS_PAGE_SIZE', 20)
+    )
+    return render_template('index.html', session_data=ts_session, session_id=session_id,
+                           visible_steps=visible_steps, has_more_steps=has_more_steps)
+
+@troubleshooting_bp.route('/steps')
+def list_steps():
+    """Render a page of older steps as an HTML fragment"""
     session_id = session.get('session_id')
     if not session_id:
-        ts_session = service.create_session()
-        session['session_id'] = ts_session.session_id
-        session_id = ts_session.session_id
+        return jsonify({'success': False, 'error': 'No session found'})
     
     ts_session = service.get_session(session_id)
     if not ts_session:
-        ts_session = service.create_session()
-        session['session_id'] = ts_session.session_id
+        return jsonify({'success': False, 'error': 'Session not found'})
+    
+    steps, has_more = service.get_steps_page(
+        ts_session,
+        before=request.args.get('before', type=int),
+        limit=request.args.get('limit', current_app.config.get('STEPS_PAGE_SIZE', 20), type=int)
+    )
+    html = ''.join(render_template('partials/step.html', step=step) for step in steps)
+    return jsonify({'success': True, 'html': html, 'has_more': has_more})
+
+@troubleshooting_bp.route('/steps/<int:step_id>')
+def show_step(step_id):
+    """Render a single step as an HTML fragment, e.g. one another viewer just added"""
+    session_id = session.get('session_id')
+    step = service.get_step(session_id, step_id) if session_id else None
+    if not step:
+        return jsonify({'success': False, 'error': 'Step not found'}), 404
     
-    return render_template('index.html', session_data=ts_session)
+    return jsonify({'success': True, 'html': render_template('partials/step.html', step=step)})
+
+@troubleshooting_bp.route('/steps/<int:step_id>/output')
+def step_output(step_id):
+    session_id = session.get('session_id')
+    step = service.get_step(session_id, step_id) if session_id else None
+    if not step:
+        return jsonify({'success': False, 'error': 'Step not found'}), 404
+    
+    return Response(step.iter_output(), mimetype='text/plain')
 
 @troubleshooting_bp.route('/update_issue', methods=['POST'])
 def update_issue():
-    session_id = session.get('session_id')
-    if not session_id:
-        return jsonify({'success': False, 'error': 'No session found'})
+    session_id = _writable_session_id()
     
     issue_data = {
         'title': request.form.get('title', ''),
@@ -32,14 +131,15 @@ def update_issue():
         'priority': request.form.get('priority', 'Medium')
     }
     
-    success = service.update_issue_info(session_id, issue_data)
+    try:
+        success = service.update_issue_info(session_id, issue_data)
+    except VersionConflictError:
+        return _conflict()
     return jsonify({'success': success})
 
 @troubleshooting_bp.route('/add_step', methods=['POST'])
 def add_step():
-    session_id = session.get('session_id')
-    if not session_id:
-        return jsonify({'success': False, 'error': 'No session found'})
+    session_id = _writable_session_id()
     
     command = request.form.get('command', '')
     output = request.form.get('output', '')
@@ -47,10 +147,54 @@ def add_step():
     
     step = service.add_step(session_id, command, output, analysis)
     if step:
-        return jsonify({'success': True, 'step': step.to_dict()})
+        # Only the new step is rendered; the client splices it into the page
+        version = service.get_session_version(session_id)
+        if not version:
+            return _session_not_found()
+        return jsonify({
+            'success': True,
+            'step': {'id': step.id, 'timestamp': step.timestamp_iso},
+            'html': render_template('partials/step.html', step=step),
+            'step_count': version.step_count,
+            'version': version.version
+        })
     else:
         return jsonify({'success': False, 'error': 'Command or output required'})
 
+@troubleshooting_bp.route('/api/capture', methods=['POST'])
+def capture_step():
+    """Add a step to the session in ?session_id= (or the caller's) with the request body,
+    which may be sent with chunked transfer encoding, as its output"""
+    session_id = request.args.get('session_id') or session.get('session_id')
+    if not session_id or not service.session_exists(session_id):
+        return _session_not_found()
+    
+    max_bytes = service.capture_limit(current_app.config.get('CAPTURE_MAX_BYTES', 256 * 1024 * 1024))
+    if request.content_length is not None and request.content_length > max_bytes:
+        return jsonify({'success': False, 'error': f'Output exceeds the limit of {max_bytes} bytes'}), 413
+    
+    # The body is read one chunk at a time as the step is written, so a client
+    # sending faster than the server stores is held back by TCP flow control
+    chunks = iter(lambda: request.stream.read(CAPTURE_CHUNK_SIZE), b'')
+    try:
+        step = service.capture_step(session_id, request.args.get('command', ''), chunks,
+                                    request.args.get('analysis', ''), max_bytes)
+    except OutputTooLargeError as e:
+        return jsonify({'success': False, 'error': str(e)}), 413
+    
+    if not step:
+        return jsonify({'success': False, 'error': 'Command or output required'}), 400
+    # The session may have been deleted while the body was being read
+    version = service.get_session_version(session_id)
+    if not version:
+        return _session_not_found()
+    return jsonify({
+        'success': True,
+        'step': {'id': step.id, 'timestamp': step.timestamp_iso, 'output_length': step.output_length},
+        'step_count': version.step_count,
+        'version': version.version
+    })
+
 @troubleshooting_bp.route('/remove_step/<int:step_id>', methods=['POST'])
 def remove_step(step_id):
     session_id = session.get('session_id')
@@ -58,14 +202,47 @@ def remove_step(step_id):
         return jsonify({'success': False, 'error': 'No session found'})
     
     success = service.remove_step(session_id, step_id)
-    return jsonify({'success': success})
+    version = service.get_session_version(session_id)
+    if not version:
+        return jsonify({'success': success})
+    return jsonify({'success': success, 'step_count': version.step_count, 'version': version.version})
 
-@troubleshooting_bp.route('/update_resolution', methods=['POST'])
-def update_resolution():
+@troubleshooting_bp.route('/update_step/<int:step_id>', methods=['POST'])
+def update_step(step_id):
     session_id = session.get('session_id')
     if not session_id:
         return jsonify({'success': False, 'error': 'No session found'})
     
+    # Only the fields present in the form are changed
+    step_data = {name: request.form[name] for name in ('command', 'output', 'analysis') if name in request.form}
+    step = service.update_step(session_id, step_id, step_data)
+    if not step:
+        return jsonify({'success': False, 'error': 'Step not found'})
+    
+    version = service.get_session_version(session_id)
+    if not version:
+        return _session_not_found()
+    return jsonify({
+        'success': True,
+        'html': render_template('partials/step.html', step=step),
+        'version': version.version
+    })
+
+@troubleshooting_bp.route('/move_step/<int:step_id>', methods=['POST'])
+def move_step(step_id):
+    session_id = session.get('session_id')
+    if not session_id:
+        return jsonify({'success': False, 'error': 'No session found'})
+    
+    # Without a 'before' step the step is moved to the end
+    success = service.move_step(session_id, step_id, request.form.get('before', type=int))
+    version = service.get_session_version(session_id)
+    return jsonify({'success': success, 'version': version.version if version else None})
+
+@troubleshooting_bp.route('/update_resolution', methods=['POST'])
+def update_resolution():
+    session_id = _writable_session_id()
+    
     resolution_data = {
         'root_cause': request.form.get('root_cause', ''),
         'solution': request.form.get('solution', ''),
@@ -74,19 +251,143 @@ def update_resolution():
         'prevention': request.form.get('prevention', '')
     }
     
-    success = service.update_resolution(session_id, resolution_data)
+    try:
+        success = service.update_resolution(session_id, resolution_data)
+    except VersionConflictError:
+        return _conflict()
     return jsonify({'success': success})
 
+@troubleshooting_bp.route('/api/session', methods=['PATCH'])
+def patch_session():
+    """Autosave endpoint: apply only changed fields on top of base_version"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('base_version'), int):
+        return jsonify({'success': False, 'error': 'base_version is required'}), 400
+    
+    session_id = _writable_session_id()
+    try:
+        ts_session = service.patch_session(
+            session_id, data['base_version'], data.get('issue_info'), data.get('resolution')
+        )
+    except VersionConflictError:
+        current = service.get_session(session_id)
+        if not current:
+            return _session_not_found()
+        return jsonify({
+            'success': False,
+            'error': 'Session was modified by another request',
+            'version': current.version,
+            'issue_info': current.issue_info.to_dict(),
+            'resolution': current.resolution.to_dict()
+        }), 409
+    
+    if not ts_session:
+        return jsonify({'success': False, 'error': 'Session not found'})
+    return jsonify({'success': True, 'session_id': session_id, 'version': ts_session.version})
+
+@troubleshooting_bp.route('/api/search')
+def search_sessions():
+    """Ranked full-text search over commands, outputs, analyses, symptoms and root causes"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'success': False, 'error': 'q is required'}), 400
+    
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 20, type=int), 1), 100)
+    results, has_more = service.search(query, page, per_page)
+    return jsonify({'success': True, 'results': results, 'page': page, 'has_more': has_more})
+
+def _analytics_filters(default_days=None):
+    """(since, until, priority, server) from the query string; raises ValueError for invalid dates"""
+    since, until = request.args.get('since'), request.args.get('until')
+    if not since and default_days:
+        since = (date.today() - timedelta(days=default_days - 1)).isoformat()
+    return (
+        date.fromisoformat(since).isoformat() if since else None,
+        date.fromisoformat(until).isoformat() if until else None,
+        request.args.get('priority', '').capitalize() or None,
+        request.args.get('server') or None
+    )
+
+@troubleshooting_bp.route('/api/analytics')
+def analytics():
+    """Session counts, step counts and MTTR per day, priority or server (?group=)
+    for the sessions opened from ?since= to ?until="""
+    try:
+        result = service.analytics(request.args.get('group', 'day'), *_analytics_filters())
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    if result is None:
+        return jsonify({'success': False, 'error': 'Analytics are disabled'}), 404
+    return jsonify({'success': True, **result})
+
+@troubleshooting_bp.route('/analytics')
+def analytics_page():
+    try:
+        filters = _analytics_filters(default_days=30)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    if service.analytics_index is None:
+        return jsonify({'success': False, 'error': 'Analytics are disabled'}), 404
+    
+    summaries = {group: service.analytics(group, *filters) for group in ('day', 'priority', 'server')}
+    return render_template('analytics.html', summaries=summaries, since=filters[0], until=filters[1],
+                           format_duration=format_duration)
+
+@troubleshooting_bp.route('/api/similar')
+def similar_sessions():
+    """Suggest resolved past incidents similar to the current session and any unsaved text"""
+    session_id = session.get('session_id')
+    k = min(max(request.args.get('k', 5, type=int), 1), 20)
+    
+    suggestions = service.similar_sessions(session_id, request.args.get('text', ''), k)
+    return jsonify({'success': True, 'suggestions': suggestions})
+
+@troubleshooting_bp.route('/api/export')
+def export_sessions():
+    """Stream matching sessions as newline-delimited JSON"""
+    if not _is_admin():
+        return _admin_required()
+    
+    try:
+        session_filter = SessionFilter.parse(
+            request.args.get('since'), request.args.get('until'),
+            request.args.get('priority'), request.args.get('completed')
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    response = Response(service.export_sessions(session_filter), mimetype='application/x-ndjson')
+    response.headers['Content-Disposition'] = 'attachment; filename=resolviq-sessions.ndjson'
+    return response
+
+@troubleshooting_bp.route('/api/import', methods=['POST'])
+def import_sessions():
+    """Load sessions from a newline-delimited JSON request body, read line by line"""
+    replace = request.args.get('replace', '').lower() in ('1', 'true', 'yes')
+    # Replacing overwrites sessions that may still be in use by someone else
+    if replace and not _is_admin():
+        return _admin_required()
+    result = service.import_sessions(request.stream, replace)
+    return jsonify({'success': True, **result.to_dict()})
+
 @troubleshooting_bp.route('/generate_report')
 def generate_report():
     session_id = session.get('session_id')
     if not session_id:
         return jsonify({'success': False, 'error': 'No session found'})
     
-    report = service.generate_report(session_id)
-    if report:
-        ts_session = service.get_session(session_id)
-        return render_template('report.html', report=report, session_data=ts_session)
+    ts_session = service.get_session(session_id)
+    if ts_session:
+        etag = service.report_etag(ts_session, 'markdown')
+        not_modified = _not_modified(ts_session, etag)
+        if not_modified:
+            return not_modified
+        
+        # The report is rendered into the page chunk by chunk as it is generated
+        report = service.render(ts_session, 'markdown')
+        response = Response(stream_template('report.html', report=report, session_data=ts_session))
+        return _set_validators(response, ts_session, etag)
     else:
         return jsonify({'success': False, 'error': 'Failed to generate report'})
 
@@ -101,15 +402,70 @@ def reset_session():
 
 @troubleshooting_bp.route('/api/session_data')
 def get_session_data():
-    session_id = session.get('session_id')
+    """Data of a session (the caller's, or the one in ?session_id=), limited to ?fields=,
+    with outputs as ?output= asks and, with ?limit=, one page of steps"""
+    session_id = request.args.get('session_id') or session.get('session_id')
     if not session_id:
         return jsonify({'success': False, 'error': 'No session found'})
     
+    try:
+        view = SessionView.parse(request.args.get('fields'), request.args.get('output'), request.args.get('after'),
+                                 request.args.get('before'), request.args.get('limit'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    if request.if_none_match or request.if_modified_since:
+        # Pollers that already have this version are answered without loading the session
+        version = service.get_session_version(session_id)
+        if not version:
+            return jsonify({'success': False, 'error': 'Session not found'})
+        not_modified = _not_modified(version, service.session_data_etag(session_id, version.version, view))
+        if not_modified:
+            return not_modified
+    
     ts_session = service.get_session(session_id)
-    if ts_session:
-        return jsonify({'success': True, 'data': ts_session.to_dict()})
-    else:
+    if not ts_session:
         return jsonify({'success': False, 'error': 'Session not found'})
+    
+    data, cursor = service.session_data(ts_session, view)
+    result = {'success': True, 'data': data}
+    if view.limit is not None:
+        result['cursor'] = cursor
+    etag = service.session_data_etag(session_id, ts_session.version, view)
+    return _set_validators(jsonify(result), ts_session, etag)
+
+@troubleshooting_bp.route('/api/session/events')
+def session_events():
+    """Server-Sent Events with the changes to a session (the caller's, or the one in
+    ?session_id=) after the version in Last-Event-ID or ?after="""
+    session_id = request.args.get('session_id') or session.get('session_id')
+    version = service.get_session_version(session_id) if session_id else None
+    if not version:
+        return _session_not_found()
+    
+    try:
+        after = int(request.headers.get('Last-Event-ID') or request.args.get('after') or version.version)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid event ID'}), 400
+    
+    config = current_app.config
+    if not service.reserve_event_stream():
+        # Every stream holds a server thread; past the limit, pages poll /api/session_data
+        response = jsonify({'success': False, 'error': 'Too many open event streams'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(config.get('EVENTS_FALLBACK_POLL_SECONDS', 10))
+        return response
+    
+    events = service.stream_events(session_id, version.version, after,
+                                   keepalive=config.get('EVENTS_KEEPALIVE_SECONDS', 15),
+                                   duration=config.get('EVENTS_STREAM_SECONDS', 300))
+    response = Response(events, mimetype='text/event-stream')
+    # Runs whenever the server is done with the response, even if it was never iterated
+    response.call_on_close(service.release_event_stream)
+    response.headers['Cache-Control'] = 'no-cache'
+    # Keeps nginx from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 @troubleshooting_bp.route('/complete_rca', methods=['POST'])
 def complete_rca():
@@ -117,9 +473,12 @@ def complete_rca():
     if not session_id:
         return jsonify({'success': False, 'error': 'No session found'})
     
-    # Generate RCA report and create downloadable file
-    rca_report = service.generate_rca_report(session_id)
-    if rca_report:
+    # The RCA document itself is rendered (and cached) by the download
+    try:
+        completed = service.complete_session(session_id)
+    except VersionConflictError:
+        return _conflict()
+    if completed:
         return jsonify({
             'success': True, 
             'message': 'RCA completed successfully',
@@ -130,28 +489,58 @@ def complete_rca():
 
 @troubleshooting_bp.route('/download_rca/<session_id>')
 def download_rca(session_id):
-    from flask import send_file, make_response
-    import io
-    import json
-    from datetime import datetime
-    
     ts_session = service.get_session(session_id)
     if not ts_session:
         return jsonify({'success': False, 'error': 'Session not found'})
     
-    # Generate RCA document content
-    rca_content = service.generate_rca_document(session_id)
-    if not rca_content:
-        return jsonify({'success': False, 'error': 'Failed to generate RCA document'})
+    etag = service.report_etag(ts_session, 'rca')
+    not_modified = _not_modified(ts_session, etag)
+    if not_modified:
+        return not_modified
+    
+    # Stream the RCA document instead of building it in memory first
+    rca_content = service.render(ts_session, 'rca')
+    filename = f'RCA_{ts_session.issue_info.title.replace(" ", "_") or "Report"}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.txt'
     
-    # Create downloadable file
-    output = io.StringIO()
-    output.write(rca_content)
-    output.seek(0)
+    response = Response(stream_with_context(rca_content), mimetype='text/plain')
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return _set_validators(response, ts_session, etag)
+
+@troubleshooting_bp.route('/api/rca_bulk', methods=['GET', 'POST'])
+def download_rca_bulk():
+    """Stream a ZIP of RCA documents for the given sessions (repeated session_id
+    parameters or a JSON body with session_ids) or for all matching the export filters"""
+    max_sessions = current_app.config.get('RCA_BULK_MAX_SESSIONS', 1000)
+    data = request.get_json(silent=True) if request.method == 'POST' else None
+    if data is not None and not isinstance(data, dict):
+        return jsonify({'success': False, 'error': 'Request body must be a JSON object'}), 400
+    
+    # The export filters only apply when no selection was sent at all; an empty
+    # selection must never turn into every session
+    if 'session_id' in request.args or (data and 'session_ids' in data):
+        session_ids = request.args.getlist('session_id') or data['session_ids']
+        if not isinstance(session_ids, list) or not all(isinstance(i, str) and i for i in session_ids):
+            return jsonify({'success': False, 'error': 'session_ids must be a list of session IDs'}), 400
+        if not session_ids:
+            return jsonify({'success': False, 'error': 'No sessions selected'}), 400
+        session_ids = list(dict.fromkeys(session_ids))
+    else:
+        try:
+            session_filter = SessionFilter.parse(
+                request.args.get('since'), request.args.get('until'),
+                request.args.get('priority'), request.args.get('completed')
+            )
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        session_ids = service.select_session_ids(session_filter, limit=max_sessions)
     
-    # Create response
-    response = make_response(output.getvalue())
-    response.headers['Content-Type'] = 'text/plain'
-    response.headers['Content-Disposition'] = f'attachment; filename="RCA_{ts_session.issue_info.title.replace(" ", "_") or "Report"}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.txt"'
+    if not session_ids:
+        return jsonify({'success': False, 'error': 'No sessions found'}), 404
+    if len(session_ids) > max_sessions:
+        return jsonify({'success': False, 'error': f'At most {max_sessions} sessions per archive'}), 400
     
-    return response
\ No newline at end of file
+    archive = service.rca_archive(session_ids, workers=current_app.config.get('RCA_BULK_WORKERS') or 1)
+    response = Response(archive, mimetype='application/zip')
+    response.headers['Content-Disposition'] = \
+        f'attachment; filename="RCA_bulk_{datetime.now().strftime("%Y%m%d_%H%M%S")}.zip"'
+    return response
@@ -0,0 +1,173 @@
+import sqlite3
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.models.troubleshooting import TroubleshootingSession, Step, parse_timestamp
+from app.services.observers import SessionObserver
+from app.utils.sqlite import SQLiteDatabase
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analytics_sessions (
+    session_id TEXT PRIMARY KEY,
+    day TEXT NOT NULL,
+    priority TEXT NOT NULL,
+    server TEXT NOT NULL,
+    steps INTEGER NOT NULL,
+    completed INTEGER NOT NULL,
+    resolution_seconds INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS analytics_rollups (
+    day TEXT NOT NULL,
+    priority TEXT NOT NULL,
+    server TEXT NOT NULL,
+    sessions INTEGER NOT NULL,
+    completed INTEGER NOT NULL,
+    steps INTEGER NOT NULL,
+    resolution_seconds INTEGER NOT NULL,
+    PRIMARY KEY (day, priority, server)
+);
+"""
+
+# Dimensions rollups can be grouped by
+GROUPS = ('day', 'priority', 'server')
+
+# (day, priority, server, steps, completed, resolution seconds) of one session
+Facts = Tuple[str, str, str, int, int, int]
+
+
+def _facts(session: TroubleshootingSession) -> Facts:
+    # Sessions count towards the day they were opened, in local time
+    day = datetime.fromtimestamp(parse_timestamp(session.created_at)).date().isoformat()
+    resolution_seconds = session.resolution_seconds
+    return (day, session.issue_info.priority.value, session.issue_info.server.strip(), len(session.steps),
+            int(resolution_seconds is not None), round(resolution_seconds or 0))
+
+
+def _summary(sessions: int, completed: int, steps: int, resolution_seconds: int) -> Dict[str, Any]:
+    return {
+        'sessions': sessions,
+        'completed': completed,
+        'open': sessions - completed,
+        'steps': steps,
+        'avg_steps': steps / sessions if sessions else None,
+        'mttr_seconds': resolution_seconds / completed if completed else None,
+    }
+
+
+class AnalyticsIndex(SessionObserver):
+    """Session counts, step counts and time to resolution, rolled up by day,
+    priority and server.
+
+    Every session contributes one row to ``analytics_rollups``, and its
+    current contribution is kept in ``analytics_sessions``. A change replaces
+    the old contribution with the new one in a single transaction, so
+    rollups are always exact and an update costs a few indexed writes
+    however many sessions exist. Queries only read the rollup rows of the
+    requested days, never sessions or steps. Times to resolution are counted
+    for completed sessions; MTTR is their sum over the number of completed
+    sessions.
+    """
+
+    def __init__(self, path: str):
+        self.db = SQLiteDatabase(path)
+        self.db.connection().executescript(SCHEMA)
+
+    def is_empty(self) -> bool:
+        return self.db.connection().execute('SELECT 1 FROM analytics_sessions LIMIT 1').fetchone() is None
+
+    def _add(self, conn: sqlite3.Connection, facts: Facts, sign: int) -> None:
+        day, priority, server, steps, completed, resolution_seconds = facts
+        conn.execute(
+            'INSERT INTO analytics_rollups (day, priority, server, sessions, completed, steps, resolution_seconds) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (day, priority, server) DO UPDATE SET '
+            'sessions = sessions + excluded.sessions, completed = completed + excluded.completed, '
+            'steps = steps + excluded.steps, resolution_seconds = resolution_seconds + excluded.resolution_seconds',
+            (day, priority, server, sign, sign * completed, sign * steps, sign * resolution_seconds)
+        )
+        if sign < 0:
+            conn.execute(
+                'DELETE FROM analytics_rollups WHERE day = ? AND priority = ? AND server = ? AND sessions <= 0',
+                (day, priority, server)
+            )
+
+    def _update(self, conn: sqlite3.Connection, session_id: str, facts: Optional[Facts]) -> None:
+        """Replace a session's contribution to the rollups; None removes it"""
+        row = conn.execute(
+            'SELECT day, priority, server, steps, completed, resolution_seconds '
+            'FROM analytics_sessions WHERE session_id = ?', (session_id,)
+        ).fetchone()
+        old = tuple(row) if row is not None else None
+        if old == facts:
+            return
+        if old is not None:
+            self._add(conn, old, -1)
+        if facts is None:
+            conn.execute('DELETE FROM analytics_sessions WHERE session_id = ?', (session_id,))
+            return
+        conn.execute(
+            'INSERT OR REPLACE INTO analytics_sessions '
+            '(session_id, day, priority, server, steps, completed, resolution_seconds) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (session_id, *facts)
+        )
+        self._add(conn, facts, 1)
+
+    def update_session(self, session: TroubleshootingSession) -> None:
+        with self.db.transaction() as conn:
+            self._update(conn, session.session_id, _facts(session))
+
+    def remove_session(self, session_id: str) -> None:
+        with self.db.transaction() as conn:
+            self._update(conn, session_id, None)
+
+    def _clear(self) -> None:
+        with self.db.transaction() as conn:
+            conn.execute('DELETE FROM analytics_sessions')
+            conn.execute('DELETE FROM analytics_rollups')
+
+    # SessionObserver hooks keep the rollups in step with the session store
+
+    def session_changed(self, session: TroubleshootingSession) -> None:
+        self.update_session(session)
+
+    def session_completed(self, session: TroubleshootingSession) -> None:
+        self.update_session(session)
+
+    def session_deleted(self, session_id: str) -> None:
+        self.remove_session(session_id)
+
+    def sessions_loaded(self, sessions: List[TroubleshootingSession]) -> None:
+        with self.db.transaction() as conn:
+            for session in sessions:
+                self._update(conn, session.session_id, _facts(session))
+
+    def step_added(self, session: TroubleshootingSession, step: Step) -> None:
+        self.update_session(session)
+
+    def step_removed(self, session: TroubleshootingSession, step_id: int) -> None:
+        self.update_session(session)
+
+    def summary(self, group: str = 'day', since: Optional[str] = None, until: Optional[str] = None,
+                priority: Optional[str] = None, server: Optional[str] = None) -> Dict[str, Any]:
+        """Totals and per-``group`` rollups of the sessions opened from day
+        ``since`` (inclusive) to day ``until`` (exclusive)"""
+        if group not in GROUPS:
+            raise ValueError(f'Invalid group: {group}')
+        conditions, params = [], []
+        for clause, value in (('day >= ?', since), ('day < ?', until), ('priority = ?', priority),
+                              ('server = ?', server)):
+            if value is not None:
+                conditions.append(clause)
+                params.append(value)
+        where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+
+        rows = self.db.connection().execute(
+            f'SELECT {group}, SUM(sessions), SUM(completed), SUM(steps), SUM(resolution_seconds) '
+            f'FROM analytics_rollups {where} GROUP BY {group} ORDER BY {group}', params
+        ).fetchall()
+        groups = [{'key': row[0], **_summary(*row[1:])} for row in rows]
+        totals = _summary(*(sum(row[i] for row in rows) for i in range(1, 5)))
+        return {'group': group, 'totals': totals, 'groups': groups}
+
+    def close(self) -> None:
+        self.db.close()
@@ -0,0 +1,176 @@
+import codecs
+import hashlib
+import mmap
+import os
+import tempfile
+import time
+import zlib
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator, Optional, Set
+
+
+@dataclass(frozen=True)
+class BlobRef:
+    """Reference to a stored blob; ``size`` is the length of the text in characters"""
+    digest: str
+    size: int
+    store: 'BlobStore' = field(repr=False, compare=False)
+
+    def read(self) -> str:
+        return self.store.get(self.digest)
+
+    def iter_chunks(self) -> Iterator[str]:
+        return self.store.iter_chunks(self.digest)
+
+    def preview(self, limit: int) -> str:
+        return self.store.preview(self.digest, limit)
+
+
+class BlobStore:
+    """Content-addressed, zlib-compressed text storage on disk.
+
+    Blobs are keyed by the SHA-256 of their UTF-8 encoding, so identical
+    outputs pasted into different steps or sessions are stored once. Reads
+    decompress from a memory-mapped file in slices and never need the whole
+    compressed blob in memory.
+
+    Storing a blob that already exists refreshes its modification time, so
+    ``purge`` never removes a blob that is about to be referenced again.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, root: str, level: int = 6):
+        self.root = root
+        self.level = level
+        if not os.path.exists(root):
+            os.makedirs(root)
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest[2:])
+
+    def ref(self, digest: str, size: int) -> BlobRef:
+        return BlobRef(digest=digest, size=size, store=self)
+
+    def put(self, text: str) -> BlobRef:
+        data = text.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+
+        if os.path.exists(path):
+            os.utime(path)
+        else:
+            directory = os.path.dirname(path)
+            os.makedirs(directory, exist_ok=True)
+            # Write to a temporary file first so readers never see a partial blob
+            fd, tmp_path = tempfile.mkstemp(dir=directory)
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(zlib.compress(data, self.level))
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+        return self.ref(digest, len(text))
+
+    def put_stream(self, chunks: Iterable[str]) -> BlobRef:
+        """Store text arriving in chunks, hashing and compressing each chunk as it comes.
+
+        The digest is only known at the end, so the blob is written to a
+        temporary file and renamed once complete; only one chunk is held in
+        memory at a time.
+        """
+        hasher = hashlib.sha256()
+        compressor = zlib.compressobj(self.level)
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.root)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for text in chunks:
+                    data = text.encode('utf-8')
+                    hasher.update(data)
+                    size += len(text)
+                    f.write(compressor.compress(data))
+                f.write(compressor.flush())
+
+            digest = hasher.hexdigest()
+            path = self._path(digest)
+            if os.path.exists(path):
+                os.remove(tmp_path)
+                os.utime(path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        return self.ref(digest, size)
+
+    def purge(self, referenced: Set[str], min_age: float = 3600.0) -> int:
+        """Remove the blobs not in ``referenced`` that were last stored more than
+        ``min_age`` seconds ago; returns the number removed.
+
+        The age check leaves alone blobs stored for a step that is still being
+        written, which ``referenced`` cannot contain yet.
+        """
+        cutoff = time.time() - min_age
+        removed = 0
+        for directory in os.scandir(self.root):
+            if not directory.is_dir() or len(directory.name) != 2:
+                continue
+            for entry in os.scandir(directory.path):
+                digest = directory.name + entry.name
+                if digest in referenced or len(digest) != 64:
+                    continue
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+    def exists(self, digest: str) -> bool:
+        return os.path.exists(self._path(digest))
+
+    def get(self, digest: str) -> str:
+        return ''.join(self.iter_chunks(digest))
+
+    def iter_chunks(self, digest: str, chunk_size: Optional[int] = None) -> Iterator[str]:
+        """Yield the decompressed text in chunks of at most ``chunk_size`` bytes
+        (CHUNK_SIZE by default), however well the blob compresses"""
+        chunk_size = chunk_size or self.CHUNK_SIZE
+        decompressor = zlib.decompressobj()
+        decoder = codecs.getincrementaldecoder('utf-8')()
+
+        with open(self._path(digest), 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as compressed:
+            for offset in range(0, len(compressed), self.CHUNK_SIZE):
+                data = compressed[offset:offset + self.CHUNK_SIZE]
+                # A slice of a repetitive log can inflate to megabytes, so its
+                # output is taken in bounded pieces
+                while data:
+                    text = decoder.decode(decompressor.decompress(data, chunk_size))
+                    data = decompressor.unconsumed_tail
+                    if text:
+                        yield text
+
+        text = decoder.decode(decompressor.flush(), final=True)
+        if text:
+            yield text
+
+    def preview(self, digest: str, limit: int) -> str:
+        """Return the first ``limit`` characters, decompressing only what is needed"""
+        parts = []
+        remaining = limit
+        # A character takes at most 4 bytes in UTF-8
+        for chunk in self.iter_chunks(digest, min(self.CHUNK_SIZE, max(limit, 1) * 4)):
+            parts.append(chunk[:remaining])
+            remaining -= len(parts[-1])
+            if remaining <= 0:
+                break
+        return ''.join(parts)
@@ -0,0 +1,269 @@
+import atexit
+import json
+import logging
+import os
+import threading
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.utils.sqlite import SQLiteDatabase
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metric_samples (
+    metric TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    sample TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (metric, labels, sample)
+);
+"""
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; from a cached page up to a large report download
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Characters of rendered output
+SIZE_BUCKETS = (1000, 4000, 16000, 64000, 256000, 1000000, 4000000, 16000000)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric:
+    kind = ''
+
+    def __init__(self, registry: 'MetricsRegistry', name: str, help_text: str, labels: Sequence[str] = ()):
+        self.registry = registry
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+
+    def _label_text(self, values: Sequence[str], extra: str = '') -> str:
+        pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(self.labels, values)]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *label_values: str, amount: float = 1.0) -> None:
+        self.registry._add(self.name, label_values, 'value', amount)
+
+    def render(self, samples: Dict[Tuple, Dict[str, float]]) -> List[str]:
+        return [f'{self.name}{self._label_text(labels)} {_format_value(values.get("value", 0))}'
+                for labels, values in sorted(samples.items())]
+
+
+class Histogram(Metric):
+    """Observations counted per bucket; buckets are stored individually and
+    made cumulative only when rendered"""
+
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help_text, labels=(), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(registry, name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *label_values: str) -> None:
+        # bisect_left puts a value equal to a bound into that bucket (le is inclusive);
+        # index len(buckets) is +Inf
+        self.registry._observe(self.name, label_values, str(bisect_left(self.buckets, value)), value)
+
+    def render(self, samples: Dict[Tuple, Dict[str, float]]) -> List[str]:
+        lines = []
+        for labels, values in sorted(samples.items()):
+            cumulative = 0.0
+            for index, bound in enumerate(self.buckets + (float('inf'),)):
+                cumulative += values.get(str(index), 0)
+                le = '+Inf' if index == len(self.buckets) else _format_value(bound)
+                label_text = self._label_text(labels, f'le="{le}"')
+                lines.append(f'{self.name}_bucket{label_text} {_format_value(cumulative)}')
+            lines.append(f'{self.name}_sum{self._label_text(labels)} {_format_value(values.get("sum", 0))}')
+            lines.append(f'{self.name}_count{self._label_text(labels)} {_format_value(cumulative)}')
+        return lines
+
+
+class Gauge(Metric):
+    """Value read from a callback whenever metrics are rendered"""
+
+    kind = 'gauge'
+
+    def __init__(self, registry, name, help_text, callback: Callable[[], float]):
+        super().__init__(registry, name, help_text)
+        self.callback = callback
+
+    def render(self, samples) -> List[str]:
+        return [f'{self.name} {_format_value(self.callback())}']
+
+
+class MetricsRegistry:
+    """Counters, histograms and gauges rendered in the Prometheus text format.
+
+    Recording only adds to a pending dict under a lock. With a database path,
+    a background thread adds pending values to shared totals in SQLite every
+    ``flush_interval`` seconds, and rendering flushes first, so every worker
+    process reports the sum over all workers, including ones that have
+    exited. Without one, totals are kept per process.
+    """
+
+    def __init__(self, path: Optional[str] = None, flush_interval: float = 5.0):
+        self.metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple[str, Tuple, str], float] = {}
+        self._totals: Dict[Tuple[str, Tuple, str], float] = {}
+        self.flush_interval = flush_interval
+        self.db = None
+        self._stop_flusher: Optional[threading.Event] = None
+        # Results of per_scrape callbacks during the render in progress on this thread
+        self._scrape = threading.local()
+        if path:
+            self.open(path)
+
+    def open(self, path: str) -> None:
+        self.close()
+        self.db = SQLiteDatabase(path)
+        self.db.connection().executescript(SCHEMA)
+        self._start_flusher()
+
+    def close(self) -> None:
+        if self._stop_flusher is not None:
+            self._stop_flusher.set()
+            self._stop_flusher = None
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    def _start_flusher(self) -> None:
+        stop = self._stop_flusher = threading.Event()
+
+        def run():
+            while not stop.wait(self.flush_interval):
+                self.flush()
+
+        threading.Thread(target=run, name='metrics-flush', daemon=True).start()
+
+    def after_fork_in_child(self) -> None:
+        # Values recorded before the fork belong to the parent, and neither its
+        # lock nor its flush thread carry over
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._totals = {}
+        if self.db is not None:
+            self._start_flusher()
+
+    def init_app(self, app) -> None:
+        """Use the metrics database and flush interval configured for the application"""
+        self.flush_interval = app.config.get('METRICS_FLUSH_INTERVAL', 5.0)
+        path = app.config.get('METRICS_DB_PATH')
+        if path:
+            self.open(path)
+        else:
+            self.close()
+
+    def _register(self, metric: Metric) -> Metric:
+        # Re-registering under the same name replaces the definition (e.g. a new gauge callback)
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(self, name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(self, name, help_text, labels, buckets))
+
+    def gauge(self, name: str, help_text: str, callback: Callable[[], float]) -> Gauge:
+        return self._register(Gauge(self, name, help_text, callback))
+
+    def per_scrape(self, callback: Callable[[], Any]) -> Callable[[], Any]:
+        """Wrap ``callback`` so that the gauges reading it during one render share a single call"""
+        def cached():
+            results = getattr(self._scrape, 'results', None)
+            if results is None:
+                return callback()
+            if callback not in results:
+                results[callback] = callback()
+            return results[callback]
+        return cached
+
+    def _add(self, name: str, labels: Tuple, sample: str, amount: float) -> None:
+        key = (name, labels, sample)
+        with self._lock:
+            self._pending[key] = self._pending.get(key, 0.0) + amount
+
+    def _observe(self, name: str, labels: Tuple, bucket: str, value: float) -> None:
+        bucket_key, sum_key = (name, labels, bucket), (name, labels, 'sum')
+        with self._lock:
+            pending = self._pending
+            pending[bucket_key] = pending.get(bucket_key, 0.0) + 1
+            pending[sum_key] = pending.get(sum_key, 0.0) + value
+
+    def flush(self) -> None:
+        """Move pending values into the totals"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+
+        if self.db is None:
+            with self._lock:
+                for key, amount in pending.items():
+                    self._totals[key] = self._totals.get(key, 0.0) + amount
+            return
+
+        try:
+            with self.db.transaction() as conn:
+                conn.executemany(
+                    'INSERT INTO metric_samples (metric, labels, sample, value) VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT (metric, labels, sample) DO UPDATE SET value = value + excluded.value',
+                    [(name, json.dumps(labels), sample, amount) for (name, labels, sample), amount in pending.items()]
+                )
+        except Exception:
+            logger.exception('Could not flush metrics; keeping them for the next flush')
+            with self._lock:
+                for key, amount in pending.items():
+                    self._pending[key] = self._pending.get(key, 0.0) + amount
+
+    def _read_totals(self) -> Dict[Tuple[str, Tuple, str], float]:
+        if self.db is None:
+            with self._lock:
+                return dict(self._totals)
+        rows = self.db.connection().execute('SELECT metric, labels, sample, value FROM metric_samples')
+        return {(metric, tuple(json.loads(labels)), sample): value for metric, labels, sample, value in rows}
+
+    def render(self) -> str:
+        self.flush()
+        samples: Dict[str, Dict[Tuple, Dict[str, float]]] = {}
+        for (name, labels, sample), value in self._read_totals().items():
+            samples.setdefault(name, {}).setdefault(labels, {})[sample] = value
+
+        lines = []
+        self._scrape.results = {}
+        try:
+            for name, metric in self.metrics.items():
+                try:
+                    rendered = metric.render(samples.get(name, {}))
+                except Exception:
+                    logger.exception('Could not collect metric %s', name)
+                    continue
+                lines.append(f'# HELP {name} {metric.help_text}')
+                lines.append(f'# TYPE {name} {metric.kind}')
+                lines.extend(rendered)
+        finally:
+            self._scrape.results = None
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+# Workers exiting (max_requests, restarts) leave their last values behind
+atexit.register(metrics.flush)
+os.register_at_fork(after_in_child=metrics.after_fork_in_child)
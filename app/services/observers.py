@@ -0,0 +1,55 @@
+from typing import Iterable, List
+
+from app.models.troubleshooting import TroubleshootingSession, Step
+
+
+class SessionObserver:
+    """Receives notifications after TroubleshootingService has stored a change.
+
+    Indexes and other derived views subclass this and override the events
+    they care about; every method is a no-op by default.
+    """
+
+    def rebuild(self, sessions: Iterable[TroubleshootingSession], batch_size: int = 500) -> int:
+        """Derive everything from scratch out of the given sessions, passed to
+        ``sessions_loaded`` in batches; returns the number of sessions"""
+        self._clear()
+        count = 0
+        batch = []
+        for session in sessions:
+            batch.append(session)
+            if len(batch) >= batch_size:
+                self.sessions_loaded(batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            self.sessions_loaded(batch)
+            count += len(batch)
+        return count
+
+    def _clear(self) -> None:
+        """Drop what was derived before a rebuild; entries are replaced per session by default"""
+
+    def session_changed(self, session: TroubleshootingSession) -> None:
+        """Issue information or resolution changed"""
+
+    def session_completed(self, session: TroubleshootingSession) -> None:
+        pass
+
+    def session_deleted(self, session_id: str) -> None:
+        pass
+
+    def sessions_loaded(self, sessions: List[TroubleshootingSession]) -> None:
+        """Complete sessions, steps included, were written at once (e.g. imported)"""
+
+    def step_added(self, session: TroubleshootingSession, step: Step) -> None:
+        pass
+
+    def step_updated(self, session: TroubleshootingSession, step: Step) -> None:
+        pass
+
+    def step_moved(self, session: TroubleshootingSession, step_id: int) -> None:
+        pass
+
+    def step_removed(self, session: TroubleshootingSession, step_id: int) -> None:
+        pass
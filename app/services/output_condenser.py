@@ -0,0 +1,183 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict, deque
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+
+from app.models.troubleshooting import Step
+
+DEFAULT_ERROR_PATTERN = (
+    r'\b(error|errors|fail|failed|failure|fatal|panic|exception|traceback|critical|denied|refused|'
+    r'timeout|timed out|unreachable|oom|out of memory|killed|segfault|abort|aborted|aborting)\b'
+)
+
+# Numbers, hex values and the like; lines that only differ in these count as similar
+_VARIABLE_PARTS = re.compile(r'0x[0-9a-fA-F]+|\d+')
+
+
+class _Run:
+    """Consecutive identical or similar lines, kept as the first one and a count"""
+
+    __slots__ = ('text', 'dropped', 'signature', 'count', 'exact')
+
+    def __init__(self, text: str, dropped: int, signature: str):
+        self.text = text
+        self.dropped = dropped
+        self.signature = signature
+        self.count = 1
+        self.exact = True
+
+    def lines(self) -> List[str]:
+        first = self.text
+        if self.dropped:
+            first += f' [... {self.dropped} more characters]'
+        if self.count == 1:
+            return [first]
+        kind = 'identical' if self.exact else 'similar'
+        return [first, f'[... {self.count - 1} more {kind} lines]']
+
+
+def _split_lines(chunks: Iterable[str], max_line_chars: int) -> Iterator[Tuple[str, int]]:
+    """(line, characters cut off it) for text arriving in chunks.
+
+    Only the first ``max_line_chars`` characters of a line are ever held, so
+    an output without line breaks costs no more than one with them.
+    """
+    partial, dropped = '', 0
+    for chunk in chunks:
+        start = 0
+        while True:
+            end = chunk.find('\n', start)
+            if end < 0:
+                break
+            room = max_line_chars - len(partial)
+            line = partial + chunk[start:min(end, start + room)] if room > 0 else partial
+            yield line.rstrip('\r'), dropped + max(0, end - start - max(room, 0))
+            partial, dropped = '', 0
+            start = end + 1
+        rest = len(chunk) - start
+        room = max_line_chars - len(partial)
+        if room > 0:
+            partial += chunk[start:start + room]
+        dropped += max(0, rest - max(room, 0))
+    if partial or dropped:
+        yield partial.rstrip('\r'), dropped
+
+
+class OutputCondenser:
+    """Shortens long command outputs for reports in a single pass.
+
+    Runs of identical lines, or lines that only differ in numbers (PIDs,
+    timestamps, addresses), are collapsed into their first line and a count.
+    The first ``head_lines`` and last ``tail_lines`` of what remains are kept,
+    and in between only lines matching ``error_pattern``, up to
+    ``max_error_lines``; everything else is replaced by a count of omitted
+    lines. Lines longer than ``max_line_chars`` are cut. Memory and output
+    size are bounded by these limits however large the input is.
+
+    ``error_pattern`` is matched against lowercased lines, which is several
+    times faster than a case-insensitive pattern, so it should be lowercase.
+
+    Outputs shorter than ``min_chars`` are left alone. Condensed outputs are
+    cached by content, so each one is only condensed once.
+    """
+
+    def __init__(self, min_chars: int = 16000, head_lines: int = 50, tail_lines: int = 50,
+                 max_error_lines: int = 200, max_line_chars: int = 1000,
+                 error_pattern: str = DEFAULT_ERROR_PATTERN, cache_max_bytes: int = 32 * 1024 * 1024):
+        self.min_chars = min_chars
+        self.head_lines = head_lines
+        self.tail_lines = tail_lines
+        self.max_error_lines = max_error_lines
+        self.max_line_chars = max_line_chars
+        self.error_pattern = re.compile(error_pattern)
+        self.cache_max_bytes = cache_max_bytes
+        self.cache_bytes = 0
+        self._cache: 'OrderedDict[str, str]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def condense_step(self, step: Step) -> Optional[str]:
+        """The condensed output of a step, or None if it is short enough to show in full"""
+        if not self.min_chars or step.output_length < self.min_chars:
+            return None
+        # Inline outputs get the key the blob store would give them, so an output
+        # is condensed once however it is stored
+        key = step.output_ref.digest if step.output_ref else \
+            hashlib.sha256(step.output.encode('utf-8', 'surrogatepass')).hexdigest()
+
+        with self._lock:
+            condensed = self._cache.get(key)
+            if condensed is not None:
+                self._cache.move_to_end(key)
+                return condensed
+
+        condensed = self.condense(step.iter_output())
+        self._store(key, condensed)
+        return condensed
+
+    def _store(self, key: str, condensed: str) -> None:
+        if len(condensed) > self.cache_max_bytes:
+            return
+        with self._lock:
+            if key in self._cache:
+                return
+            self._cache[key] = condensed
+            self.cache_bytes += len(condensed)
+            while self.cache_bytes > self.cache_max_bytes:
+                _, evicted = self._cache.popitem(last=False)
+                self.cache_bytes -= len(evicted)
+
+    def condense(self, chunks: Iterable[str]) -> str:
+        head: List[_Run] = []
+        tail: 'deque[_Run]' = deque()
+        # Error runs from between head and tail, and the number of lines omitted before each
+        middle: List[Union[_Run, int]] = []
+        omitted = 0
+        errors_kept = 0
+        run: Optional[_Run] = None
+
+        def finish(done: _Run) -> None:
+            nonlocal omitted, errors_kept
+            if len(head) < self.head_lines:
+                head.append(done)
+                return
+            tail.append(done)
+            if len(tail) <= self.tail_lines:
+                return
+            evicted = tail.popleft()
+            if errors_kept < self.max_error_lines and self.error_pattern.search(evicted.text.lower()):
+                if omitted:
+                    middle.append(omitted)
+                    omitted = 0
+                middle.append(evicted)
+                errors_kept += 1
+            else:
+                omitted += evicted.count
+
+        for text, dropped in _split_lines(chunks, self.max_line_chars):
+            if run is not None:
+                if text == run.text and dropped == run.dropped:
+                    run.count += 1
+                    continue
+                signature = _VARIABLE_PARTS.sub('#', text)
+                if signature == run.signature:
+                    run.count += 1
+                    run.exact = False
+                    continue
+                finish(run)
+            else:
+                signature = _VARIABLE_PARTS.sub('#', text)
+            run = _Run(text, dropped, signature)
+        if run is not None:
+            finish(run)
+        if omitted:
+            middle.append(omitted)
+
+        lines: List[str] = []
+        for part in (head, middle, tail):
+            for item in part:
+                if isinstance(item, int):
+                    lines.append(f'[... {item} lines omitted]')
+                else:
+                    lines.extend(item.lines())
+        return '\n'.join(lines)
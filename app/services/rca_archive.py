@@ -0,0 +1,137 @@
+import io
+import logging
+import multiprocessing
+import re
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, Optional, Tuple, Union
+
+from app.models.troubleshooting import TroubleshootingSession
+
+logger = logging.getLogger(__name__)
+
+# Starting a worker costs a few hundred milliseconds, a document a few; with
+# fewer sessions than this per worker, fewer workers are used
+SESSIONS_PER_WORKER = 10
+
+# Rendering tasks queued per worker, so results start flowing early and
+# memory stays bounded however many sessions are requested
+TASKS_PER_WORKER = 4
+
+# (session ID, issue title, document); the title is None if the session was not found
+RenderedDocument = Tuple[str, Optional[str], Optional[str]]
+
+_worker_service = None
+
+
+def _init_worker(db_path: Optional[str], blob_dir: Optional[str]) -> None:
+    """Give a pool process its own connection to the shared session store"""
+    global _worker_service
+    # Imported here: the service module imports this one
+    from app.services.blob_store import BlobStore
+    from app.services.session_store import SQLiteSessionStore
+    from app.services.troubleshooting_service import TroubleshootingService
+
+    blobs = BlobStore(blob_dir) if blob_dir else None
+    store = SQLiteSessionStore(db_path, blobs=blobs) if db_path else None
+    _worker_service = TroubleshootingService(store=store, blobs=blobs)
+
+
+def _render(item: Union[str, TroubleshootingSession]) -> RenderedDocument:
+    """Render one RCA document in a pool process, from a session ID or a whole session"""
+    session = item if isinstance(item, TroubleshootingSession) else _worker_service.get_session(item)
+    if session is None:
+        return item, None, None
+    return session.session_id, session.issue_info.title, _worker_service._generate_rca_document(session)
+
+
+def render_parallel(items: Iterable[Union[str, TroubleshootingSession]], workers: int,
+                    db_path: Optional[str] = None, blob_dir: Optional[str] = None) -> Iterator[RenderedDocument]:
+    """Render RCA documents in a process pool and yield them as they finish.
+
+    Items are session IDs, loaded by the workers from the SQLite store at
+    ``db_path``, or sessions, which are sent to the workers whole. Workers
+    are spawned rather than forked, so they never inherit locks or threads of
+    a multi-threaded server process. Closing the generator early cancels the
+    documents not yet started.
+    """
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                               initializer=_init_worker, initargs=(db_path, blob_dir))
+    items = iter(items)
+    pending: Dict[Future, str] = {}
+
+    def submit_next() -> None:
+        item = next(items, None)
+        if item is not None:
+            session_id = item.session_id if isinstance(item, TroubleshootingSession) else item
+            pending[pool.submit(_render, item)] = session_id
+
+    try:
+        for _ in range(workers * TASKS_PER_WORKER):
+            submit_next()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                session_id = pending.pop(future)
+                submit_next()
+                try:
+                    yield future.result()
+                except Exception:
+                    logger.exception('Could not render the RCA document of session %s', session_id)
+                    yield session_id, None, None
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+class _ZipStream(io.RawIOBase):
+    """Write-only, unseekable target for ZipFile that hands out what was written so far"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _entry_name(session_id: str, title: str, used: set) -> str:
+    slug = re.sub(r'[^A-Za-z0-9._-]+', '_', title).strip('_')[:60] or 'Report'
+    name = f'RCA_{slug}_{session_id[:8]}.txt'
+    if name in used:
+        name = f'RCA_{slug}_{session_id}.txt'
+    used.add(name)
+    return name
+
+
+def stream_rca_zip(documents: Iterable[RenderedDocument]) -> Iterator[bytes]:
+    """Yield a ZIP archive with one RCA document per session, entry by entry.
+
+    Nothing but the entry being written is held in memory: ZipFile writes to
+    an unseekable stream, so sizes go into data descriptors after each entry.
+    Sessions that were not found or failed to render are listed in
+    ``MISSING.txt`` at the end.
+    """
+    stream = _ZipStream()
+    used, missing = set(), []
+    with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for session_id, title, document in documents:
+            if document is None:
+                missing.append(session_id)
+                continue
+            entry = zipfile.ZipInfo(_entry_name(session_id, title, used), datetime.now().timetuple()[:6])
+            entry.compress_type = zipfile.ZIP_DEFLATED
+            archive.writestr(entry, document)
+            yield stream.drain()
+        if missing:
+            archive.writestr('MISSING.txt', 'Sessions not found or not rendered:\n' + '\n'.join(missing) + '\n')
+    yield stream.drain()
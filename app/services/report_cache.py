@@ -0,0 +1,69 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Sequence, Tuple
+
+CacheKey = Tuple[str, int, str]
+
+
+class ReportCache:
+    """LRU cache of rendered documents keyed by (session_id, version, format).
+
+    Only the newest version of each (session, format) pair is kept, since a
+    version bump makes every older rendering unreachable.
+    """
+
+    def __init__(self, max_entries: int = 256, max_bytes: Optional[int] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries: 'OrderedDict[CacheKey, Tuple[Sequence[str], int]]' = OrderedDict()
+        self._latest: Dict[Tuple[str, str], CacheKey] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: CacheKey) -> Optional[Sequence[str]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def accepts(self, size: int) -> bool:
+        """Whether a document of ``size`` characters could be cached at all"""
+        return not self.max_bytes or size <= self.max_bytes
+
+    def put(self, key: CacheKey, chunks: Sequence[str]) -> None:
+        size = sum(len(chunk) for chunk in chunks)
+        if not self.accepts(size):
+            return
+
+        session_id, version, fmt = key
+        with self._lock:
+            previous = self._latest.get((session_id, fmt))
+            if previous is not None:
+                if previous[1] > version:
+                    # A newer rendering was stored while this one was streaming
+                    return
+                self._remove(previous)
+
+            self._entries[key] = (tuple(chunks), size)
+            self._latest[(session_id, fmt)] = key
+            self.total_bytes += size
+
+            while self._entries and (
+                len(self._entries) > self.max_entries or
+                (self.max_bytes and self.total_bytes > self.max_bytes)
+            ):
+                self._remove(next(iter(self._entries)))
+
+    def discard_session(self, session_id: str) -> None:
+        with self._lock:
+            for key in [key for key in self._latest.values() if key[0] == session_id]:
+                self._remove(key)
+
+    def _remove(self, key: CacheKey) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry[1]
+        if self._latest.get((key[0], key[2])) == key:
+            del self._latest[(key[0], key[2])]
@@ -0,0 +1,173 @@
+import sqlite3
+from typing import Any, Dict, List, Tuple
+
+from app.models.troubleshooting import TroubleshootingSession, Step
+from app.services.observers import SessionObserver
+from app.utils.sqlite import SQLiteDatabase
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS search_docs (
+    id INTEGER PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    step_id INTEGER NOT NULL,
+    UNIQUE (session_id, step_id)
+);
+
+CREATE TABLE IF NOT EXISTS search_sessions (
+    session_id TEXT PRIMARY KEY,
+    title TEXT NOT NULL DEFAULT '',
+    server TEXT NOT NULL DEFAULT '',
+    created_at TEXT
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5(
+    title, symptoms, root_cause, command, output, analysis,
+    tokenize = 'unicode61'
+);
+"""
+
+# Step ID used for the document holding the session-level fields
+SESSION_DOC = 0
+
+# bm25 column weights, in the column order of search_fts
+WEIGHTS = (4.0, 3.0, 3.0, 2.0, 1.0, 1.5)
+
+
+class SearchIndex(SessionObserver):
+    """SQLite FTS5 index over past investigations.
+
+    Every step is one document (command, output, analysis) and every session
+    has one more for its title, symptoms and root cause. ``search_docs`` maps
+    (session, step) to the FTS rowid, so single documents can be replaced or
+    removed without scanning the index.
+    """
+
+    def __init__(self, path: str, max_output_chars: int = 1000000):
+        self.db = SQLiteDatabase(path)
+        self.max_output_chars = max_output_chars
+        self.db.connection().executescript(SCHEMA)
+
+    def is_empty(self) -> bool:
+        return self.db.connection().execute('SELECT 1 FROM search_docs LIMIT 1').fetchone() is None
+
+    def _doc_id(self, conn: sqlite3.Connection, session_id: str, step_id: int) -> int:
+        # The no-op update makes RETURNING yield the ID of an existing row too
+        return conn.execute(
+            'INSERT INTO search_docs (session_id, step_id) VALUES (?, ?) '
+            'ON CONFLICT (session_id, step_id) DO UPDATE SET step_id = excluded.step_id RETURNING id',
+            (session_id, step_id)
+        ).fetchone()['id']
+
+    def _replace(self, conn: sqlite3.Connection, session_id: str, step_id: int, **columns) -> None:
+        doc_id = self._doc_id(conn, session_id, step_id)
+        conn.execute('DELETE FROM search_fts WHERE rowid = ?', (doc_id,))
+        conn.execute(
+            'INSERT INTO search_fts (rowid, title, symptoms, root_cause, command, output, analysis) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (doc_id, columns.get('title', ''), columns.get('symptoms', ''), columns.get('root_cause', ''),
+             columns.get('command', ''), columns.get('output', ''), columns.get('analysis', ''))
+        )
+
+    def index_session(self, session: TroubleshootingSession) -> None:
+        """Index the session-level fields (title, symptoms, root cause)"""
+        with self.db.transaction() as conn:
+            self._index_session(conn, session)
+
+    def _index_session(self, conn: sqlite3.Connection, session: TroubleshootingSession) -> None:
+        issue = session.issue_info
+        conn.execute(
+            'INSERT OR REPLACE INTO search_sessions (session_id, title, server, created_at) VALUES (?, ?, ?, ?)',
+            (session.session_id, issue.title, issue.server, session.created_at)
+        )
+        self._replace(conn, session.session_id, SESSION_DOC, title=issue.title, symptoms=issue.symptoms,
+                      root_cause=session.resolution.root_cause)
+
+    def index_step(self, session_id: str, step: Step) -> None:
+        with self.db.transaction() as conn:
+            self._index_step(conn, session_id, step)
+
+    def _index_step(self, conn: sqlite3.Connection, session_id: str, step: Step) -> None:
+        output = step.output_preview(self.max_output_chars) if step.output_length else ''
+        self._replace(conn, session_id, step.id, command=step.command, output=output, analysis=step.analysis)
+
+    def remove_step(self, session_id: str, step_id: int) -> None:
+        with self.db.transaction() as conn:
+            row = conn.execute(
+                'SELECT id FROM search_docs WHERE session_id = ? AND step_id = ?', (session_id, step_id)
+            ).fetchone()
+            if row is not None:
+                conn.execute('DELETE FROM search_fts WHERE rowid = ?', (row['id'],))
+                conn.execute('DELETE FROM search_docs WHERE id = ?', (row['id'],))
+
+    def remove_session(self, session_id: str) -> None:
+        with self.db.transaction() as conn:
+            self._remove_session(conn, session_id)
+
+    def _remove_session(self, conn: sqlite3.Connection, session_id: str) -> None:
+        doc_ids = [(row['id'],) for row in conn.execute(
+            'SELECT id FROM search_docs WHERE session_id = ?', (session_id,)
+        )]
+        conn.executemany('DELETE FROM search_fts WHERE rowid = ?', doc_ids)
+        conn.execute('DELETE FROM search_docs WHERE session_id = ?', (session_id,))
+        conn.execute('DELETE FROM search_sessions WHERE session_id = ?', (session_id,))
+
+    # SessionObserver hooks keep the index in step with the session store
+
+    def session_changed(self, session: TroubleshootingSession) -> None:
+        self.index_session(session)
+
+    def session_deleted(self, session_id: str) -> None:
+        self.remove_session(session_id)
+
+    def sessions_loaded(self, sessions: List[TroubleshootingSession]) -> None:
+        with self.db.transaction() as conn:
+            for session in sessions:
+                self._remove_session(conn, session.session_id)
+                self._index_session(conn, session)
+                for step in session.steps:
+                    self._index_step(conn, session.session_id, step)
+
+    def step_added(self, session: TroubleshootingSession, step: Step) -> None:
+        self.index_step(session.session_id, step)
+
+    def step_updated(self, session: TroubleshootingSession, step: Step) -> None:
+        self.index_step(session.session_id, step)
+
+    def step_removed(self, session: TroubleshootingSession, step_id: int) -> None:
+        self.remove_step(session.session_id, step_id)
+
+    @staticmethod
+    def _match_expression(query: str) -> str:
+        # Quote every term so user input is never parsed as FTS5 syntax
+        return ' '.join('"' + term.replace('"', '""') + '"' for term in query.split())
+
+    def search(self, query: str, page: int = 1, per_page: int = 20) -> Tuple[List[Dict[str, Any]], bool]:
+        """Return one page of ranked matches and whether more pages exist"""
+        expression = self._match_expression(query)
+        if not expression:
+            return [], False
+
+        rows = self.db.connection().execute(
+            'SELECT d.session_id, d.step_id, s.title, s.server, s.created_at, '
+            "snippet(search_fts, -1, '**', '**', '...', 16) AS snippet, "
+            f'bm25(search_fts, {", ".join(map(str, WEIGHTS))}) AS score '
+            'FROM search_fts '
+            'JOIN search_docs d ON d.id = search_fts.rowid '
+            'LEFT JOIN search_sessions s ON s.session_id = d.session_id '
+            'WHERE search_fts MATCH ? ORDER BY score LIMIT ? OFFSET ?',
+            (expression, per_page + 1, (page - 1) * per_page)
+        ).fetchall()
+
+        results = [{
+            'session_id': row['session_id'],
+            'step_id': row['step_id'] or None,
+            'title': row['title'] or '',
+            'server': row['server'] or '',
+            'created_at': row['created_at'],
+            'snippet': row['snippet'],
+            'score': -row['score']
+        } for row in rows[:per_page]]
+        return results, len(rows) > per_page
+
+    def close(self) -> None:
+        self.db.close()
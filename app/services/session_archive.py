@@ -0,0 +1,128 @@
+import json
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Iterable, Iterator, List, Union
+
+from app.models.troubleshooting import Priority, TroubleshootingSession
+
+# Only the first problems of a bad import are reported back
+MAX_REPORTED_ERRORS = 100
+
+PRIORITIES = frozenset(priority.value for priority in Priority)
+
+
+@dataclass
+class ImportResult:
+    imported: int = 0
+    skipped: int = 0
+    failed: int = 0
+    errors: List[str] = field(default_factory=list)
+
+    def add_error(self, line_number: int, error: Exception) -> None:
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f'line {line_number}: {error}')
+
+    def to_dict(self) -> dict:
+        return {
+            'imported': self.imported,
+            'skipped': self.skipped,
+            'failed': self.failed,
+            'errors': self.errors
+        }
+
+
+def export_ndjson(sessions: Iterable[TroubleshootingSession]) -> Iterator[str]:
+    """Yield one JSON document per session, each on its own line.
+
+    Outputs kept in the blob store are inlined, so an export is
+    self-contained and can be imported into any node.
+    """
+    for session in sessions:
+        yield json.dumps(session.to_dict(), ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+def _check_int(data: dict, name: str, minimum: int, section: str = '') -> None:
+    # bool is an int subclass, but never a valid count or ID
+    value = data.get(name, minimum)
+    if isinstance(value, bool) or not isinstance(value, int) or value < minimum:
+        raise ValueError(f'{section}{name} must be an integer >= {minimum}')
+
+
+def _check_strings(data: dict, names: Iterable[str], section: str = '') -> None:
+    for name in names:
+        if not isinstance(data.get(name, ''), str):
+            raise ValueError(f'{section}{name} must be a string')
+
+
+def _check_timestamp(value: object, name: str, numeric: bool = False) -> None:
+    if numeric and isinstance(value, (int, float)) and not isinstance(value, bool):
+        return
+    try:
+        datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{name} must be an ISO 8601 timestamp') from None
+
+
+def _check_section(data: dict, name: str) -> dict:
+    section = data.get(name, {})
+    if not isinstance(section, dict):
+        raise ValueError(f'{name} must be an object')
+    return section
+
+
+def validate_session(data: object) -> None:
+    """Raise ValueError for the first field of an exported session that is
+    missing or has the wrong type, so bad lines are reported instead of stored"""
+    if not isinstance(data, dict) or not isinstance(data.get('session_id'), str) or not data['session_id']:
+        raise ValueError('expected a session object with a session_id')
+    _check_int(data, 'version', 0)
+    for name in ('created_at', 'updated_at'):
+        if name in data:
+            _check_timestamp(data[name], name)
+    if data.get('completed_at') is not None:
+        _check_timestamp(data['completed_at'], 'completed_at')
+
+    issue_info = _check_section(data, 'issue_info')
+    _check_strings(issue_info, ('title', 'server', 'symptoms'), 'issue_info.')
+    priority = issue_info.get('priority')
+    if priority is not None and (not isinstance(priority, str) or priority.capitalize() not in PRIORITIES):
+        raise ValueError(f'issue_info.priority must be one of {", ".join(Priority)}')
+    _check_strings(_check_section(data, 'resolution'),
+                   ('root_cause', 'solution', 'fix_commands', 'verification', 'prevention'), 'resolution.')
+
+    steps = data.get('steps', [])
+    if not isinstance(steps, list):
+        raise ValueError('steps must be a list')
+    step_ids = set()
+    for index, step in enumerate(steps):
+        if not isinstance(step, dict) or 'id' not in step:
+            raise ValueError(f'steps[{index}] must be an object with an id')
+        _check_int(step, 'id', 1, f'steps[{index}].')
+        if step['id'] in step_ids:
+            raise ValueError(f'steps[{index}]: duplicate step ID {step["id"]}')
+        step_ids.add(step['id'])
+        _check_strings(step, ('command', 'output', 'analysis'), f'steps[{index}].')
+        if 'timestamp' in step:
+            _check_timestamp(step['timestamp'], f'steps[{index}].timestamp', numeric=True)
+    # New steps must not reuse the ID of an imported one
+    _check_int(data, 'next_step_id', max(step_ids, default=0) + 1)
+
+
+def parse_ndjson(lines: Iterable[Union[str, bytes]], result: ImportResult) -> Iterator[TroubleshootingSession]:
+    """Yield the sessions of an NDJSON stream one at a time.
+
+    Blank lines are ignored; lines that are not valid sessions (see
+    ``validate_session``) are recorded in ``result`` and skipped.
+    """
+    for line_number, line in enumerate(lines, 1):
+        try:
+            if isinstance(line, bytes):
+                line = line.decode('utf-8')
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            validate_session(data)
+            yield TroubleshootingSession.from_dict(data)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            result.add_error(line_number, e)
@@ -0,0 +1,324 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from app.models.troubleshooting import TroubleshootingSession, Step
+from app.services.observers import SessionObserver
+from app.utils.sqlite import SQLiteDatabase
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS session_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    event TEXT NOT NULL,
+    data TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS session_events_session ON session_events (session_id, seq);
+CREATE INDEX IF NOT EXISTS session_events_created ON session_events (created_at);
+"""
+
+# Characters of a step's output sent along with its events
+OUTPUT_PREVIEW_CHARS = 500
+
+# Expired events are pruned every this many writes
+PRUNE_EVERY = 200
+
+# Milliseconds browsers wait before reconnecting a dropped stream
+RETRY_MS = 3000
+
+
+class SessionEvent(NamedTuple):
+    """One change to a session; ``seq`` is the session version it produced"""
+    id: int
+    session_id: str
+    seq: int
+    event: str
+    data: str
+
+    def format(self) -> str:
+        """The event in the Server-Sent Events wire format"""
+        return f'id: {self.seq}\nevent: {self.event}\ndata: {self.data}\n\n'
+
+
+class Subscription:
+    """Events of one session waiting to be sent to one client"""
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self._events: Deque[SessionEvent] = deque()
+        self._ready = threading.Condition()
+
+    def push(self, event: SessionEvent) -> None:
+        with self._ready:
+            self._events.append(event)
+            self._ready.notify()
+
+    def wait(self, timeout: float) -> List[SessionEvent]:
+        """Events published since the last call, waiting up to ``timeout`` seconds for one"""
+        with self._ready:
+            if not self._events:
+                self._ready.wait(timeout)
+            events = list(self._events)
+            self._events.clear()
+            return events
+
+
+def _step_data(session: TroubleshootingSession, step: Step) -> Dict[str, Any]:
+    return {
+        'id': step.id,
+        'after': session.steps.previous_id(step.id),
+        'timestamp': step.timestamp_iso,
+        'command': step.command,
+        'analysis': step.analysis,
+        'output_length': step.output_length,
+        'output_preview': step.output_preview(OUTPUT_PREVIEW_CHARS),
+    }
+
+
+class SessionEventLog(SessionObserver):
+    """Small delta events for every stored change, fanned out to live subscribers.
+
+    Every change becomes an event numbered with the session version it
+    produced, so a client that knows which version it has seen can resume
+    from there. With a database path, events of all worker processes go to
+    one SQLite table, and one thread per process reads new rows and hands
+    them to that process's subscribers, so an event costs one query per
+    process however many clients watch. Without one, events stay in the
+    process. Events older than ``retention`` seconds are pruned.
+
+    Each stream occupies a server thread for as long as it is open, so at
+    most ``max_streams`` are open per process; ``reserve_stream`` refuses
+    the rest, whose clients poll instead.
+    """
+
+    def __init__(self, path: Optional[str] = None, retention: float = 3600.0, poll_interval: float = 0.5,
+                 max_streams: Optional[int] = None):
+        self.retention = retention
+        self.poll_interval = poll_interval
+        self.max_streams = max_streams
+        self._streams = 0
+        self.db = SQLiteDatabase(path) if path else None
+        if self.db is not None:
+            self.db.connection().executescript(SCHEMA)
+        # (created_at, event) when there is no database
+        self._memory: Deque[Tuple[float, SessionEvent]] = deque()
+        self._last_id = 0
+        self._written = 0
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._wake = threading.Event()
+        # Process whose reader thread is running; threads do not survive a fork
+        self._reader_pid: Optional[int] = None
+
+    def close(self) -> None:
+        with self._lock:
+            self._reader_pid = None
+        self._wake.set()
+        if self.db is not None:
+            self.db.close()
+
+    def publish(self, events: Iterable[Tuple[str, int, str, Dict[str, Any]]]) -> None:
+        """Record (session ID, sequence number, event name, data) tuples"""
+        rows = [(session_id, seq, event, json.dumps(data, separators=(',', ':')), time.time())
+                for session_id, seq, event, data in events]
+        if not rows:
+            return
+
+        if self.db is not None:
+            with self.db.transaction() as conn:
+                conn.executemany(
+                    'INSERT INTO session_events (session_id, seq, event, data, created_at) VALUES (?, ?, ?, ?, ?)',
+                    rows
+                )
+                self._written += len(rows)
+                if self._written >= PRUNE_EVERY:
+                    self._written = 0
+                    conn.execute('DELETE FROM session_events WHERE created_at < ?', (time.time() - self.retention,))
+            # Subscribers in this process need not wait for the next poll
+            self._wake.set()
+            return
+
+        with self._lock:
+            published = []
+            for session_id, seq, event, data, created_at in rows:
+                self._last_id += 1
+                published.append(SessionEvent(self._last_id, session_id, seq, event, data))
+                self._memory.append((created_at, published[-1]))
+            cutoff = time.time() - self.retention
+            while self._memory and self._memory[0][0] < cutoff:
+                self._memory.popleft()
+            self._dispatch(published)
+
+    def _dispatch(self, events: List[SessionEvent]) -> None:
+        # Called with the lock held
+        for event in events:
+            for subscription in self._subscribers.get(event.session_id, ()):
+                subscription.push(event)
+
+    def read(self, session_id: str, after: int) -> List[SessionEvent]:
+        """Retained events of a session with a sequence number above ``after``"""
+        if self.db is None:
+            with self._lock:
+                return [event for _, event in self._memory if event.session_id == session_id and event.seq > after]
+        rows = self.db.connection().execute(
+            'SELECT id, session_id, seq, event, data FROM session_events WHERE session_id = ? AND seq > ? '
+            'ORDER BY seq, id', (session_id, after)
+        )
+        return [SessionEvent(*row) for row in rows]
+
+    def latest_seq(self, session_id: str) -> int:
+        if self.db is None:
+            with self._lock:
+                return max((event.seq for _, event in self._memory if event.session_id == session_id), default=0)
+        row = self.db.connection().execute(
+            'SELECT MAX(seq) FROM session_events WHERE session_id = ?', (session_id,)
+        ).fetchone()
+        return row[0] or 0
+
+    # Subscriptions
+
+    def reserve_stream(self) -> bool:
+        """Claim one of this process's stream slots; False if all are taken"""
+        with self._lock:
+            if self.max_streams is not None and self._streams >= self.max_streams:
+                return False
+            self._streams += 1
+            return True
+
+    def release_stream(self) -> None:
+        with self._lock:
+            self._streams -= 1
+
+    def subscribe(self, session_id: str) -> Subscription:
+        subscription = Subscription(session_id)
+        with self._lock:
+            self._subscribers.setdefault(session_id, set()).add(subscription)
+            start_reader = self.db is not None and self._reader_pid != os.getpid()
+            if start_reader:
+                self._reader_pid = os.getpid()
+                # Subscribers read what came before from the table themselves
+                self._last_id = self.db.connection().execute(
+                    'SELECT COALESCE(MAX(id), 0) FROM session_events'
+                ).fetchone()[0]
+        if start_reader:
+            threading.Thread(target=self._read_new_events, name='session-events', daemon=True).start()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.session_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.session_id]
+
+    def _read_new_events(self) -> None:
+        """Hand rows written by any process to this process's subscribers until none are left"""
+        pid = os.getpid()
+        while True:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            with self._lock:
+                if self._reader_pid != pid:
+                    return
+                if not self._subscribers:
+                    self._reader_pid = None
+                    return
+                last_id = self._last_id
+            try:
+                rows = self.db.connection().execute(
+                    'SELECT id, session_id, seq, event, data FROM session_events WHERE id > ? ORDER BY id', (last_id,)
+                ).fetchall()
+            except Exception:
+                logger.exception('Could not read session events')
+                continue
+            if not rows:
+                continue
+            events = [SessionEvent(*row) for row in rows]
+            with self._lock:
+                self._last_id = events[-1].id
+                self._dispatch(events)
+
+    def stream(self, session_id: str, after: int, version: int, keepalive: float = 15.0,
+               duration: float = 300.0) -> Iterator[str]:
+        """Yield a session's events after sequence number ``after`` as Server-Sent Events.
+
+        ``version`` is the current session version. If events between
+        ``after`` and it are no longer retained, a ``reset`` event tells the
+        client to reload the session instead. The stream ends after
+        ``duration`` seconds, and browsers then reconnect with the last ID
+        they received; comments are sent every ``keepalive`` seconds so
+        proxies keep the connection open and closed clients are noticed.
+        """
+        subscription = self.subscribe(session_id)
+        try:
+            yield f'retry: {RETRY_MS}\n\n'
+            # Subscribed first, so nothing falls between the backlog and live events
+            backlog = self.read(session_id, after)
+            last = after
+            if version > after and (not backlog or backlog[0].seq > after + 1):
+                yield SessionEvent(0, session_id, version, 'reset', json.dumps({'version': version}, separators=(',', ':'))).format()
+                last = version
+
+            deadline = time.monotonic() + duration
+            events = backlog
+            while True:
+                for event in events:
+                    if event.event == 'session_deleted':
+                        # Numbered after the last retained event, which may be behind the client
+                        yield event.format()
+                        return
+                    if event.seq > last:
+                        yield event.format()
+                        last = event.seq
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                events = subscription.wait(min(keepalive, remaining))
+                if not events and time.monotonic() < deadline:
+                    yield ': keepalive\n\n'
+        finally:
+            self.unsubscribe(subscription)
+
+    # SessionObserver
+
+    def session_changed(self, session: TroubleshootingSession) -> None:
+        self.publish([(session.session_id, session.version, 'session_changed', {
+            'issue_info': session.issue_info.to_dict(),
+            'resolution': session.resolution.to_dict(),
+        })])
+
+    def session_completed(self, session: TroubleshootingSession) -> None:
+        completed_at = session.completed_at.isoformat() if session.completed_at else None
+        self.publish([(session.session_id, session.version, 'session_completed', {'completed_at': completed_at})])
+
+    def session_deleted(self, session_id: str) -> None:
+        self.publish([(session_id, self.latest_seq(session_id) + 1, 'session_deleted', {})])
+
+    def sessions_loaded(self, sessions: List[TroubleshootingSession]) -> None:
+        # Replaced wholesale by an import; viewers reload it
+        self.publish((session.session_id, session.version, 'session_loaded', {}) for session in sessions)
+
+    def step_added(self, session: TroubleshootingSession, step: Step) -> None:
+        self.publish([(session.session_id, session.version, 'step_added',
+                       {'step': _step_data(session, step), 'step_count': len(session.steps)})])
+
+    def step_updated(self, session: TroubleshootingSession, step: Step) -> None:
+        self.publish([(session.session_id, session.version, 'step_updated', {'step': _step_data(session, step)})])
+
+    def step_moved(self, session: TroubleshootingSession, step_id: int) -> None:
+        self.publish([(session.session_id, session.version, 'step_moved',
+                       {'step_id': step_id, 'after': session.steps.previous_id(step_id)})])
+
+    def step_removed(self, session: TroubleshootingSession, step_id: int) -> None:
+        self.publish([(session.session_id, session.version, 'step_removed',
+                       {'step_id': step_id, 'step_count': len(session.steps)})])
@@ -0,0 +1,1092 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from app.models.troubleshooting import (
+    TroubleshootingSession, IssueInfo, Priority, Step, StepList, Resolution, parse_timestamp
+)
+from app.services.blob_store import BlobStore
+from app.utils.sqlite import SQLiteDatabase
+
+
+class VersionConflictError(Exception):
+    """Raised when a session changed after the version a write was based on"""
+
+    def __init__(self, session_id: str, version: int):
+        super().__init__(f'Session {session_id} is at version {version}')
+        self.session_id = session_id
+        self.version = version
+
+
+class SessionVersion(NamedTuple):
+    """Version, last modification time and number of steps of a stored session"""
+    version: int
+    updated_at: str
+    step_count: int
+
+
+@dataclass
+class SessionFilter:
+    """Criteria for iterating over stored sessions; unset fields match everything.
+
+    ``created_since`` is inclusive and ``created_until`` exclusive, both ISO
+    timestamps comparable with ``TroubleshootingSession.created_at``.
+    """
+    created_since: Optional[str] = None
+    created_until: Optional[str] = None
+    priority: Optional[str] = None
+    completed: Optional[bool] = None
+
+    @classmethod
+    def parse(cls, created_since: Optional[str] = None, created_until: Optional[str] = None,
+              priority: Optional[str] = None, completed: Optional[str] = None) -> 'SessionFilter':
+        """Build a filter from user-supplied strings; raises ValueError for invalid values"""
+        flags = {'true': True, 'yes': True, '1': True, 'false': False, 'no': False, '0': False}
+        if completed and completed.lower() not in flags:
+            raise ValueError(f'Invalid completed flag: {completed}')
+        return cls(
+            created_since=datetime.fromisoformat(created_since).isoformat() if created_since else None,
+            created_until=datetime.fromisoformat(created_until).isoformat() if created_until else None,
+            priority=priority or None,
+            completed=flags[completed.lower()] if completed else None
+        )
+
+    def matches(self, session: TroubleshootingSession) -> bool:
+        if self.created_since and session.created_at < self.created_since:
+            return False
+        if self.created_until and session.created_at >= self.created_until:
+            return False
+        if self.priority and session.issue_info.priority.lower() != self.priority.lower():
+            return False
+        if self.completed is not None and (session.completed_at is not None) != self.completed:
+            return False
+        return True
+
+
+class SessionStore:
+    """Storage backend interface used by TroubleshootingService.
+
+    The service applies every change to a session object obtained from
+    ``get_for_update`` first and then hands the change to the store so it can
+    be persisted. Objects returned by ``get`` are only read.
+    """
+
+    def get(self, session_id: str) -> Optional[TroubleshootingSession]:
+        raise NotImplementedError
+
+    def get_for_update(self, session_id: str) -> Optional[TroubleshootingSession]:
+        """Return a session object the caller may modify and then store.
+
+        Sessions already handed out by ``get`` must not change underneath
+        their readers, so stores that share objects return a copy.
+        """
+        return self.get(session_id)
+
+    def exists(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    def get_version(self, session_id: str) -> Optional[SessionVersion]:
+        """Return the version of a session without loading its steps, or None if there is no such session"""
+        session = self.get(session_id)
+        return SessionVersion(session.version, session.updated_at, len(session.steps)) if session is not None else None
+
+    def load_step(self, session_id: str, step_id: int) -> Optional[Step]:
+        """One step of a session, or None; stores that can should read it without the others"""
+        session = self.get(session_id)
+        return session.get_step(step_id) if session is not None else None
+
+    def get_summaries(self, session_ids: List[str]) -> Dict[str, TroubleshootingSession]:
+        """The given sessions that exist, by ID, for listings that only show their
+        issue information and resolution; stores that can leave their steps out"""
+        sessions = {}
+        for session_id in session_ids:
+            session = self.get(session_id)
+            if session is not None:
+                sessions[session_id] = session
+        return sessions
+
+    def save(self, session: TroubleshootingSession, expected_version: Optional[int] = None) -> None:
+        """Persist session metadata, issue information and resolution.
+
+        With ``expected_version`` the write fails with VersionConflictError if
+        the stored session is no longer at that version.
+        """
+        raise NotImplementedError
+
+    def allocate_step_id(self, session: TroubleshootingSession) -> int:
+        """Reserve the next step ID of a session; IDs are never reused"""
+        raise NotImplementedError
+
+    def add_step(self, session: TroubleshootingSession, step: Step) -> None:
+        raise NotImplementedError
+
+    def update_step(self, session: TroubleshootingSession, step: Step) -> None:
+        raise NotImplementedError
+
+    def move_step(self, session: TroubleshootingSession, step_id: int, before: Optional[int]) -> bool:
+        raise NotImplementedError
+
+    def remove_step(self, session: TroubleshootingSession, step_id: int) -> bool:
+        raise NotImplementedError
+
+    def delete(self, session_id: str) -> bool:
+        raise NotImplementedError
+
+    def purge(self, changed_before: str) -> List[str]:
+        """Delete the sessions last changed before an ISO timestamp; returns their IDs.
+
+        Stores that expire sessions on their own need not implement this.
+        """
+        return []
+
+    def referenced_blobs(self) -> Optional[Set[str]]:
+        """Digests of all blobs that stored steps refer to, or None if the
+        store cannot tell, in which case no blob may be considered unused"""
+        return None
+
+    def iter_sessions(self, session_filter: Optional[SessionFilter] = None) -> Iterator[TroubleshootingSession]:
+        raise NotImplementedError
+
+    def iter_session_ids(self, session_filter: Optional[SessionFilter] = None) -> Iterator[str]:
+        """IDs of the sessions ``iter_sessions`` would yield, in the same order"""
+        for session in self.iter_sessions(session_filter):
+            yield session.session_id
+
+    def import_sessions(self, sessions: Iterable[TroubleshootingSession],
+                        replace: bool = False) -> Iterator[Tuple[TroubleshootingSession, bool]]:
+        """Store complete sessions, steps included, as they are.
+
+        Yields every session with whether it was written; existing sessions
+        are only overwritten with ``replace``, and then get a version above
+        the stored one.
+        """
+        raise NotImplementedError
+
+    def check(self) -> None:
+        """Raise if the backend cannot currently serve requests"""
+
+    def stats(self) -> Dict[str, int]:
+        """Number of sessions and steps held, and the characters of all step outputs"""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class MemorySessionStore(SessionStore):
+    """Process-local session cache; sessions are lost on restart.
+
+    Sessions expire after ``ttl`` seconds without access. When more than
+    ``max_sessions`` are held or their estimated size exceeds ``max_bytes``,
+    the least recently used sessions are evicted. If ``spill_dir`` is set,
+    evicted sessions that have not expired are written there as JSON and
+    loaded back on their next access.
+
+    Stored sessions are never modified in place: writers change a copy from
+    ``get_for_update``, which replaces the shared object once it is stored.
+    Readers can therefore keep using a session while it is being changed.
+    """
+
+    # Rough per-object overhead so that empty sessions still count
+    SESSION_OVERHEAD = 2048
+    STEP_OVERHEAD = 256
+
+    def __init__(self, ttl: Optional[float] = None, max_sessions: Optional[int] = None,
+                 max_bytes: Optional[int] = None, spill_dir: Optional[str] = None,
+                 blobs: Optional[BlobStore] = None):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.blobs = blobs
+        self.sessions: 'OrderedDict[str, TroubleshootingSession]' = OrderedDict()
+        self._last_access: Dict[str, float] = {}
+        self._sizes: Dict[str, int] = {}
+        self.total_bytes = 0
+        self._lock = threading.RLock()
+
+        if spill_dir and not os.path.exists(spill_dir):
+            os.makedirs(spill_dir)
+
+    def get(self, session_id: str) -> Optional[TroubleshootingSession]:
+        with self._lock:
+            self._expire()
+            session = self.sessions.get(session_id)
+            if session is None:
+                session = self._load_spilled(session_id)
+                if session is None:
+                    return None
+                self._insert(session)
+            else:
+                self._touch(session_id)
+            return session
+
+    def get_for_update(self, session_id: str) -> Optional[TroubleshootingSession]:
+        session = self.get(session_id)
+        return session.copy() if session is not None else None
+
+    def stats(self) -> Dict[str, int]:
+        # Only sessions held in memory are counted, not spilled ones. Stored
+        # sessions are never modified, so they can be summed outside the lock
+        with self._lock:
+            sessions = list(self.sessions.values())
+        steps = output_chars = 0
+        for session in sessions:
+            steps += len(session.steps)
+            output_chars += sum(step.output_length for step in session.steps)
+        return {'sessions': len(sessions), 'steps': steps, 'output_chars': output_chars}
+
+    def exists(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    def save(self, session: TroubleshootingSession, expected_version: Optional[int] = None) -> None:
+        with self._lock:
+            current = self.sessions.get(session.session_id)
+            if expected_version is not None and current is not None and current.version != expected_version:
+                raise VersionConflictError(session.session_id, current.version)
+            size = None
+            if current is not None:
+                size = self._sizes[session.session_id] - self._metadata_size(current) + self._metadata_size(session)
+            self._publish(session, size)
+
+    def allocate_step_id(self, session: TroubleshootingSession) -> int:
+        return session.steps.allocate_id()
+
+    def add_step(self, session: TroubleshootingSession, step: Step) -> None:
+        # The step has already been appended to the session copy
+        with self._lock:
+            self._publish(session, self._resized(session.session_id, self._step_size(step)))
+
+    def update_step(self, session: TroubleshootingSession, step: Step) -> None:
+        with self._lock:
+            current = self.sessions.get(session.session_id)
+            previous = current.steps.get(step.id) if current is not None else None
+            size = None
+            if previous is not None:
+                size = self._resized(session.session_id, self._step_size(step) - self._step_size(previous))
+            self._publish(session, size)
+
+    def move_step(self, session: TroubleshootingSession, step_id: int, before: Optional[int]) -> bool:
+        session_id = session.session_id
+        with self._lock:
+            self._publish(session, self._sizes.get(session_id))
+            return True
+
+    def remove_step(self, session: TroubleshootingSession, step_id: int) -> bool:
+        with self._lock:
+            current = self.sessions.get(session.session_id)
+            removed = current.steps.get(step_id) if current is not None else None
+            size = self._resized(session.session_id, -self._step_size(removed)) if removed is not None else None
+            self._publish(session, size)
+            return True
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            removed = self._drop(session_id) is not None
+            spill_path = self._spill_path(session_id)
+            if spill_path and os.path.exists(spill_path):
+                os.remove(spill_path)
+                removed = True
+            return removed
+
+    def iter_sessions(self, session_filter: Optional[SessionFilter] = None) -> Iterator[TroubleshootingSession]:
+        with self._lock:
+            self._expire()
+            sessions = list(self.sessions.values())
+        for session in sessions:
+            if session_filter is None or session_filter.matches(session):
+                yield session
+
+        if self.spill_dir:
+            for filename in sorted(os.listdir(self.spill_dir)):
+                if filename.endswith('.json'):
+                    session = self._read_spill_file(os.path.join(self.spill_dir, filename))
+                    if session is not None and (session_filter is None or session_filter.matches(session)):
+                        yield session
+
+    def import_sessions(self, sessions: Iterable[TroubleshootingSession],
+                        replace: bool = False) -> Iterator[Tuple[TroubleshootingSession, bool]]:
+        for session in sessions:
+            with self._lock:
+                existing = self.get(session.session_id)
+                written = existing is None or replace
+                if existing is not None and replace:
+                    session.version = max(session.version, existing.version + 1)
+                if written:
+                    self._insert(session)
+            yield session, written
+
+    def _insert(self, session: TroubleshootingSession) -> None:
+        session_id = session.session_id
+        self.sessions[session_id] = session
+        self._resize(session_id, self._session_size(session))
+        self._touch(session_id)
+        self._enforce_limits()
+
+    def _resized(self, session_id: str, delta: int) -> Optional[int]:
+        """Size of a held session after a change of ``delta``; None if it is not held"""
+        return self._sizes[session_id] + delta if session_id in self.sessions else None
+
+    def _publish(self, session: TroubleshootingSession, size: Optional[int] = None) -> None:
+        """Make a modified copy the current version of its session; ``size`` is its new
+        size if the caller knows it, otherwise it is computed over all steps"""
+        session_id = session.session_id
+        if session_id not in self.sessions:
+            # Evicted while it was being changed; the spilled version is stale now
+            spill_path = self._spill_path(session_id)
+            if spill_path and os.path.exists(spill_path):
+                os.remove(spill_path)
+            size = None
+        self.sessions[session_id] = session
+        self._resize(session_id, size if size is not None else self._session_size(session))
+        self._touch(session_id)
+        self._enforce_limits()
+
+    def _touch(self, session_id: str) -> None:
+        self.sessions.move_to_end(session_id)
+        self._last_access[session_id] = time.monotonic()
+
+    def _resize(self, session_id: str, size: int) -> None:
+        self.total_bytes += size - self._sizes.get(session_id, 0)
+        self._sizes[session_id] = size
+
+    def _drop(self, session_id: str) -> Optional[TroubleshootingSession]:
+        session = self.sessions.pop(session_id, None)
+        if session is not None:
+            self.total_bytes -= self._sizes.pop(session_id)
+            del self._last_access[session_id]
+        return session
+
+    def _expire(self) -> None:
+        if not self.ttl:
+            return
+        # The LRU order is also the last-access order, so stop at the first live session
+        cutoff = time.monotonic() - self.ttl
+        while self.sessions:
+            session_id = next(iter(self.sessions))
+            if self._last_access[session_id] > cutoff:
+                break
+            self._drop(session_id)
+
+    def _enforce_limits(self) -> None:
+        # Never evict the most recently used session, it is the one being worked on
+        while len(self.sessions) > 1 and (
+            (self.max_sessions and len(self.sessions) > self.max_sessions) or
+            (self.max_bytes and self.total_bytes > self.max_bytes)
+        ):
+            session_id = next(iter(self.sessions))
+            session = self._drop(session_id)
+            if self.spill_dir:
+                self._spill(session)
+
+    @classmethod
+    def _step_size(cls, step: Step) -> int:
+        return cls.STEP_OVERHEAD + len(step.command) + len(step.output) + len(step.analysis)
+
+    @classmethod
+    def _metadata_size(cls, session: TroubleshootingSession) -> int:
+        issue = session.issue_info
+        resolution = session.resolution
+        size = cls.SESSION_OVERHEAD + len(issue.title) + len(issue.server) + len(issue.symptoms)
+        return size + (len(resolution.root_cause) + len(resolution.solution) + len(resolution.fix_commands) +
+                       len(resolution.verification) + len(resolution.prevention))
+
+    @classmethod
+    def _session_size(cls, session: TroubleshootingSession) -> int:
+        return cls._metadata_size(session) + sum(cls._step_size(step) for step in session.steps)
+
+    def _spill_path(self, session_id: str) -> Optional[str]:
+        if not self.spill_dir:
+            return None
+        # Session IDs come from cookies, keep them from escaping the spill directory
+        return os.path.join(self.spill_dir, os.path.basename(session_id) + '.json')
+
+    def _spill(self, session: TroubleshootingSession) -> None:
+        # Blob-backed outputs are spilled as references, not re-inflated text
+        data = {
+            'session_id': session.session_id,
+            'issue_info': session.issue_info.to_dict(),
+            'steps': [_step_record(step) for step in session.steps],
+            'resolution': session.resolution.to_dict(),
+            'created_at': session.created_at,
+            'updated_at': session.updated_at,
+            'version': session.version,
+            'next_step_id': session.steps.next_id,
+            'completed_at': session.completed_at.isoformat() if session.completed_at else None
+        }
+        path = self._spill_path(session.session_id)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def _load_spilled(self, session_id: str) -> Optional[TroubleshootingSession]:
+        path = self._spill_path(session_id)
+        if not path or not os.path.exists(path):
+            return None
+        session = self._read_spill_file(path)
+        if session is not None:
+            os.remove(path)
+        return session
+
+    def _read_spill_file(self, path: str) -> Optional[TroubleshootingSession]:
+        if self.ttl and time.time() - os.path.getmtime(path) > self.ttl:
+            os.remove(path)
+            return None
+        with open(path) as f:
+            data = json.load(f)
+        session = TroubleshootingSession.from_dict(data)
+        for step, step_data in zip(session.steps, data.get('steps', [])):
+            step.output_ref = _blob_ref(self.blobs, step_data.get('output_ref'), step_data.get('output_size', 0))
+        return session
+
+
+def _step_record(step: Step) -> dict:
+    return {
+        'id': step.id,
+        'command': step.command,
+        'output': step.output,
+        'analysis': step.analysis,
+        'timestamp': step.timestamp,
+        'output_ref': step.output_ref.digest if step.output_ref else None,
+        'output_size': step.output_ref.size if step.output_ref else 0
+    }
+
+
+def _blob_ref(blobs: Optional[BlobStore], digest: Optional[str], size: int):
+    if not digest:
+        return None
+    if blobs is None:
+        raise RuntimeError('Session references a stored output but no blob store is configured')
+    return blobs.ref(digest, size)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    title TEXT NOT NULL DEFAULT '',
+    server TEXT NOT NULL DEFAULT '',
+    symptoms TEXT NOT NULL DEFAULT '',
+    priority TEXT NOT NULL DEFAULT 'Medium',
+    created_at TEXT NOT NULL,
+    completed_at TEXT,
+    version INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT,
+    next_step_id INTEGER NOT NULL DEFAULT 1,
+    step_count INTEGER NOT NULL DEFAULT 0,
+    output_chars INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS steps (
+    session_id TEXT NOT NULL REFERENCES sessions(session_id) ON DELETE CASCADE,
+    id INTEGER NOT NULL,
+    command TEXT NOT NULL DEFAULT '',
+    output TEXT NOT NULL DEFAULT '',
+    analysis TEXT NOT NULL DEFAULT '',
+    timestamp TEXT NOT NULL,
+    output_ref TEXT,
+    output_size INTEGER NOT NULL DEFAULT 0,
+    position REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (session_id, id)
+);
+
+CREATE TABLE IF NOT EXISTS resolutions (
+    session_id TEXT PRIMARY KEY REFERENCES sessions(session_id) ON DELETE CASCADE,
+    root_cause TEXT NOT NULL DEFAULT '',
+    solution TEXT NOT NULL DEFAULT '',
+    fix_commands TEXT NOT NULL DEFAULT '',
+    verification TEXT NOT NULL DEFAULT '',
+    prevention TEXT NOT NULL DEFAULT ''
+);
+"""
+
+# Columns added after the initial schema, applied to existing databases
+# together with an optional statement that backfills existing rows
+MIGRATIONS = [
+    ('sessions', 'version', 'INTEGER NOT NULL DEFAULT 0', None),
+    ('sessions', 'updated_at', 'TEXT', None),
+    ('steps', 'output_ref', 'TEXT', None),
+    ('steps', 'output_size', 'INTEGER NOT NULL DEFAULT 0', None),
+    ('sessions', 'next_step_id', 'INTEGER NOT NULL DEFAULT 1',
+     'UPDATE sessions SET next_step_id = COALESCE('
+     '(SELECT MAX(id) FROM steps WHERE steps.session_id = sessions.session_id), 0) + 1'),
+    ('steps', 'position', 'REAL NOT NULL DEFAULT 0', 'UPDATE steps SET position = id'),
+    ('sessions', 'step_count', 'INTEGER NOT NULL DEFAULT 0', None),
+    ('sessions', 'output_chars', 'INTEGER NOT NULL DEFAULT 0',
+     'UPDATE sessions SET '
+     'step_count = (SELECT COUNT(*) FROM steps WHERE steps.session_id = sessions.session_id), '
+     'output_chars = (SELECT TOTAL(output_size + LENGTH(output)) FROM steps '
+     'WHERE steps.session_id = sessions.session_id)'),
+]
+
+INDEXES = """
+CREATE INDEX IF NOT EXISTS steps_position ON steps (session_id, position);
+CREATE INDEX IF NOT EXISTS sessions_created ON sessions (created_at, session_id);
+CREATE INDEX IF NOT EXISTS sessions_changed ON sessions (COALESCE(updated_at, created_at));
+CREATE INDEX IF NOT EXISTS steps_output_ref ON steps (output_ref) WHERE output_ref IS NOT NULL;
+"""
+
+# Per-session step and output totals, kept current for every way steps are
+# written so store statistics never have to scan the steps table. An output
+# is either inline (output) or in the blob store (output_size), never both
+TRIGGERS = """
+CREATE TRIGGER IF NOT EXISTS steps_totals_insert AFTER INSERT ON steps BEGIN
+    UPDATE sessions SET step_count = step_count + 1,
+        output_chars = output_chars + NEW.output_size + LENGTH(NEW.output)
+    WHERE session_id = NEW.session_id;
+END;
+CREATE TRIGGER IF NOT EXISTS steps_totals_update AFTER UPDATE OF output, output_size ON steps BEGIN
+    UPDATE sessions SET output_chars = output_chars + NEW.output_size + LENGTH(NEW.output)
+        - OLD.output_size - LENGTH(OLD.output)
+    WHERE session_id = NEW.session_id;
+END;
+CREATE TRIGGER IF NOT EXISTS steps_totals_delete AFTER DELETE ON steps BEGIN
+    UPDATE sessions SET step_count = step_count - 1,
+        output_chars = output_chars - OLD.output_size - LENGTH(OLD.output)
+    WHERE session_id = OLD.session_id;
+END;
+"""
+
+
+class StoredStepList(StepList):
+    """Steps of a SQLite session loaded for writing, read from the database as they are used.
+
+    Looking up, adding, replacing or removing a step touches only that step,
+    and the length comes from the session row, so a write never loads the
+    other steps. The order of the steps lives in the database: ``move`` only
+    checks that both steps exist, and ``previous_id`` asks the store, so it
+    reflects the move once the store has saved it. The first time the list
+    is iterated, paged or copied, it loads every saved step and behaves like
+    a plain StepList from then on.
+    """
+
+    __slots__ = ('_store', '_session_id', '_length', '_known', '_loaded')
+
+    def __init__(self, store: 'SQLiteSessionStore', session_id: str, length: int, next_id: int):
+        super().__init__(next_id=next_id)
+        self._store = store
+        self._session_id = session_id
+        self._length = length
+        # Steps looked up or changed so far; None marks a step that does not exist
+        self._known: Dict[int, Optional[Step]] = {}
+        self._loaded = False
+
+    def _load(self) -> None:
+        if not self._loaded:
+            self._loaded = True
+            StepList.__init__(self, self._store.load_steps(self._session_id), next_id=self.next_id)
+
+    def get(self, step_id: int) -> Optional[Step]:
+        if self._loaded:
+            return super().get(step_id)
+        if step_id not in self._known:
+            self._known[step_id] = self._store.load_step(self._session_id, step_id)
+        return self._known[step_id]
+
+    def insert(self, step: Step, before: Optional[int] = None) -> Step:
+        if self._loaded or before is not None:
+            self._load()
+            return super().insert(step, before)
+        if self.get(step.id) is not None:
+            raise ValueError(f'Duplicate step ID {step.id}')
+        self._known[step.id] = step
+        self._length += 1
+        self.next_id = max(self.next_id, step.id + 1)
+        return step
+
+    def replace(self, step: Step) -> None:
+        if self._loaded:
+            return super().replace(step)
+        if self.get(step.id) is None:
+            raise KeyError(step.id)
+        self._known[step.id] = step
+
+    def move(self, step_id: int, before: Optional[int] = None) -> bool:
+        if self._loaded:
+            return super().move(step_id, before)
+        return (step_id != before and self.get(step_id) is not None and
+                (before is None or self.get(before) is not None))
+
+    def remove(self, step_id: int) -> Optional[Step]:
+        if self._loaded:
+            return super().remove(step_id)
+        step = self.get(step_id)
+        if step is not None:
+            self._known[step_id] = None
+            self._length -= 1
+        return step
+
+    def previous_id(self, step_id: int) -> Optional[int]:
+        if self._loaded:
+            return super().previous_id(step_id)
+        return self._store.previous_step_id(self._session_id, step_id)
+
+    def copy(self) -> StepList:
+        self._load()
+        return super().copy()
+
+    def page(self, before: Optional[int] = None, limit: int = 20) -> Tuple[List[Step], bool]:
+        self._load()
+        return super().page(before, limit)
+
+    def page_after(self, after: Optional[int] = None, limit: int = 20) -> Tuple[List[Step], bool]:
+        self._load()
+        return super().page_after(after, limit)
+
+    def __iter__(self) -> Iterator[Step]:
+        self._load()
+        return super().__iter__()
+
+    def __len__(self) -> int:
+        return super().__len__() if self._loaded else self._length
+
+    def __contains__(self, step_id: int) -> bool:
+        return self.get(step_id) is not None
+
+
+class SQLiteSessionStore(SessionStore):
+    """Embedded SQLite store in WAL mode.
+
+    Each thread of each process opens its own connection, so the store can be
+    shared by prefork workers pointing at the same database file.
+    """
+
+    # Sessions loaded per round of queries and imported per transaction
+    BATCH_SIZE = 500
+
+    def __init__(self, path: str, timeout: float = 5.0, blobs: Optional[BlobStore] = None):
+        self.path = path
+        self.blobs = blobs
+        self.db = SQLiteDatabase(path, timeout)
+
+        conn = self.db.connection()
+        conn.executescript(SCHEMA)
+        self._migrate(conn)
+        conn.executescript(INDEXES)
+        conn.executescript(TRIGGERS)
+
+    def _migrate(self, conn: sqlite3.Connection) -> None:
+        for table, column, definition, backfill in MIGRATIONS:
+            columns = {row['name'] for row in conn.execute(f'PRAGMA table_info({table})')}
+            if column not in columns:
+                conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+                if backfill:
+                    conn.execute(backfill)
+
+    def check(self) -> None:
+        self.db.connection().execute('SELECT 1 FROM sessions LIMIT 1').fetchall()
+
+    def stats(self) -> Dict[str, int]:
+        sessions, steps, output_chars = self.db.connection().execute(
+            'SELECT COUNT(*), TOTAL(step_count), TOTAL(output_chars) FROM sessions'
+        ).fetchone()
+        return {'sessions': sessions, 'steps': int(steps), 'output_chars': int(output_chars)}
+
+    def get(self, session_id: str) -> Optional[TroubleshootingSession]:
+        conn = self.db.connection()
+        row = conn.execute('SELECT * FROM sessions WHERE session_id = ?', (session_id,)).fetchone()
+        if row is None:
+            return None
+        return self._load(conn, [row])[0]
+
+    def exists(self, session_id: str) -> bool:
+        row = self.db.connection().execute(
+            'SELECT 1 FROM sessions WHERE session_id = ?', (session_id,)
+        ).fetchone()
+        return row is not None
+
+    def get_version(self, session_id: str) -> Optional[SessionVersion]:
+        row = self.db.connection().execute(
+            'SELECT version, COALESCE(updated_at, created_at), step_count FROM sessions WHERE session_id = ?',
+            (session_id,)
+        ).fetchone()
+        return SessionVersion(*row) if row is not None else None
+
+    def _load(self, conn: sqlite3.Connection, rows: List[sqlite3.Row]) -> List[TroubleshootingSession]:
+        """Build sessions from their rows with one query each for resolutions and steps"""
+        session_ids = [row['session_id'] for row in rows]
+        placeholders = ', '.join('?' * len(session_ids))
+
+        resolutions = {
+            resolution['session_id']: resolution for resolution in conn.execute(
+                'SELECT session_id, root_cause, solution, fix_commands, verification, prevention '
+                f'FROM resolutions WHERE session_id IN ({placeholders})', session_ids
+            )
+        }
+        # Step rows are unpacked by position; this loop dominates bulk exports
+        steps: Dict[str, List[Step]] = {session_id: [] for session_id in session_ids}
+        for session_id, step_id, command, output, analysis, timestamp, output_ref, output_size in conn.execute(
+            'SELECT session_id, id, command, output, analysis, timestamp, output_ref, output_size '
+            f'FROM steps WHERE session_id IN ({placeholders}) ORDER BY session_id, position, id', session_ids
+        ):
+            steps[session_id].append(Step(
+                step_id, command, output, analysis, parse_timestamp(timestamp),
+                _blob_ref(self.blobs, output_ref, output_size) if output_ref else None
+            ))
+
+        sessions = []
+        for row in rows:
+            session = self._session(row, resolutions.get(row['session_id']))
+            session.steps = StepList(steps[row['session_id']], next_id=row['next_step_id'])
+            sessions.append(session)
+        return sessions
+
+    @staticmethod
+    def _session(row: sqlite3.Row, resolution: Optional[sqlite3.Row]) -> TroubleshootingSession:
+        """A session with the metadata of its row and its resolution, but no steps"""
+        session = TroubleshootingSession(
+            session_id=row['session_id'],
+            issue_info=IssueInfo(
+                title=row['title'],
+                server=row['server'],
+                symptoms=row['symptoms'],
+                priority=Priority.parse(row['priority'])
+            ),
+            created_at=row['created_at'],
+            completed_at=datetime.fromisoformat(row['completed_at']) if row['completed_at'] else None,
+            version=row['version'],
+            updated_at=row['updated_at'] or row['created_at']
+        )
+        if resolution is not None:
+            session.resolution = Resolution(
+                root_cause=resolution['root_cause'],
+                solution=resolution['solution'],
+                fix_commands=resolution['fix_commands'],
+                verification=resolution['verification'],
+                prevention=resolution['prevention']
+            )
+        return session
+
+    def get_summaries(self, session_ids: List[str]) -> Dict[str, TroubleshootingSession]:
+        if not session_ids:
+            return {}
+        conn = self.db.connection()
+        placeholders = ', '.join('?' * len(session_ids))
+        resolutions = {row['session_id']: row for row in conn.execute(
+            f'SELECT * FROM resolutions WHERE session_id IN ({placeholders})', session_ids
+        )}
+        rows = conn.execute(f'SELECT * FROM sessions WHERE session_id IN ({placeholders})', session_ids)
+        return {row['session_id']: self._session(row, resolutions.get(row['session_id'])) for row in rows}
+
+    def get_for_update(self, session_id: str) -> Optional[TroubleshootingSession]:
+        # Writers change metadata or single steps, so steps are only read as they are used
+        conn = self.db.connection()
+        row = conn.execute('SELECT * FROM sessions WHERE session_id = ?', (session_id,)).fetchone()
+        if row is None:
+            return None
+        resolution = conn.execute(
+            'SELECT root_cause, solution, fix_commands, verification, prevention FROM resolutions '
+            'WHERE session_id = ?', (session_id,)
+        ).fetchone()
+        session = self._session(row, resolution)
+        session.steps = StoredStepList(self, session_id, row['step_count'], row['next_step_id'])
+        return session
+
+    def _step(self, row: sqlite3.Row) -> Step:
+        return Step(
+            row['id'], row['command'], row['output'], row['analysis'], parse_timestamp(row['timestamp']),
+            _blob_ref(self.blobs, row['output_ref'], row['output_size']) if row['output_ref'] else None
+        )
+
+    def load_step(self, session_id: str, step_id: int) -> Optional[Step]:
+        row = self.db.connection().execute(
+            'SELECT id, command, output, analysis, timestamp, output_ref, output_size FROM steps '
+            'WHERE session_id = ? AND id = ?', (session_id, step_id)
+        ).fetchone()
+        return self._step(row) if row is not None else None
+
+    def load_steps(self, session_id: str) -> List[Step]:
+        rows = self.db.connection().execute(
+            'SELECT id, command, output, analysis, timestamp, output_ref, output_size FROM steps '
+            'WHERE session_id = ? ORDER BY position, id', (session_id,)
+        )
+        return [self._step(row) for row in rows]
+
+    def previous_step_id(self, session_id: str, step_id: int) -> Optional[int]:
+        """ID of the step stored in front of a step, or None for the first one"""
+        row = self.db.connection().execute(
+            'SELECT s.id FROM steps AS s JOIN steps AS t ON t.session_id = s.session_id '
+            'WHERE t.session_id = ? AND t.id = ? AND (s.position, s.id) < (t.position, t.id) '
+            'ORDER BY s.position DESC, s.id DESC LIMIT 1', (session_id, step_id)
+        ).fetchone()
+        return row['id'] if row is not None else None
+
+    def save(self, session: TroubleshootingSession, expected_version: Optional[int] = None) -> None:
+        issue = session.issue_info
+        resolution = session.resolution
+        completed_at = session.completed_at.isoformat() if session.completed_at else None
+
+        # Every update gets a fresh version from the database, so two workers
+        # saving the same session never publish different data under one version
+        with self.db.transaction() as conn:
+            if expected_version is not None:
+                row = conn.execute(
+                    'SELECT version FROM sessions WHERE session_id = ?', (session.session_id,)
+                ).fetchone()
+                if row is not None and row['version'] != expected_version:
+                    raise VersionConflictError(session.session_id, row['version'])
+            conn.execute(
+                'INSERT INTO sessions (session_id, title, server, symptoms, priority, created_at, completed_at, '
+                'version, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT(session_id) DO UPDATE SET title = excluded.title, server = excluded.server, '
+                'symptoms = excluded.symptoms, priority = excluded.priority, completed_at = excluded.completed_at, '
+                'version = sessions.version + 1, updated_at = excluded.updated_at',
+                (session.session_id, issue.title, issue.server, issue.symptoms, issue.priority,
+                 session.created_at, completed_at, session.version, session.updated_at)
+            )
+            conn.execute(
+                'INSERT OR REPLACE INTO resolutions '
+                '(session_id, root_cause, solution, fix_commands, verification, prevention) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (session.session_id, resolution.root_cause, resolution.solution,
+                 resolution.fix_commands, resolution.verification, resolution.prevention)
+            )
+            self._read_version(conn, session)
+
+    def _bump_version(self, conn: sqlite3.Connection, session: TroubleshootingSession) -> None:
+        conn.execute(
+            'UPDATE sessions SET version = version + 1, updated_at = ? WHERE session_id = ?',
+            (session.updated_at, session.session_id)
+        )
+        self._read_version(conn, session)
+
+    def _read_version(self, conn: sqlite3.Connection, session: TroubleshootingSession) -> None:
+        row = conn.execute(
+            'SELECT version FROM sessions WHERE session_id = ?', (session.session_id,)
+        ).fetchone()
+        if row is not None:
+            session.version = row['version']
+
+    def allocate_step_id(self, session: TroubleshootingSession) -> int:
+        # The counter lives in the database so workers never hand out the same ID
+        with self.db.transaction() as conn:
+            conn.execute(
+                'UPDATE sessions SET next_step_id = next_step_id + 1 WHERE session_id = ?',
+                (session.session_id,)
+            )
+            row = conn.execute(
+                'SELECT next_step_id FROM sessions WHERE session_id = ?', (session.session_id,)
+            ).fetchone()
+        return row['next_step_id'] - 1
+
+    def add_step(self, session: TroubleshootingSession, step: Step) -> None:
+        with self.db.transaction() as conn:
+            conn.execute(
+                'INSERT INTO steps (session_id, id, command, output, analysis, timestamp, output_ref, output_size, '
+                'position) '
+                'SELECT ?, ?, ?, ?, ?, ?, ?, ?, COALESCE(MAX(position), 0) + 1 FROM steps WHERE session_id = ?',
+                (session.session_id, step.id, step.command, step.output, step.analysis, step.timestamp_iso,
+                 step.output_ref.digest if step.output_ref else None,
+                 step.output_ref.size if step.output_ref else 0, session.session_id)
+            )
+            self._bump_version(conn, session)
+
+    def update_step(self, session: TroubleshootingSession, step: Step) -> None:
+        with self.db.transaction() as conn:
+            conn.execute(
+                'UPDATE steps SET command = ?, output = ?, analysis = ?, output_ref = ?, output_size = ? '
+                'WHERE session_id = ? AND id = ?',
+                (step.command, step.output, step.analysis,
+                 step.output_ref.digest if step.output_ref else None,
+                 step.output_ref.size if step.output_ref else 0, session.session_id, step.id)
+            )
+            self._bump_version(conn, session)
+
+    def move_step(self, session: TroubleshootingSession, step_id: int, before: Optional[int]) -> bool:
+        # Positions are fractional, so a move only rewrites the moved row
+        session_id = session.session_id
+        with self.db.transaction() as conn:
+            if before is None:
+                position = conn.execute(
+                    'SELECT COALESCE(MAX(position), 0) + 1 FROM steps WHERE session_id = ?', (session_id,)
+                ).fetchone()[0]
+            else:
+                row = conn.execute(
+                    'SELECT position FROM steps WHERE session_id = ? AND id = ?', (session_id, before)
+                ).fetchone()
+                if row is None:
+                    return False
+                previous = conn.execute(
+                    'SELECT MAX(position) FROM steps WHERE session_id = ? AND position < ? AND id != ?',
+                    (session_id, row['position'], step_id)
+                ).fetchone()[0]
+                position = (previous + row['position']) / 2 if previous is not None else row['position'] - 1
+
+            cursor = conn.execute(
+                'UPDATE steps SET position = ? WHERE session_id = ? AND id = ?', (position, session_id, step_id)
+            )
+            if cursor.rowcount > 0:
+                self._bump_version(conn, session)
+        return cursor.rowcount > 0
+
+    def remove_step(self, session: TroubleshootingSession, step_id: int) -> bool:
+        with self.db.transaction() as conn:
+            cursor = conn.execute(
+                'DELETE FROM steps WHERE session_id = ? AND id = ?', (session.session_id, step_id)
+            )
+            if cursor.rowcount > 0:
+                self._bump_version(conn, session)
+        return cursor.rowcount > 0
+
+    def delete(self, session_id: str) -> bool:
+        with self.db.transaction() as conn:
+            cursor = conn.execute('DELETE FROM sessions WHERE session_id = ?', (session_id,))
+        return cursor.rowcount > 0
+
+    def purge(self, changed_before: str) -> List[str]:
+        # One short transaction per batch, so writers are never blocked for long;
+        # a session changed meanwhile no longer matches and is kept
+        deleted = []
+        while True:
+            with self.db.transaction() as conn:
+                rows = conn.execute(
+                    'DELETE FROM sessions WHERE session_id IN ('
+                    'SELECT session_id FROM sessions WHERE COALESCE(updated_at, created_at) < ? LIMIT ?'
+                    ') RETURNING session_id',
+                    (changed_before, self.BATCH_SIZE)
+                ).fetchall()
+            deleted.extend(row['session_id'] for row in rows)
+            if len(rows) < self.BATCH_SIZE:
+                return deleted
+
+    def referenced_blobs(self) -> Optional[Set[str]]:
+        rows = self.db.connection().execute(
+            'SELECT DISTINCT output_ref FROM steps WHERE output_ref IS NOT NULL'
+        ).fetchall()
+        return {row['output_ref'] for row in rows}
+
+    @staticmethod
+    def _filter_conditions(session_filter: Optional[SessionFilter]) -> Tuple[List[str], List[Any]]:
+        conditions, params = [], []
+        if session_filter is not None:
+            if session_filter.created_since:
+                conditions.append('created_at >= ?')
+                params.append(session_filter.created_since)
+            if session_filter.created_until:
+                conditions.append('created_at < ?')
+                params.append(session_filter.created_until)
+            if session_filter.priority:
+                conditions.append('priority = ? COLLATE NOCASE')
+                params.append(session_filter.priority)
+            if session_filter.completed is not None:
+                conditions.append('completed_at IS NOT NULL' if session_filter.completed else 'completed_at IS NULL')
+        return conditions, params
+
+    def iter_sessions(self, session_filter: Optional[SessionFilter] = None) -> Iterator[TroubleshootingSession]:
+        conditions, params = self._filter_conditions(session_filter)
+
+        # Keyset pagination keeps no cursor open between batches, so a slow
+        # consumer never holds a read snapshot
+        conn = self.db.connection()
+        last = ('', '')
+        while True:
+            rows = conn.execute(
+                'SELECT * FROM sessions WHERE ' + ' AND '.join(conditions + ['(created_at, session_id) > (?, ?)']) +
+                ' ORDER BY created_at, session_id LIMIT ?',
+                params + [*last, self.BATCH_SIZE]
+            ).fetchall()
+            if not rows:
+                return
+            yield from self._load(conn, rows)
+            last = (rows[-1]['created_at'], rows[-1]['session_id'])
+
+    def iter_session_ids(self, session_filter: Optional[SessionFilter] = None) -> Iterator[str]:
+        conditions, params = self._filter_conditions(session_filter)
+        rows = self.db.connection().execute(
+            'SELECT session_id FROM sessions' + (' WHERE ' + ' AND '.join(conditions) if conditions else '') +
+            ' ORDER BY created_at, session_id',
+            params
+        ).fetchall()
+        for row in rows:
+            yield row['session_id']
+
+    def import_sessions(self, sessions: Iterable[TroubleshootingSession],
+                        replace: bool = False) -> Iterator[Tuple[TroubleshootingSession, bool]]:
+        # One transaction per batch; results are yielded only after it committed
+        batch = []
+        for session in sessions:
+            batch.append(session)
+            if len(batch) >= self.BATCH_SIZE:
+                yield from self._import_batch(batch, replace)
+                batch = []
+        if batch:
+            yield from self._import_batch(batch, replace)
+
+    def _import_batch(self, sessions: List[TroubleshootingSession],
+                      replace: bool) -> List[Tuple[TroubleshootingSession, bool]]:
+        session_ids = [session.session_id for session in sessions]
+        with self.db.transaction() as conn:
+            existing = {row['session_id']: row['version'] for row in conn.execute(
+                f'SELECT session_id, version FROM sessions WHERE session_id IN ({", ".join("?" * len(session_ids))})',
+                session_ids
+            )}
+
+            # A session repeated within the batch is treated like an existing one
+            latest: Dict[str, TroubleshootingSession] = {}
+            for session in sessions:
+                session_id = session.session_id
+                if session_id in latest or session_id in existing:
+                    if not replace:
+                        continue
+                    previous = latest[session_id].version if session_id in latest else existing[session_id]
+                    session.version = max(session.version, previous + 1)
+                latest[session_id] = session
+            written = list(latest.values())
+            if replace:
+                conn.executemany(
+                    'DELETE FROM sessions WHERE session_id = ?',
+                    [(session.session_id,) for session in written if session.session_id in existing]
+                )
+
+            conn.executemany(
+                'INSERT INTO sessions (session_id, title, server, symptoms, priority, created_at, completed_at, '
+                'version, updated_at, next_step_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(session.session_id, session.issue_info.title, session.issue_info.server,
+                  session.issue_info.symptoms, session.issue_info.priority, session.created_at,
+                  session.completed_at.isoformat() if session.completed_at else None, session.version,
+                  session.updated_at, session.steps.next_id) for session in written]
+            )
+            conn.executemany(
+                'INSERT INTO resolutions (session_id, root_cause, solution, fix_commands, verification, prevention) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                [(session.session_id, session.resolution.root_cause, session.resolution.solution,
+                  session.resolution.fix_commands, session.resolution.verification, session.resolution.prevention)
+                 for session in written]
+            )
+            conn.executemany(
+                'INSERT INTO steps (session_id, id, command, output, analysis, timestamp, output_ref, output_size, '
+                'position) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(session.session_id, step.id, step.command, step.output, step.analysis, step.timestamp_iso,
+                  step.output_ref.digest if step.output_ref else None,
+                  step.output_ref.size if step.output_ref else 0, position)
+                 for session in written for position, step in enumerate(session.steps, 1)]
+            )
+
+        written_ids = {id(session) for session in written}
+        return [(session, id(session) in written_ids) for session in sessions]
+
+    def close(self) -> None:
+        self.db.close()
+
+def create_session_store(config, blobs: Optional[BlobStore] = None) -> SessionStore:
+    """Build the session store selected by SESSION_STORE in the app config"""
+    backend = config.get('SESSION_STORE', 'memory')
+    if backend == 'sqlite':
+        return SQLiteSessionStore(config['SESSION_DB_PATH'], blobs=blobs)
+    if backend == 'memory':
+        lifetime = config.get('PERMANENT_SESSION_LIFETIME')
+        return MemorySessionStore(
+            ttl=lifetime.total_seconds() if lifetime else None,
+            max_sessions=config.get('SESSION_CACHE_MAX_SESSIONS'),
+            max_bytes=config.get('SESSION_CACHE_MAX_BYTES'),
+            spill_dir=config.get('SESSION_SPILL_DIR'),
+            blobs=blobs
+        )
+    raise ValueError(f'Unknown session store backend: {backend}')
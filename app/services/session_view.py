@@ -0,0 +1,141 @@
+import hashlib
+from dataclasses import dataclass
+from functools import cached_property
+from operator import attrgetter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.models.troubleshooting import TroubleshootingSession, Step
+
+SESSION_FIELDS = ('session_id', 'issue_info', 'steps', 'resolution', 'created_at', 'updated_at',
+                  'version', 'next_step_id', 'completed_at', 'step_count')
+STEP_FIELDS = ('id', 'command', 'output', 'output_preview', 'output_length', 'analysis', 'timestamp')
+
+# Without a field selection, the fields of TroubleshootingSession.to_dict()
+DEFAULT_FIELDS = SESSION_FIELDS[:-1]
+DEFAULT_STEP_FIELDS = ('id', 'command', 'output', 'analysis', 'timestamp')
+
+# Step fields that stand in for ``output`` in each output mode
+OUTPUT_MODES = {
+    'full': ('output',),
+    'preview': ('output_preview', 'output_length'),
+    'none': (),
+}
+
+MAX_STEPS_LIMIT = 1000
+
+
+def _step_getter(name: str, preview_chars: int) -> Callable[[Step], Any]:
+    if name == 'output':
+        return Step.read_output
+    if name == 'output_preview':
+        return lambda step: step.output_preview(preview_chars)
+    if name == 'timestamp':
+        return attrgetter('timestamp_iso')
+    return attrgetter(name)
+
+
+@dataclass(frozen=True)
+class SessionView:
+    """The parts of a session a /api/session_data request asks for.
+
+    ``fields`` selects top-level fields, and ``steps.<name>`` entries among
+    them select step fields. ``output`` replaces a step's full output with a
+    preview and its length in characters, or drops it; only the outputs that
+    are returned are read from the blob store. ``after`` or ``before``, with
+    ``limit``, return one page of steps instead of all of them; ``limit``
+    alone returns the latest steps, as the page does.
+    """
+    fields: Tuple[str, ...] = DEFAULT_FIELDS
+    step_fields: Tuple[str, ...] = DEFAULT_STEP_FIELDS
+    after: Optional[int] = None
+    before: Optional[int] = None
+    limit: Optional[int] = None
+
+    @classmethod
+    def parse(cls, fields: Optional[str] = None, output: Optional[str] = None, after: Optional[str] = None,
+              before: Optional[str] = None, limit: Optional[str] = None) -> 'SessionView':
+        """Build a view from user-supplied strings; raises ValueError for invalid values"""
+        names = [name.strip() for name in fields.split(',') if name.strip()] if fields else []
+        top = [name for name in names if not name.startswith('steps.')]
+        nested = [name[len('steps.'):] for name in names if name.startswith('steps.')]
+        for name in top:
+            if name not in SESSION_FIELDS:
+                raise ValueError(f'Unknown field: {name}')
+        for name in nested:
+            if name not in STEP_FIELDS:
+                raise ValueError(f'Unknown step field: steps.{name}')
+        if nested and 'steps' not in top:
+            top.append('steps')
+
+        step_fields = tuple(nested) or DEFAULT_STEP_FIELDS
+        if output:
+            if output not in OUTPUT_MODES:
+                raise ValueError(f'Invalid output mode: {output}')
+            step_fields = tuple(name for name in step_fields if name != 'output' and name not in OUTPUT_MODES[output])
+            step_fields += OUTPUT_MODES[output]
+
+        if after and before:
+            raise ValueError('after and before cannot be combined')
+        try:
+            after_id = int(after) if after else None
+            before_id = int(before) if before else None
+            count = int(limit) if limit else None
+        except ValueError:
+            raise ValueError('after, before and limit must be integers') from None
+        if count is not None:
+            count = min(max(count, 1), MAX_STEPS_LIMIT)
+        elif after_id is not None or before_id is not None:
+            count = MAX_STEPS_LIMIT
+
+        # Order-preserving, so equal requests get equal ETags
+        return cls(
+            fields=tuple(dict.fromkeys(top)) or DEFAULT_FIELDS,
+            step_fields=tuple(dict.fromkeys(step_fields)),
+            after=after_id,
+            before=before_id,
+            limit=count
+        )
+
+    @cached_property
+    def key(self) -> str:
+        """Short digest identifying the view, for ETags"""
+        text = f'{self.fields}|{self.step_fields}|{self.after}|{self.before}|{self.limit}'
+        return hashlib.sha1(text.encode()).hexdigest()[:12]
+
+    def steps(self, session: TroubleshootingSession) -> Tuple[List[Step], Optional[Dict[str, int]]]:
+        """The selected steps and the cursor for the next page, if there is one"""
+        if self.limit is None:
+            return list(session.steps), None
+        if self.after is not None:
+            # 0 starts from the first step; step IDs start at 1
+            steps, has_more = session.steps.page_after(self.after or None, self.limit)
+            return steps, {'after': steps[-1].id} if has_more else None
+        steps, has_more = session.steps.page(self.before, self.limit)
+        return steps, {'before': steps[0].id} if has_more else None
+
+    def render(self, session: TroubleshootingSession,
+               preview_chars: int = 500) -> Tuple[Dict[str, Any], Optional[Dict[str, int]]]:
+        """The selected fields of a session, and the cursor for the next page of steps"""
+        data: Dict[str, Any] = {}
+        cursor = None
+        for name in self.fields:
+            if name == 'steps':
+                steps, cursor = self.steps(session)
+                if self.step_fields == DEFAULT_STEP_FIELDS:
+                    data['steps'] = [step.to_dict() for step in steps]
+                else:
+                    getters = [(field, _step_getter(field, preview_chars)) for field in self.step_fields]
+                    data['steps'] = [{field: get(step) for field, get in getters} for step in steps]
+            elif name == 'issue_info':
+                data['issue_info'] = session.issue_info.to_dict()
+            elif name == 'resolution':
+                data['resolution'] = session.resolution.to_dict()
+            elif name == 'next_step_id':
+                data['next_step_id'] = session.steps.next_id
+            elif name == 'step_count':
+                data['step_count'] = len(session.steps)
+            elif name == 'completed_at':
+                data['completed_at'] = session.completed_at.isoformat() if session.completed_at else None
+            else:
+                data[name] = getattr(session, name)
+        return data, cursor
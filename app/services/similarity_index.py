@@ -0,0 +1,272 @@
+import re
+import threading
+import zlib
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from app.models.troubleshooting import TroubleshootingSession, Step
+from app.services.observers import SessionObserver
+from app.utils.sqlite import SQLiteDatabase
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS signatures (
+    session_id TEXT PRIMARY KEY,
+    resolved INTEGER NOT NULL DEFAULT 0,
+    signature BLOB NOT NULL,
+    seq INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+INDEXES = """
+CREATE INDEX IF NOT EXISTS signatures_seq ON signatures (seq);
+"""
+
+# Mersenne prime 2**31 - 1; (a * x + b) stays below 2**64 for 32-bit token hashes
+PRIME = (1 << 31) - 1
+EMPTY = np.uint32(PRIME)
+
+TOKEN_RE = re.compile(r'[a-z_][a-z0-9_.:/-]{2,}')
+DIGITS_RE = re.compile(r'\d+')
+
+
+def _no_tokens(signature: np.ndarray) -> bool:
+    # Hash values are always below PRIME, so only an empty token set leaves every position EMPTY
+    return bool((signature == EMPTY).all())
+
+
+def tokenize(text: str) -> Set[str]:
+    """Lower-cased tokens with runs of digits collapsed, so PIDs, ports and
+    timestamps do not make otherwise identical lines look different"""
+    return set(TOKEN_RE.findall(DIGITS_RE.sub('0', text.lower())))
+
+
+class SimilarityIndex(SessionObserver):
+    """MinHash signatures of every session, for finding similar past incidents.
+
+    Each session is reduced to the set of tokens in its title, symptoms and
+    steps, and that set to ``num_hashes`` minimum hash values. The fraction of
+    equal positions in two signatures estimates the Jaccard similarity of the
+    token sets, so a query is a single vectorized comparison against the
+    signature matrix. Signatures are persisted per session in SQLite and loaded
+    into memory on startup.
+
+    Every write is stamped with an increasing ``seq``, and removed sessions
+    leave an empty signature behind, so processes sharing the database catch
+    up with each other's changes by reading the rows past the last ``seq``
+    they have seen.
+    """
+
+    def __init__(self, path: str, num_hashes: int = 64, max_output_chars: int = 20000, seed: int = 1):
+        self.db = SQLiteDatabase(path)
+        self.num_hashes = num_hashes
+        self.max_output_chars = max_output_chars
+
+        # Fixed seed: persisted signatures must stay comparable across restarts
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, PRIME, size=num_hashes).astype(np.uint64)
+        self._b = rng.randint(0, PRIME, size=num_hashes).astype(np.uint64)
+
+        self._lock = threading.Lock()
+        self._signatures = np.full((0, num_hashes), EMPTY, dtype=np.uint32)
+        self._resolved = np.zeros(0, dtype=bool)
+        self._session_ids: List[Optional[str]] = []
+        self._rows: Dict[str, int] = {}
+        self._free: List[int] = []
+        self._seq = -1
+
+        conn = self.db.connection()
+        conn.executescript(SCHEMA)
+        if 'seq' not in {row['name'] for row in conn.execute('PRAGMA table_info(signatures)')}:
+            conn.execute('ALTER TABLE signatures ADD COLUMN seq INTEGER NOT NULL DEFAULT 0')
+        conn.executescript(INDEXES)
+        self._sync(conn)
+
+    def _sync(self, conn) -> None:
+        """Apply the rows written since the last sync, by this or any other process"""
+        rows = conn.execute(
+            'SELECT session_id, resolved, signature, seq FROM signatures WHERE seq > ? ORDER BY seq', (self._seq,)
+        ).fetchall()
+        if not rows:
+            return
+        with self._lock:
+            self._grow(len(rows))
+            for row in rows:
+                if row['seq'] <= self._seq:
+                    continue
+                signature = np.frombuffer(row['signature'], dtype=np.uint32)
+                if len(signature) == self.num_hashes and not _no_tokens(signature):
+                    self._set_row(row['session_id'], signature, bool(row['resolved']))
+                else:
+                    self._clear_row(row['session_id'])
+            self._seq = max(self._seq, rows[-1]['seq'])
+
+    def is_empty(self) -> bool:
+        return not self._rows
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def signature(self, tokens: Iterable[str]) -> np.ndarray:
+        hashes = np.fromiter((zlib.crc32(token.encode('utf-8')) for token in tokens), dtype=np.uint64)
+        signature = np.full(self.num_hashes, EMPTY, dtype=np.uint32)
+        # Hash in blocks so large outputs never need a num_hashes x tokens matrix at once
+        for start in range(0, len(hashes), 4096):
+            block = hashes[None, start:start + 4096]
+            values = (self._a[:, None] * block + self._b[:, None]) % PRIME
+            np.minimum(signature, values.min(axis=1).astype(np.uint32), out=signature)
+        return signature
+
+    def _step_tokens(self, step: Step) -> Set[str]:
+        output = step.output_preview(self.max_output_chars) if step.output_length else ''
+        return tokenize(' '.join((step.command, output, step.analysis)))
+
+    def session_tokens(self, session: TroubleshootingSession) -> Set[str]:
+        issue = session.issue_info
+        tokens = tokenize(' '.join((issue.title, issue.symptoms)))
+        for step in session.steps:
+            tokens |= self._step_tokens(step)
+        return tokens
+
+    @staticmethod
+    def _is_resolved(session: TroubleshootingSession) -> bool:
+        return bool(session.resolution.root_cause.strip() or session.resolution.fix_commands.strip())
+
+    def _grow(self, extra: int) -> None:
+        needed = len(self._session_ids) + extra
+        capacity = len(self._signatures)
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2, 1024)
+        signatures = np.full((capacity, self.num_hashes), EMPTY, dtype=np.uint32)
+        signatures[:len(self._signatures)] = self._signatures
+        resolved = np.zeros(capacity, dtype=bool)
+        resolved[:len(self._resolved)] = self._resolved
+        self._signatures, self._resolved = signatures, resolved
+
+    def _set_row(self, session_id: str, signature: np.ndarray, resolved: bool) -> None:
+        row = self._rows.get(session_id)
+        if row is None:
+            if self._free:
+                row = self._free.pop()
+                self._session_ids[row] = session_id
+            else:
+                self._grow(1)
+                row = len(self._session_ids)
+                self._session_ids.append(session_id)
+            self._rows[session_id] = row
+        self._signatures[row] = signature
+        self._resolved[row] = resolved
+
+    def _store(self, session_id: str, signature: np.ndarray, resolved: bool) -> None:
+        self._store_many([(session_id, signature, resolved)])
+
+    def _store_many(self, entries: List[Tuple[str, np.ndarray, bool]]) -> None:
+        # Sessions without any tokens would all match each other perfectly, so
+        # they are stored like removed ones and never become candidates
+        self._write([
+            (session_id, 0, b'') if _no_tokens(signature) else (session_id, int(resolved), signature.tobytes())
+            for session_id, signature, resolved in entries
+        ])
+
+    def _write(self, rows: List[Tuple[str, int, bytes]]) -> None:
+        # The write lock serializes writers across processes, so the seq
+        # values handed out here are unique and increasing
+        with self.db.transaction() as conn:
+            self._sync(conn)
+            seq = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM signatures').fetchone()[0]
+            conn.executemany(
+                'INSERT OR REPLACE INTO signatures (session_id, resolved, signature, seq) VALUES (?, ?, ?, ?)',
+                [row + (seq + i,) for i, row in enumerate(rows, 1)]
+            )
+            self._sync(conn)
+
+    def index_session(self, session: TroubleshootingSession) -> None:
+        """Recompute the signature of a session from all of its fields"""
+        self._store(session.session_id, self.signature(self.session_tokens(session)), self._is_resolved(session))
+
+    def add_step(self, session: TroubleshootingSession, step: Step) -> None:
+        # The minimum over a larger set is the element-wise minimum, so new
+        # steps only need their own tokens hashed
+        current = self.session_signature(session.session_id)
+        if current is None:
+            self.index_session(session)
+            return
+        signature = np.minimum(current, self.signature(self._step_tokens(step)))
+        self._store(session.session_id, signature, self._is_resolved(session))
+
+    def remove_session(self, session_id: str) -> None:
+        self._write([(session_id, 0, b'')])
+
+    def _clear_row(self, session_id: str) -> None:
+        row = self._rows.pop(session_id, None)
+        if row is not None:
+            self._signatures[row] = EMPTY
+            self._resolved[row] = False
+            self._session_ids[row] = None
+            self._free.append(row)
+
+    # SessionObserver hooks keep the signatures in step with the session store
+
+    def session_changed(self, session: TroubleshootingSession) -> None:
+        self.index_session(session)
+
+    def session_deleted(self, session_id: str) -> None:
+        self.remove_session(session_id)
+
+    def sessions_loaded(self, sessions: List[TroubleshootingSession]) -> None:
+        self._store_many([
+            (session.session_id, self.signature(self.session_tokens(session)), self._is_resolved(session))
+            for session in sessions
+        ])
+
+    def step_added(self, session: TroubleshootingSession, step: Step) -> None:
+        self.add_step(session, step)
+
+    def step_updated(self, session: TroubleshootingSession, step: Step) -> None:
+        self.index_session(session)
+
+    def step_removed(self, session: TroubleshootingSession, step_id: int) -> None:
+        self.index_session(session)
+
+    def session_signature(self, session_id: str) -> Optional[np.ndarray]:
+        self._sync(self.db.connection())
+        with self._lock:
+            row = self._rows.get(session_id)
+            return self._signatures[row].copy() if row is not None else None
+
+    def query_signature(self, session_id: Optional[str], text: str = '') -> np.ndarray:
+        """Stored signature of a session combined with text that has not been saved yet.
+
+        Every stored session with tokens is indexed, so one that is not
+        contributes nothing and the session itself never has to be loaded.
+        """
+        signature = self.signature(tokenize(text))
+        stored = self.session_signature(session_id) if session_id else None
+        if stored is not None:
+            np.minimum(signature, stored, out=signature)
+        return signature
+
+    def query(self, signature: np.ndarray, k: int = 5, exclude: Optional[str] = None,
+              min_score: float = 0.05) -> List[Tuple[str, float]]:
+        """Return up to ``k`` (session_id, score) pairs of resolved sessions, best first"""
+        if _no_tokens(signature):
+            return []
+        self._sync(self.db.connection())
+        with self._lock:
+            count = len(self._session_ids)
+            candidates = self._resolved[:count].copy()
+            if exclude in self._rows:
+                candidates[self._rows[exclude]] = False
+            if not candidates.any():
+                return []
+            matches = (self._signatures[:count] == signature).sum(axis=1, dtype=np.uint16)
+            scores = np.where(candidates, matches / self.num_hashes, -1.0)
+
+            k = min(k, count)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(self._session_ids[row], float(scores[row])) for row in top if scores[row] >= min_score]
+
+    def close(self) -> None:
+        self.db.close()
@@ -1,127 +1,671 @@
+import codecs
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import fields
+from itertools import chain, islice
 from datetime import datetime
-from typing import Optional, Dict, Any
-from app.models.troubleshooting import TroubleshootingSession, IssueInfo, Step, Resolution
+from typing import Optional, Callable, Dict, Any, Iterable, Iterator, List, Tuple, Union
+from app.models.troubleshooting import TroubleshootingSession, IssueInfo, Priority, Step, Resolution, format_duration
+from app.services.analytics import AnalyticsIndex
+from app.services.blob_store import BlobRef, BlobStore
+from app.services.metrics import SIZE_BUCKETS, metrics
+from app.services.observers import SessionObserver
+from app.services.output_condenser import DEFAULT_ERROR_PATTERN, OutputCondenser
+from app.services.rca_archive import SESSIONS_PER_WORKER, render_parallel, stream_rca_zip
+from app.services.report_cache import ReportCache
+from app.services.session_archive import ImportResult, export_ndjson, parse_ndjson
+from app.services.search_index import SearchIndex
+from app.services.session_events import SessionEventLog
+from app.services.similarity_index import SimilarityIndex
+from app.services.session_view import SessionView
+from app.services.session_store import (SessionStore, SessionFilter, MemorySessionStore, SQLiteSessionStore,
+                                        SessionVersion, VersionConflictError, create_session_store)
+from app.utils.locks import KeyedLocks
+
+logger = logging.getLogger(__name__)
+
+RENDER_SECONDS = metrics.histogram(
+    'resolviq_report_render_seconds', 'Time spent rendering reports that were not cached', ('format',)
+)
+RENDER_SIZE = metrics.histogram(
+    'resolviq_report_size_chars', 'Characters in rendered reports that were not cached', ('format',),
+    buckets=SIZE_BUCKETS
+)
+RENDER_CACHE = metrics.counter(
+    'resolviq_report_cache_requests_total', 'Report renders by whether the cache had them', ('format', 'result')
+)
+
+# Bytes of a streamed step output read at a time
+CAPTURE_CHUNK_SIZE = 64 * 1024
+
+class OutputTooLargeError(Exception):
+    """Raised when a streamed step output exceeds its size limit"""
+    
+    def __init__(self, max_bytes: int):
+        super().__init__(f'Output exceeds the limit of {max_bytes} bytes')
+        self.max_bytes = max_bytes
 
 class TroubleshootingService:
-    def __init__(self):
-        self.sessions: Dict[str, TroubleshootingSession] = {}
+    IMPORT_BATCH_SIZE = 500
+    # Loads and saves of a metadata change before a concurrent writer wins
+    SAVE_ATTEMPTS = 3
+    
+    def __init__(self, store: Optional[SessionStore] = None, blobs: Optional[BlobStore] = None,
+                 blob_threshold: int = 4096):
+        self.store: SessionStore = store or MemorySessionStore()
+        self.blobs = blobs
+        self.blob_threshold = blob_threshold
+        # Largest capture held in memory when there is no blob store to stream it to
+        self.capture_inline_max_bytes: Optional[int] = None
+        self.report_cache = ReportCache()
+        self.condenser = OutputCondenser()
+        self.search_index: Optional[SearchIndex] = None
+        self.similarity_index: Optional[SimilarityIndex] = None
+        self.analytics_index: Optional[AnalyticsIndex] = None
+        self.event_log = SessionEventLog()
+        self.observers: List[SessionObserver] = [self.event_log]
+        self.session_locks = KeyedLocks()
+        # Seconds a session may go unchanged before it is purged, and between purges
+        self.retention: Optional[float] = None
+        self.purge_interval: Optional[float] = None
+        self._next_purge = 0.0
+        self._purge_lock = threading.Lock()
+    
+    def init_app(self, app):
+        """Switch to the storage backend configured for the application"""
+        blob_dir = app.config.get('BLOB_STORE_DIR')
+        self.blobs = BlobStore(blob_dir) if blob_dir else None
+        self.blob_threshold = app.config.get('BLOB_THRESHOLD_CHARS', 4096)
+        self.capture_inline_max_bytes = app.config.get('CAPTURE_INLINE_MAX_BYTES', 1024 * 1024) or None
+        
+        self.store.close()
+        self.store = create_session_store(app.config, self.blobs)
+        self.retention = app.config.get('SESSION_RETENTION_SECONDS') or None
+        self.purge_interval = app.config.get('SESSION_PURGE_INTERVAL_SECONDS') or None
+        self._next_purge = 0.0
+        self.report_cache = ReportCache(
+            max_entries=app.config.get('REPORT_CACHE_MAX_ENTRIES', 256),
+            max_bytes=app.config.get('REPORT_CACHE_MAX_BYTES')
+        )
+        self.condenser = OutputCondenser(
+            min_chars=app.config.get('OUTPUT_CONDENSE_MIN_CHARS', 16000),
+            head_lines=app.config.get('OUTPUT_CONDENSE_HEAD_LINES', 50),
+            tail_lines=app.config.get('OUTPUT_CONDENSE_TAIL_LINES', 50),
+            max_error_lines=app.config.get('OUTPUT_CONDENSE_MAX_ERROR_LINES', 200),
+            max_line_chars=app.config.get('OUTPUT_CONDENSE_MAX_LINE_CHARS', 1000),
+            error_pattern=app.config.get('OUTPUT_CONDENSE_ERROR_PATTERN') or DEFAULT_ERROR_PATTERN,
+            cache_max_bytes=app.config.get('OUTPUT_CONDENSE_CACHE_MAX_BYTES', 32 * 1024 * 1024)
+        )
+        
+        if self.search_index:
+            self.search_index.close()
+        search_path = app.config.get('SEARCH_DB_PATH')
+        self.search_index = SearchIndex(
+            search_path, max_output_chars=app.config.get('SEARCH_MAX_OUTPUT_CHARS', 1000000)
+        ) if search_path else None
+        
+        if self.similarity_index is not None:
+            self.similarity_index.close()
+        similarity_path = app.config.get('SIMILARITY_DB_PATH')
+        self.similarity_index = SimilarityIndex(
+            similarity_path, num_hashes=app.config.get('SIMILARITY_NUM_HASHES', 64)
+        ) if similarity_path else None
+        
+        if self.analytics_index is not None:
+            self.analytics_index.close()
+        analytics_path = app.config.get('ANALYTICS_DB_PATH')
+        self.analytics_index = AnalyticsIndex(analytics_path) if analytics_path else None
+        
+        self.event_log.close()
+        self.event_log = SessionEventLog(
+            app.config.get('EVENTS_DB_PATH') or None,
+            retention=app.config.get('EVENTS_RETENTION_SECONDS', 3600),
+            poll_interval=app.config.get('EVENTS_POLL_INTERVAL', 0.5),
+            max_streams=app.config.get('EVENTS_MAX_STREAMS') or None
+        )
+        
+        indexes = [index for index in (self.search_index, self.similarity_index, self.analytics_index)
+                   if index is not None]
+        self.observers = indexes + [self.event_log]
+        
+        # A new index is filled once from the sessions that already exist
+        for index in indexes:
+            if index.is_empty():
+                index.rebuild(self.store.iter_sessions())
+        
+        # One aggregation of the store per scrape feeds all three gauges
+        stats = metrics.per_scrape(self.stats)
+        metrics.gauge('resolviq_sessions', 'Sessions held by the store', lambda: stats()['sessions'])
+        metrics.gauge('resolviq_steps', 'Steps in all stored sessions', lambda: stats()['steps'])
+        metrics.gauge('resolviq_step_output_chars', 'Characters of command output in all stored steps',
+                      lambda: stats()['output_chars'])
+    
+    def check_ready(self) -> None:
+        """Raise if sessions cannot currently be read or written"""
+        self.store.check()
+    
+    def stats(self) -> Dict[str, int]:
+        """Session, step and output totals of the store"""
+        return self.store.stats()
+    
+    @contextmanager
+    def _writing(self, session_id: str) -> Iterator[Optional[TroubleshootingSession]]:
+        """Hold the session's write lock and yield a copy of it to modify.
+        
+        Writers of one session run one at a time, while readers keep using the
+        version they fetched, so rendering never waits for a write.
+        """
+        with self.session_locks.hold(session_id):
+            yield self.store.get_for_update(session_id)
+    
+    def _save_changes(self, session_id: str, change: Callable[[TroubleshootingSession], None],
+                      event: str) -> Optional[TroubleshootingSession]:
+        """Apply ``change`` to the issue information or resolution of a session and save it.
+        
+        The session lock only serializes writers within this process, so the
+        save is conditional on the version that was loaded. If another worker
+        saved the session in between, the session is loaded again and the
+        change reapplied to it; VersionConflictError is raised once
+        SAVE_ATTEMPTS have all lost that race.
+        """
+        for attempt in range(1, self.SAVE_ATTEMPTS + 1):
+            with self._writing(session_id) as session:
+                if not session:
+                    return None
+                
+                base_version = session.version
+                change(session)
+                session.touch()
+                try:
+                    self.store.save(session, expected_version=base_version)
+                except VersionConflictError:
+                    if attempt == self.SAVE_ATTEMPTS:
+                        raise
+                    continue
+                self._notify(event, session)
+                return session
+    
+    def _notify(self, event: str, *args) -> None:
+        """Forward a change to every observer; a failing observer never fails the request"""
+        for observer in self.observers:
+            try:
+                getattr(observer, event)(*args)
+            except Exception:
+                logger.exception('Session observer %s failed on %s', type(observer).__name__, event)
     
     def create_session(self) -> TroubleshootingSession:
         session = TroubleshootingSession()
-        self.sessions[session.session_id] = session
+        self.store.save(session)
+        self._schedule_purge()
         return session
     
+    def _schedule_purge(self) -> None:
+        # New sessions are what makes the store grow, so they also trigger the
+        # cleanup, in the background and at most once per interval per process
+        if not self.purge_interval:
+            return
+        with self._purge_lock:
+            now = time.monotonic()
+            if now < self._next_purge:
+                return
+            self._next_purge = now + self.purge_interval
+        threading.Thread(target=self._purge_in_background, name='session-purge', daemon=True).start()
+    
+    def _purge_in_background(self) -> None:
+        try:
+            self.purge_expired()
+        except Exception:
+            logger.exception('Purging expired sessions failed')
+    
+    def purge_expired(self) -> Dict[str, int]:
+        """Delete the sessions unchanged for longer than the retention period,
+        then the stored outputs that no remaining step refers to"""
+        purged = []
+        if self.retention:
+            changed_before = datetime.fromtimestamp(time.time() - self.retention).isoformat()
+            purged = self.store.purge(changed_before)
+            for session_id in purged:
+                self.report_cache.discard_session(session_id)
+                self._notify('session_deleted', session_id)
+        
+        referenced = self.store.referenced_blobs() if self.blobs else None
+        blobs = self.blobs.purge(referenced) if referenced is not None else 0
+        if purged or blobs:
+            logger.info('Purged %d expired sessions and %d unused outputs', len(purged), blobs)
+        return {'sessions': len(purged), 'blobs': blobs}
+    
     def get_session(self, session_id: str) -> Optional[TroubleshootingSession]:
-        return self.sessions.get(session_id)
+        return self.store.get(session_id)
+    
+    def session_exists(self, session_id: str) -> bool:
+        return self.store.exists(session_id)
+    
+    def get_session_version(self, session_id: str) -> Optional[SessionVersion]:
+        """Version of a session, read without loading its steps"""
+        return self.store.get_version(session_id)
+    
+    def session_data(self, session: TroubleshootingSession,
+                     view: SessionView) -> Tuple[Dict[str, Any], Optional[Dict[str, int]]]:
+        """The parts of a session selected by ``view``, and the cursor for its next page of steps"""
+        return view.render(session)
+    
+    def session_data_etag(self, session_id: str, version: int, view: SessionView) -> str:
+        return f'{session_id}-{version}-data-{view.key}'
     
     def update_issue_info(self, session_id: str, issue_data: Dict[str, Any]) -> bool:
-        session = self.get_session(session_id)
-        if not session:
-            return False
+        def change(session: TroubleshootingSession) -> None:
+            session.issue_info = IssueInfo.from_dict(issue_data)
         
-        session.issue_info = IssueInfo.from_dict(issue_data)
-        return True
+        return self._save_changes(session_id, change, 'session_changed') is not None
     
     def add_step(self, session_id: str, command: str = "", output: str = "", analysis: str = "") -> Optional[Step]:
-        session = self.get_session(session_id)
-        if not session:
+        if not command.strip() and not output.strip():
             return None
         
-        if not command.strip() and not output.strip():
+        output, output_ref = self._store_output(output)
+        return self._append_step(session_id, command, output, output_ref, analysis)
+    
+    def capture_step(self, session_id: str, command: str, chunks: Iterable[bytes], analysis: str = "",
+                     max_bytes: Optional[int] = None) -> Optional[Step]:
+        """Add a step whose output arrives in chunks of bytes, such as a streamed upload.
+        
+        The output is decoded as UTF-8 (invalid bytes are replaced) and, once
+        it reaches the blob threshold, written to the blob store chunk by
+        chunk, so it is never held in memory. Without a blob store the output
+        is stored inline, so at most ``capture_inline_max_bytes`` are accepted.
+        The session is only locked once the output is complete, so a long
+        upload does not hold up other writers. Raises OutputTooLargeError once
+        more than ``max_bytes`` have arrived; nothing is added then.
+        """
+        if not self.session_exists(session_id):
             return None
         
-        return session.add_step(command, output, analysis)
+        max_bytes = self.capture_limit(max_bytes)
+        
+        texts = self._decode_output(chunks, max_bytes)
+        parts, buffered = [], 0
+        for text in texts:
+            parts.append(text)
+            buffered += len(text)
+            if self.blobs and buffered >= self.blob_threshold:
+                break
+        
+        if self.blobs and buffered >= self.blob_threshold:
+            output, output_ref = "", self.blobs.put_stream(chain(parts, texts))
+        else:
+            output, output_ref = "".join(parts), None
+        
+        if not command.strip() and not output_ref and not output.strip():
+            return None
+        return self._append_step(session_id, command, output, output_ref, analysis)
+    
+    def capture_limit(self, max_bytes: Optional[int]) -> Optional[int]:
+        """The most bytes a capture may have, given the configured ``max_bytes``"""
+        if self.blobs or not self.capture_inline_max_bytes:
+            return max_bytes
+        return min(max_bytes or self.capture_inline_max_bytes, self.capture_inline_max_bytes)
+    
+    def _decode_output(self, chunks: Iterable[bytes], max_bytes: Optional[int]) -> Iterator[str]:
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        received = 0
+        for chunk in chunks:
+            received += len(chunk)
+            if max_bytes and received > max_bytes:
+                raise OutputTooLargeError(max_bytes)
+            text = decoder.decode(chunk)
+            if text:
+                yield text
+        text = decoder.decode(b'', final=True)
+        if text:
+            yield text
+    
+    def _append_step(self, session_id: str, command: str, output: str, output_ref: Optional[BlobRef],
+                     analysis: str) -> Optional[Step]:
+        with self._writing(session_id) as session:
+            if not session:
+                return None
+            
+            step_id = self.store.allocate_step_id(session)
+            step = session.add_step(command, output, analysis, output_ref, step_id=step_id)
+            self.store.add_step(session, step)
+            self._notify('step_added', session, step)
+            return step
+    
+    def _store_output(self, output: str) -> Tuple[str, Optional[BlobRef]]:
+        """Move a large output to the blob store; the step then only keeps a reference"""
+        if self.blobs and len(output) >= self.blob_threshold:
+            return "", self.blobs.put(output)
+        return output, None
+    
+    def get_step(self, session_id: str, step_id: int) -> Optional[Step]:
+        """A single step, read without loading the rest of the session"""
+        return self.store.load_step(session_id, step_id)
+    
+    def update_step(self, session_id: str, step_id: int, step_data: Dict[str, Any]) -> Optional[Step]:
+        """Update the command, output and/or analysis of a single step"""
+        with self._writing(session_id) as session:
+            if not session or step_id not in session.steps:
+                return None
+            
+            changes = {name: str(step_data[name]) for name in ('command', 'output', 'analysis') if name in step_data}
+            if 'output' in changes:
+                changes['output'], changes['output_ref'] = self._store_output(changes['output'])
+            
+            step = session.update_step(step_id, **changes)
+            self.store.update_step(session, step)
+            self._notify('step_updated', session, step)
+            return step
+    
+    def move_step(self, session_id: str, step_id: int, before: Optional[int] = None) -> bool:
+        """Move a step in front of step ``before``, or to the end"""
+        with self._writing(session_id) as session:
+            if not session:
+                return False
+            
+            if not session.move_step(step_id, before):
+                return False
+            
+            if not self.store.move_step(session, step_id, before):
+                return False
+            
+            self._notify('step_moved', session, step_id)
+            return True
+    
+    def get_steps_page(self, session: TroubleshootingSession, before: Optional[int] = None,
+                       limit: int = 20) -> Tuple[List[Step], bool]:
+        """Return up to ``limit`` steps preceding step ``before`` (or the latest ones),
+        oldest first, and whether even older steps exist"""
+        return session.steps.page(before, limit)
     
     def remove_step(self, session_id: str, step_id: int) -> bool:
-        session = self.get_session(session_id)
-        if not session:
-            return False
-        
-        return session.remove_step(step_id)
+        with self._writing(session_id) as session:
+            if not session:
+                return False
+            
+            if not session.remove_step(step_id):
+                return False
+            
+            if not self.store.remove_step(session, step_id):
+                return False
+            
+            self._notify('step_removed', session, step_id)
+            return True
     
     def update_resolution(self, session_id: str, resolution_data: Dict[str, Any]) -> bool:
-        session = self.get_session(session_id)
-        if not session:
-            return False
+        def change(session: TroubleshootingSession) -> None:
+            session.resolution = Resolution.from_dict(resolution_data)
+        
+        return self._save_changes(session_id, change, 'session_changed') is not None
+    
+    def patch_session(self, session_id: str, base_version: int, issue_data: Optional[Dict[str, Any]] = None,
+                      resolution_data: Optional[Dict[str, Any]] = None) -> Optional[TroubleshootingSession]:
+        """Apply only the changed issue/resolution fields of a session.
+        
+        Raises VersionConflictError if the session has moved past base_version.
+        """
+        with self._writing(session_id) as session:
+            if not session:
+                return None
+            
+            if session.version != base_version:
+                raise VersionConflictError(session_id, session.version)
+            
+            changed = False
+            for target, changes in ((session.issue_info, issue_data), (session.resolution, resolution_data)):
+                names = {f.name for f in fields(target)}
+                for name, value in (changes or {}).items():
+                    if name not in names:
+                        continue
+                    value = Priority.parse(value) if name == 'priority' else str(value)
+                    if getattr(target, name) != value:
+                        setattr(target, name, value)
+                        changed = True
+            
+            if changed:
+                session.touch()
+                self.store.save(session, expected_version=base_version)
+                self._notify('session_changed', session)
+            return session
+    
+    def reserve_event_stream(self) -> bool:
+        """Claim a slot for one event stream; release it with ``release_event_stream``"""
+        return self.event_log.reserve_stream()
+    
+    def release_event_stream(self) -> None:
+        self.event_log.release_stream()
+    
+    def stream_events(self, session_id: str, version: int, after: int, keepalive: float = 15.0,
+                      duration: float = 300.0) -> Iterator[str]:
+        """Server-Sent Events with the changes to a session at ``version`` after version ``after``"""
+        return self.event_log.stream(session_id, after, version, keepalive, duration)
+    
+    def search(self, query: str, page: int = 1, per_page: int = 20) -> Tuple[List[Dict[str, Any]], bool]:
+        """Ranked full-text search over all stored sessions"""
+        if not self.search_index:
+            return [], False
         
-        session.resolution = Resolution.from_dict(resolution_data)
-        return True
+        return self.search_index.search(query, page, per_page)
+    
+    def analytics(self, group: str = 'day', since: Optional[str] = None, until: Optional[str] = None,
+                  priority: Optional[str] = None, server: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Session counts, step counts and MTTR of the sessions opened from ``since`` to
+        ``until``, per ``group``; None if analytics are disabled"""
+        if self.analytics_index is None:
+            return None
+        
+        return self.analytics_index.summary(group, since, until, priority, server)
+    
+    def similar_sessions(self, session_id: Optional[str], text: str = "",
+                         k: int = 5) -> List[Dict[str, Any]]:
+        """Suggest resolved past sessions resembling a session plus any unsaved ``text``.
+        
+        Runs on every pause in typing, so neither the session nor its matches
+        are loaded with their steps: the session is represented by its stored
+        signature, and matches by their issue information and resolution.
+        """
+        if self.similarity_index is None:
+            return []
+        
+        signature = self.similarity_index.query_signature(session_id, text)
+        matches = self.similarity_index.query(signature, k, exclude=session_id)
+        summaries = self.store.get_summaries([match_id for match_id, _ in matches])
+        suggestions = []
+        for match_id, score in matches:
+            match = summaries.get(match_id)
+            if not match:
+                continue
+            suggestions.append({
+                'session_id': match_id,
+                'title': match.issue_info.title,
+                'server': match.issue_info.server,
+                'created_at': match.created_at,
+                'score': score,
+                'root_cause': match.resolution.root_cause,
+                'fix_commands': match.resolution.fix_commands
+            })
+        return suggestions
+    
+    def export_sessions(self, session_filter: Optional[SessionFilter] = None) -> Iterator[str]:
+        """Stream matching sessions as NDJSON lines, one session in memory at a time"""
+        return export_ndjson(self.store.iter_sessions(session_filter))
+    
+    def import_sessions(self, lines: Iterable[Union[str, bytes]], replace: bool = False) -> ImportResult:
+        """Load sessions from NDJSON lines; existing sessions are kept unless ``replace``"""
+        result = ImportResult()
+        
+        def prepared():
+            for session in parse_ndjson(lines, result):
+                for step in session.steps:
+                    step.output, step.output_ref = self._store_output(step.output)
+                yield session
+        
+        # Observers are notified in batches so derived indexes can write in bulk
+        batch = []
+        for session, written in self.store.import_sessions(prepared(), replace):
+            if not written:
+                result.skipped += 1
+                continue
+            result.imported += 1
+            self.report_cache.discard_session(session.session_id)
+            batch.append(session)
+            if len(batch) >= self.IMPORT_BATCH_SIZE:
+                self._notify('sessions_loaded', batch)
+                batch = []
+        if batch:
+            self._notify('sessions_loaded', batch)
+        return result
     
     def generate_report(self, session_id: str) -> Optional[str]:
         session = self.get_session(session_id)
         if not session:
             return None
         
-        return self._generate_markdown_report(session)
+        return ''.join(self.render(session, 'markdown'))
+    
+    def render(self, session: TroubleshootingSession, fmt: str) -> Iterator[str]:
+        """Yield a rendered document, reusing the cached copy for this session version"""
+        key = (session.session_id, session.version, fmt)
+        cached = self.report_cache.get(key)
+        if cached is not None:
+            RENDER_CACHE.inc(fmt, 'hit')
+            yield from cached
+            return
+        
+        RENDER_CACHE.inc(fmt, 'miss')
+        renderer = self._iter_rca_document if fmt == 'rca' else self._iter_markdown_report
+        # Kept for the cache only while the document could still fit in it, so
+        # streaming a large document never holds more than one chunk
+        chunks: Optional[List[str]] = []
+        size = 0
+        # Only time spent producing chunks counts, not the time the consumer
+        # takes to send them on
+        elapsed = 0.0
+        started = time.perf_counter()
+        for chunk in renderer(session):
+            elapsed += time.perf_counter() - started
+            size += len(chunk)
+            if chunks is not None:
+                if self.report_cache.accepts(size):
+                    chunks.append(chunk)
+                else:
+                    chunks = None
+            yield chunk
+            started = time.perf_counter()
+        elapsed += time.perf_counter() - started
+        RENDER_SECONDS.observe(elapsed, fmt)
+        RENDER_SIZE.observe(size, fmt)
+        # Only complete renderings are cached
+        if chunks is not None:
+            self.report_cache.put(key, chunks)
+    
+    def report_etag(self, session: TroubleshootingSession, fmt: str) -> str:
+        return f'{session.session_id}-{session.version}-{fmt}'
     
     def _generate_markdown_report(self, session: TroubleshootingSession) -> str:
+        return ''.join(self._iter_markdown_report(session))
+    
+    def _iter_markdown_report(self, session: TroubleshootingSession) -> Iterator[str]:
         timestamp = datetime.now().strftime('%Y-%m-%d')
         time_string = datetime.now().strftime('%H:%M:%S')
         
-        report = f"# Troubleshooting Report - {session.issue_info.title or 'Server Issue'}\n\n"
-        report += f"**Date:** {timestamp} {time_string}\n"
-        report += f"**Server/Environment:** {session.issue_info.server}\n"
-        report += f"**Initial Symptoms:** {session.issue_info.symptoms}\n"
-        report += f"**Priority:** {session.issue_info.priority}\n\n"
+        yield (
+            f"# Troubleshooting Report - {session.issue_info.title or 'Server Issue'}\n\n"
+            f"**Date:** {timestamp} {time_string}\n"
+            f"**Server/Environment:** {session.issue_info.server}\n"
+            f"**Initial Symptoms:** {session.issue_info.symptoms}\n"
+            f"**Priority:** {session.issue_info.priority}\n\n"
+        )
         
         if session.steps:
-            report += "## Investigation Steps\n\n"
+            yield "## Investigation Steps\n\n"
             
+            # Step fields are yielded as-is so large outputs are never copied;
+            # long outputs are condensed, once per distinct output
             for step in session.steps:
-                report += f"### Step {step.id}: Investigation\n\n"
+                yield f"### Step {step.id}: Investigation\n\n"
                 
                 if step.command:
-                    report += f"**Command/Action:**\n```bash\n{step.command}\n```\n\n"
+                    yield "**Command/Action:**\n```bash\n"
+                    yield step.command
+                    yield "\n```\n\n"
                 
-                if step.output:
-                    report += f"**Output/Result:**\n```\n{step.output}\n```\n\n"
+                if step.output_length:
+                    condensed = self.condenser.condense_step(step)
+                    if condensed is None:
+                        yield "**Output/Result:**\n```\n"
+                        yield from step.iter_output()
+                    else:
+                        yield f"**Output/Result:** _(condensed from {step.output_length:,} characters)_\n```\n"
+                        yield condensed
+                    yield "\n```\n\n"
                 
                 if step.analysis:
-                    report += f"**Analysis:** {step.analysis}\n\n"
+                    yield "**Analysis:** "
+                    yield step.analysis
+                    yield "\n\n"
                 
-                report += "---\n\n"
+                yield "---\n\n"
         
-        if (session.resolution.root_cause or session.resolution.solution or 
-            session.resolution.fix_commands or session.resolution.verification or 
-            session.resolution.prevention):
+        resolution = session.resolution
+        if (resolution.root_cause or resolution.solution or 
+            resolution.fix_commands or resolution.verification or 
+            resolution.prevention):
             
-            report += "## Resolution Summary\n\n"
+            yield "## Resolution Summary\n\n"
             
-            if session.resolution.root_cause:
-                report += f"**Root Cause:** {session.resolution.root_cause}\n\n"
+            if resolution.root_cause:
+                yield f"**Root Cause:** {resolution.root_cause}\n\n"
             
-            if session.resolution.solution:
-                report += f"**Solution Applied:** {session.resolution.solution}\n\n"
+            if resolution.solution:
+                yield f"**Solution Applied:** {resolution.solution}\n\n"
             
-            if session.resolution.fix_commands:
-                report += f"**Resolution Commands:**\n```bash\n{session.resolution.fix_commands}\n```\n\n"
+            if resolution.fix_commands:
+                yield f"**Resolution Commands:**\n```bash\n{resolution.fix_commands}\n```\n\n"
             
-            if session.resolution.verification:
-                report += f"**Verification Steps:**\n{session.resolution.verification}\n\n"
+            if resolution.verification:
+                yield f"**Verification Steps:**\n{resolution.verification}\n\n"
             
-            if session.resolution.prevention:
-                report += f"**Prevention/Future Monitoring:** {session.resolution.prevention}\n\n"
+            if resolution.prevention:
+                yield f"**Prevention/Future Monitoring:** {resolution.prevention}\n\n"
             
-            report += f"**Time to Resolution:** {len(session.steps)} investigation steps\n"
-            report += f"**Total Investigation Time:** {timestamp} {time_string}\n\n"
-        
-        return report
+            if session.completed_at is not None:
+                time_to_resolution = format_duration(session.resolution_seconds)
+            else:
+                time_to_resolution = "Not resolved yet"
+            step_times = [step.timestamp for step in session.steps]
+            investigation_time = format_duration(max(step_times) - min(step_times)) if step_times else "n/a"
+            yield (
+                f"**Time to Resolution:** {time_to_resolution}\n"
+                f"**Investigation Steps:** {len(session.steps)}\n"
+                f"**Total Investigation Time:** {investigation_time}\n\n"
+            )
     
     def reset_session(self, session_id: str) -> bool:
-        if session_id in self.sessions:
-            del self.sessions[session_id]
+        # Under the write lock, so no writer can store the session again afterwards
+        with self.session_locks.hold(session_id):
+            self.report_cache.discard_session(session_id)
+            if not self.store.delete(session_id):
+                return False
+            
+            self._notify('session_deleted', session_id)
             return True
-        return False
+    
+    def complete_session(self, session_id: str) -> Optional[TroubleshootingSession]:
+        """Mark the session as completed without rendering anything"""
+        def change(session: TroubleshootingSession) -> None:
+            session.completed_at = datetime.now()
+        
+        return self._save_changes(session_id, change, 'session_completed')
     
     def generate_rca_report(self, session_id: str) -> Optional[str]:
         """Generate an RCA-specific report for completion"""
-        session = self.get_session(session_id)
+        session = self.complete_session(session_id)
         if not session:
             return None
         
-        # Mark the session as completed
-        session.completed_at = datetime.now()
-        return self._generate_rca_document(session)
+        return ''.join(self.render(session, 'rca'))
     
     def generate_rca_document(self, session_id: str) -> Optional[str]:
         """Generate downloadable RCA document"""
@@ -129,88 +673,124 @@ class TroubleshootingService:
         if not session:
             return None
         
-        return self._generate_rca_document(session)
+        return ''.join(self.render(session, 'rca'))
+    
+    def select_session_ids(self, session_filter: Optional[SessionFilter] = None,
+                           limit: Optional[int] = None) -> List[str]:
+        """IDs of the sessions matching a filter, oldest first, at most ``limit`` + 1 of them
+        so callers can tell that the limit was exceeded"""
+        ids = self.store.iter_session_ids(session_filter)
+        return list(islice(ids, limit + 1) if limit is not None else ids)
+    
+    def rca_archive(self, session_ids: List[str], workers: int = 1) -> Iterator[bytes]:
+        """Stream a ZIP archive with the RCA documents of the given sessions.
+        
+        With several workers and enough sessions to keep them busy, the
+        documents are rendered in a process pool and added in the order they
+        finish; with the SQLite store the workers load the sessions
+        themselves, so only IDs cross process boundaries.
+        """
+        workers = min(workers, len(session_ids) // SESSIONS_PER_WORKER)
+        if workers > 1:
+            if isinstance(self.store, SQLiteSessionStore):
+                documents = render_parallel(session_ids, workers, self.store.path,
+                                            self.blobs.root if self.blobs else None)
+            else:
+                # Workers cannot see this process's sessions; unknown IDs come back as missing
+                documents = render_parallel((self.get_session(session_id) or session_id
+                                             for session_id in session_ids), workers)
+        else:
+            documents = self._render_rca_documents(session_ids)
+        return stream_rca_zip(documents)
+    
+    def _render_rca_documents(self, session_ids: Iterable[str]) -> Iterator[Tuple[str, Optional[str], Optional[str]]]:
+        for session_id in session_ids:
+            session = self.get_session(session_id)
+            if session is None:
+                yield session_id, None, None
+            else:
+                yield session_id, session.issue_info.title, ''.join(self.render(session, 'rca'))
     
     def _generate_rca_document(self, session: TroubleshootingSession) -> str:
         """Generate a comprehensive RCA document"""
+        return ''.join(self._iter_rca_document(session))
+    
+    def _iter_rca_document(self, session: TroubleshootingSession) -> Iterator[str]:
+        """Yield the RCA document section by section"""
         timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        resolution = session.resolution
         
         # Header
-        rca_doc = "=" * 80 + "\n"
-        rca_doc += "ROOT CAUSE ANALYSIS (RCA) REPORT\n"
-        rca_doc += "=" * 80 + "\n\n"
+        yield "=" * 80 + "\n"
+        yield "ROOT CAUSE ANALYSIS (RCA) REPORT\n"
+        yield "=" * 80 + "\n\n"
         
         # Executive Summary
-        rca_doc += "EXECUTIVE SUMMARY\n"
-        rca_doc += "-" * 20 + "\n"
-        rca_doc += f"Issue Title: {session.issue_info.title or 'Server Issue'}\n"
-        rca_doc += f"Server/Environment: {session.issue_info.server}\n"
-        rca_doc += f"Priority Level: {session.issue_info.priority}\n"
-        rca_doc += f"Report Generated: {timestamp}\n"
-        rca_doc += f"Investigation Steps: {len(session.steps)}\n\n"
+        yield (
+            "EXECUTIVE SUMMARY\n"
+            + "-" * 20 + "\n"
+            f"Issue Title: {session.issue_info.title or 'Server Issue'}\n"
+            f"Server/Environment: {session.issue_info.server}\n"
+            f"Priority Level: {session.issue_info.priority}\n"
+            f"Report Generated: {timestamp}\n"
+            f"Investigation Steps: {len(session.steps)}\n\n"
+        )
         
         # Problem Statement
-        rca_doc += "PROBLEM STATEMENT\n"
-        rca_doc += "-" * 20 + "\n"
-        rca_doc += f"Initial Symptoms: {session.issue_info.symptoms}\n\n"
+        yield "PROBLEM STATEMENT\n" + "-" * 20 + "\n"
+        yield f"Initial Symptoms: {session.issue_info.symptoms}\n\n"
         
         # Root Cause Analysis
-        if session.resolution.root_cause:
-            rca_doc += "ROOT CAUSE ANALYSIS\n"
-            rca_doc += "-" * 20 + "\n"
-            rca_doc += f"{session.resolution.root_cause}\n\n"
+        if resolution.root_cause:
+            yield "ROOT CAUSE ANALYSIS\n" + "-" * 20 + "\n"
+            yield f"{resolution.root_cause}\n\n"
         
         # Investigation Timeline
         if session.steps:
-            rca_doc += "INVESTIGATION TIMELINE\n"
-            rca_doc += "-" * 20 + "\n"
+            yield "INVESTIGATION TIMELINE\n" + "-" * 20 + "\n"
             
             for i, step in enumerate(session.steps, 1):
-                rca_doc += f"Step {i}:\n"
+                yield f"Step {i}:\n"
                 
                 if step.command:
-                    rca_doc += f"  Command/Action: {step.command}\n"
+                    yield f"  Command/Action: {step.command}\n"
                 
-                if step.output:
+                if step.output_length:
                     # Truncate very long outputs for readability
-                    output = step.output
-                    if len(output) > 500:
-                        output = output[:500] + "... [TRUNCATED]"
-                    rca_doc += f"  Output/Result: {output}\n"
+                    output = step.output_preview(500)
+                    if step.output_length > 500:
+                        output += "... [TRUNCATED]"
+                    yield f"  Output/Result: {output}\n"
                 
                 if step.analysis:
-                    rca_doc += f"  Analysis: {step.analysis}\n"
+                    yield f"  Analysis: {step.analysis}\n"
                 
-                rca_doc += "\n"
+                yield "\n"
         
         # Solution Implementation
-        if session.resolution.solution:
-            rca_doc += "SOLUTION IMPLEMENTATION\n"
-            rca_doc += "-" * 25 + "\n"
-            rca_doc += f"{session.resolution.solution}\n\n"
+        if resolution.solution:
+            yield "SOLUTION IMPLEMENTATION\n" + "-" * 25 + "\n"
+            yield f"{resolution.solution}\n\n"
         
         # Fix Commands
-        if session.resolution.fix_commands:
-            rca_doc += "RESOLUTION COMMANDS\n"
-            rca_doc += "-" * 20 + "\n"
-            rca_doc += f"{session.resolution.fix_commands}\n\n"
+        if resolution.fix_commands:
+            yield "RESOLUTION COMMANDS\n" + "-" * 20 + "\n"
+            yield f"{resolution.fix_commands}\n\n"
         
         # Verification
-        if session.resolution.verification:
-            rca_doc += "VERIFICATION & TESTING\n"
-            rca_doc += "-" * 25 + "\n"
-            rca_doc += f"{session.resolution.verification}\n\n"
+        if resolution.verification:
+            yield "VERIFICATION & TESTING\n" + "-" * 25 + "\n"
+            yield f"{resolution.verification}\n\n"
         
         # Prevention Measures
-        if session.resolution.prevention:
-            rca_doc += "PREVENTION MEASURES\n"
-            rca_doc += "-" * 20 + "\n"
-            rca_doc += f"{session.resolution.prevention}\n\n"
+        if resolution.prevention:
+            yield "PREVENTION MEASURES\n" + "-" * 20 + "\n"
+            yield f"{resolution.prevention}\n\n"
         
         # Footer
-        rca_doc += "=" * 80 + "\n"
-        rca_doc += "End of RCA Report\n"
-        rca_doc += f"Generated by ResolvIQ on {timestamp}\n"
-        rca_doc += "=" * 80 + "\n"
-        
-        return rca_doc
\ No newline at end of file
+        yield (
+            "=" * 80 + "\n"
+            "End of RCA Report\n"
+            f"Generated by ResolvIQ on {timestamp}\n"
+            + "=" * 80 + "\n"
+        )
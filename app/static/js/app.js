@@ -2,16 +2,242 @@
 
 class ResolvIQ {
     constructor() {
+        const root = document.getElementById('session-root');
+        this.version = root ? parseInt(root.dataset.sessionVersion, 10) || 0 : 0;
+        // Empty until the first write creates the session on the server
+        this.sessionId = root ? root.dataset.sessionId || null : null;
+        // Seconds between polls when the server has no event stream to spare
+        this.pollInterval = root ? parseInt(root.dataset.eventsPoll, 10) || 0 : 0;
+        this.pollTimer = null;
+
+        // Last saved values and their hash per form, used to send only changed fields
+        this.savedValues = {};
+        this.savedHashes = {};
+        this.rememberSaved('issue_info', 'issue-form');
+        this.rememberSaved('resolution', 'resolution-form');
+
         this.initializeEventListeners();
         this.autoSaveInterval = null;
         this.setupAutoSave();
+
+        this.events = null;
+        this.outOfDate = false;
+        // Server copy from a rejected save, kept until the user reloads or merges it
+        this.conflict = null;
+        this.connectEvents();
+    }
+
+    connectEvents() {
+        // Changes made in other tabs or by other engineers arrive as they happen.
+        // The browser reconnects on its own, resuming after the last event ID
+        if (!window.EventSource || !this.sessionId || this.events) return;
+
+        const params = new URLSearchParams({ session_id: this.sessionId, after: this.version });
+        this.events = new EventSource(`/api/session/events?${params}`);
+        const reload = () => window.location.reload();
+        const handlers = {
+            step_added: (data) => this.onStepAdded(data),
+            step_removed: (data) => this.onStepRemoved(data),
+            step_updated: () => this.showOutOfDate('Steps were changed'),
+            step_moved: () => this.showOutOfDate('Steps were reordered'),
+            session_changed: (data) => this.onSessionChanged(data),
+            session_completed: () => {},
+            session_loaded: reload,
+            session_deleted: reload,
+            reset: reload
+        };
+        for (const [name, handler] of Object.entries(handlers)) {
+            this.events.addEventListener(name, (event) => this.applyEvent(event, handler));
+        }
+        this.events.addEventListener('error', () => {
+            // Dropped streams are reconnected by the browser; a refused one is closed for good
+            if (this.events && this.events.readyState === EventSource.CLOSED) {
+                this.events = null;
+                this.startPolling();
+            }
+        });
+    }
+
+    startPolling() {
+        if (this.pollTimer || !this.pollInterval) return;
+        this.pollTimer = setInterval(() => this.pollChanges(), this.pollInterval * 1000);
+    }
+
+    async pollChanges() {
+        const params = new URLSearchParams({
+            session_id: this.sessionId,
+            fields: 'issue_info,resolution,step_count,version'
+        });
+        try {
+            // Revalidated with the stored ETag, so an unchanged session costs the server a 304
+            const response = await fetch(`/api/session_data?${params}`, { cache: 'no-cache' });
+            const result = await response.json();
+            if (!result.success) {
+                clearInterval(this.pollTimer);
+                this.pollTimer = null;
+                return;
+            }
+            const data = result.data;
+            if (!(data.version > this.version)) return;
+
+            this.onSessionChanged(data);
+            const stepCount = document.getElementById('step-count');
+            if (!stepCount ? data.step_count > 0 : parseInt(stepCount.textContent, 10) !== data.step_count) {
+                this.showOutOfDate('Steps were changed');
+            }
+            if (!this.outOfDate) {
+                this.version = data.version;
+            }
+        } catch (error) {
+            console.error('Error polling for changes:', error);
+        }
+    }
+
+    applyEvent(event, handler) {
+        // Events up to our version are our own changes, or were replayed on reconnect
+        const version = parseInt(event.lastEventId, 10);
+        if (!(version > this.version)) return;
+
+        handler(JSON.parse(event.data));
+        // Once a change could not be applied, saves must keep failing with a conflict
+        if (!this.outOfDate) {
+            this.version = version;
+        }
+    }
+
+    async onStepAdded(data) {
+        this.updateStepCount(data.step_count);
+        if (document.querySelector(`[data-step-id="${data.step.id}"]`)) return;
+
+        const container = document.getElementById('steps-container');
+        if (!container) {
+            window.location.reload();
+            return;
+        }
+        try {
+            // Fetched by ID, so a step added right after this one can never take its place
+            const response = await fetch(`/steps/${data.step.id}`);
+            const result = await response.json();
+            if (!result.success || document.querySelector(`[data-step-id="${data.step.id}"]`)) return;
+
+            const previous = data.step.after !== null && container.querySelector(`[data-step-id="${data.step.after}"]`);
+            if (previous) {
+                previous.insertAdjacentHTML('afterend', result.html);
+            } else {
+                container.insertAdjacentHTML('beforeend', result.html);
+            }
+        } catch (error) {
+            console.error('Error loading new step:', error);
+        }
+    }
+
+    onStepRemoved(data) {
+        if (data.step_count === 0) {
+            window.location.reload();
+            return;
+        }
+        const stepElement = document.querySelector(`[data-step-id="${data.step_id}"]`);
+        if (stepElement) stepElement.remove();
+        this.updateStepCount(data.step_count);
+    }
+
+    onSessionChanged(data) {
+        for (const [section, formId] of [['issue_info', 'issue-form'], ['resolution', 'resolution-form']]) {
+            const form = document.getElementById(formId);
+            const values = this.readForm(formId);
+            if (!form || !values) continue;
+            const incoming = Object.fromEntries(Object.keys(values).map((name) => [name, String(data[section][name] ?? '')]));
+            const incomingHash = this.hashValues(incoming);
+            if (incomingHash === this.savedHashes[section]) continue;
+            if (incomingHash === this.hashValues(values)) {
+                // Our own save, reported before its response arrived
+                this.rememberSaved(section, formId, incoming);
+                continue;
+            }
+
+            if (this.hashValues(values) !== this.savedHashes[section]) {
+                // Unsaved typing here; keep it, and let the next save report the conflict
+                this.showOutOfDate('This issue was changed');
+                continue;
+            }
+            for (const [name, value] of Object.entries(incoming)) {
+                form.elements[name].value = value;
+            }
+            this.rememberSaved(section, formId, incoming);
+        }
+    }
+
+    adoptVersion(version) {
+        // A write of ours that follows our version directly moves us along; a larger
+        // jump means someone else wrote in between, which events or the next save report
+        if (!this.conflict && !this.outOfDate && version === this.version + 1) {
+            this.version = version;
+        }
+    }
+
+    showConflict(server) {
+        // Nothing is saved until the user decides, so the other change is never overwritten
+        this.conflict = server;
+        if (document.getElementById('conflict-banner')) return;
+
+        const banner = document.createElement('div');
+        banner.id = 'conflict-banner';
+        banner.className = 'bg-yellow-100 border border-yellow-400 text-yellow-800 px-4 py-3 rounded mb-4 fade-in';
+        banner.innerHTML = `
+            <span class="block sm:inline">This issue was changed in another tab or by another engineer, so your changes were not saved.</span>
+            <div class="mt-2 flex gap-2">
+                <button type="button" data-action="merge" class="bg-yellow-600 text-white px-3 py-1 rounded hover:bg-yellow-700">Keep my changes</button>
+                <button type="button" data-action="reload" class="bg-gray-600 text-white px-3 py-1 rounded hover:bg-gray-700">Reload</button>
+            </div>
+        `;
+        banner.querySelector('[data-action="merge"]').addEventListener('click', () => this.mergeConflict());
+        banner.querySelector('[data-action="reload"]').addEventListener('click', () => window.location.reload());
+
+        const container = document.querySelector('.max-w-4xl');
+        if (container) {
+            container.insertBefore(banner, container.firstChild);
+        }
+    }
+
+    mergeConflict() {
+        // Fields edited here keep the edit, all others take the server's value;
+        // the edits are then saved on top of the server's version
+        const server = this.conflict;
+        if (!server) return;
+
+        for (const [section, formId] of [['issue_info', 'issue-form'], ['resolution', 'resolution-form']]) {
+            const form = document.getElementById(formId);
+            const values = this.readForm(formId);
+            if (!form || !values) continue;
+            const saved = this.savedValues[section] || {};
+            const incoming = Object.fromEntries(Object.keys(values).map((name) => [name, String(server[section][name] ?? '')]));
+            for (const [name, value] of Object.entries(incoming)) {
+                if (values[name] === saved[name]) {
+                    form.elements[name].value = value;
+                }
+            }
+            this.rememberSaved(section, formId, incoming);
+        }
+
+        this.version = server.version;
+        this.conflict = null;
+        this.outOfDate = false;
+        const banner = document.getElementById('conflict-banner');
+        if (banner) banner.remove();
+        this.saveChanges();
+    }
+
+    showOutOfDate(what) {
+        this.outOfDate = true;
+        this.showError(`${what} in another tab or by another engineer. Reload the page to see the latest version.`);
     }
 
     initializeEventListeners() {
         // Issue form handling
         const issueForm = document.getElementById('issue-form');
         if (issueForm) {
-            issueForm.addEventListener('change', () => this.saveIssueInfo());
+            issueForm.addEventListener('change', () => this.saveChanges());
+            issueForm.addEventListener('input', () => this.scheduleSuggestions());
         }
 
         // Step form handling
@@ -23,7 +249,7 @@ class ResolvIQ {
         // Resolution form handling
         const resolutionForm = document.getElementById('resolution-form');
         if (resolutionForm) {
-            resolutionForm.addEventListener('change', () => this.saveResolution());
+            resolutionForm.addEventListener('change', () => this.saveChanges());
         }
 
         // Dark mode toggle
@@ -43,34 +269,97 @@ class ResolvIQ {
 
         // Initialize dark mode from localStorage
         this.initializeDarkMode();
+
+        // Suggestions for sessions that already have content
+        this.suggestionTimer = null;
+        this.loadSuggestions();
     }
 
     setupAutoSave() {
-        // Auto-save every 30 seconds
+        // Auto-save every 30 seconds; idle tabs send nothing
         this.autoSaveInterval = setInterval(() => {
-            this.saveIssueInfo();
-            this.saveResolution();
+            this.saveChanges();
         }, 30000);
     }
 
-    async saveIssueInfo() {
-        const form = document.getElementById('issue-form');
-        if (!form) return;
+    readForm(formId) {
+        const form = document.getElementById(formId);
+        if (!form) return null;
+        return Object.fromEntries(new FormData(form).entries());
+    }
+
+    hashValues(values) {
+        // Cheap 32-bit FNV-1a hash of the serialized form
+        const text = JSON.stringify(values);
+        let hash = 0x811c9dc5;
+        for (let i = 0; i < text.length; i++) {
+            hash ^= text.charCodeAt(i);
+            hash = Math.imul(hash, 0x01000193);
+        }
+        return hash >>> 0;
+    }
+
+    rememberSaved(section, formId, values = this.readForm(formId)) {
+        if (!values) return;
+        this.savedValues[section] = values;
+        this.savedHashes[section] = this.hashValues(values);
+    }
+
+    changedFields(section, formId) {
+        const values = this.readForm(formId);
+        if (!values || this.hashValues(values) === this.savedHashes[section]) {
+            return null;
+        }
+
+        const saved = this.savedValues[section] || {};
+        const changes = {};
+        for (const [name, value] of Object.entries(values)) {
+            if (saved[name] !== value) {
+                changes[name] = value;
+            }
+        }
+        return Object.keys(changes).length ? { values, changes } : null;
+    }
+
+    async saveChanges() {
+        if (this.conflict) return false;
+
+        const issue = this.changedFields('issue_info', 'issue-form');
+        const resolution = this.changedFields('resolution', 'resolution-form');
+        if (!issue && !resolution) return true;
+
+        const payload = { base_version: this.version };
+        if (issue) payload.issue_info = issue.changes;
+        if (resolution) payload.resolution = resolution.changes;
 
-        const formData = new FormData(form);
-        
         try {
-            const response = await fetch('/update_issue', {
-                method: 'POST',
-                body: formData
+            const response = await fetch('/api/session', {
+                method: 'PATCH',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify(payload)
             });
-            
+
             const result = await response.json();
+            if (response.status === 409) {
+                this.showConflict(result);
+                return false;
+            }
             if (!result.success) {
-                console.error('Failed to save issue info:', result.error);
+                console.error('Failed to save changes:', result.error);
+                return false;
             }
+
+            this.version = result.version;
+            if (!this.sessionId) {
+                this.sessionId = result.session_id;
+                this.connectEvents();
+            }
+            if (issue) this.rememberSaved('issue_info', 'issue-form', issue.values);
+            if (resolution) this.rememberSaved('resolution', 'resolution-form', resolution.values);
+            return true;
         } catch (error) {
-            console.error('Error saving issue info:', error);
+            console.error('Error saving changes:', error);
+            return false;
         }
     }
 
@@ -100,11 +389,25 @@ class ResolvIQ {
             const result = await response.json();
             
             if (result.success) {
+                this.adoptVersion(result.version);
+
                 // Clear the form
                 form.reset();
-                
-                // Reload the page to show the new step
-                window.location.reload();
+
+                const container = document.getElementById('steps-container');
+                if (!container) {
+                    // The first step also reveals the resolution section, so render the full page once
+                    window.location.reload();
+                    return;
+                }
+
+                // Splice the server-rendered step into the list, unless its event came first
+                if (!container.querySelector(`[data-step-id="${result.step.id}"]`)) {
+                    container.insertAdjacentHTML('beforeend', result.html);
+                }
+                container.scrollTop = container.scrollHeight;
+                this.updateStepCount(result.step_count);
+                this.loadSuggestions();
             } else {
                 this.showError(result.error || 'Failed to add step');
             }
@@ -116,25 +419,71 @@ class ResolvIQ {
         }
     }
 
-    async saveResolution() {
-        const form = document.getElementById('resolution-form');
-        if (!form) return;
+    scheduleSuggestions() {
+        // Refresh suggestions once the user pauses typing
+        clearTimeout(this.suggestionTimer);
+        this.suggestionTimer = setTimeout(() => this.loadSuggestions(), 400);
+    }
+
+    async loadSuggestions() {
+        const panel = document.getElementById('similar-incidents');
+        if (!panel) return;
+
+        // Unsaved issue fields are sent along so suggestions follow the typing
+        const issue = this.readForm('issue-form') || {};
+        const text = [issue.title || '', issue.symptoms || ''].join(' ').trim();
 
-        const formData = new FormData(form);
-        
         try {
-            const response = await fetch('/update_resolution', {
-                method: 'POST',
-                body: formData
-            });
-            
+            const response = await fetch(`/api/similar?text=${encodeURIComponent(text)}`);
             const result = await response.json();
-            if (!result.success) {
-                console.error('Failed to save resolution:', result.error);
+            if (result.success) {
+                this.renderSuggestions(result.suggestions);
             }
         } catch (error) {
-            console.error('Error saving resolution:', error);
+            console.error('Error loading suggestions:', error);
+        }
+    }
+
+    renderSuggestions(suggestions) {
+        const panel = document.getElementById('similar-incidents');
+        const list = document.getElementById('similar-list');
+        list.replaceChildren();
+
+        for (const suggestion of suggestions) {
+            const item = document.createElement('li');
+
+            const title = document.createElement('div');
+            title.className = 'font-medium text-gray-800 dark:text-white';
+            title.textContent = `${suggestion.title || 'Untitled issue'}` +
+                (suggestion.server ? ` (${suggestion.server})` : '') +
+                ` - ${Math.round(suggestion.score * 100)}% match`;
+            item.appendChild(title);
+
+            if (suggestion.root_cause) {
+                const rootCause = document.createElement('div');
+                rootCause.textContent = `Root cause: ${suggestion.root_cause}`;
+                item.appendChild(rootCause);
+            }
+
+            if (suggestion.fix_commands) {
+                const fix = document.createElement('pre');
+                fix.className = 'mt-1 p-2 bg-gray-100 dark:bg-gray-700 rounded font-mono text-xs overflow-x-auto';
+                fix.textContent = suggestion.fix_commands;
+                item.appendChild(fix);
+            }
+
+            list.appendChild(item);
         }
+
+        panel.classList.toggle('hidden', suggestions.length === 0);
+    }
+
+    updateStepCount(count) {
+        const stepCount = document.getElementById('step-count');
+        if (stepCount) stepCount.textContent = count;
+
+        const nextStep = document.getElementById('next-step-number');
+        if (nextStep) nextStep.textContent = count + 1;
     }
 
     setLoading(element, loading) {
@@ -216,8 +565,11 @@ class ResolvIQ {
     }
 
     async completeRCA() {
-        // First, save the current resolution data
-        await this.saveResolution();
+        // First, save any pending issue and resolution changes
+        if (!await this.saveChanges()) {
+            this.showError('Could not save your latest changes. Please try again.');
+            return;
+        }
         
         // Check if resolution fields are filled
         const form = document.getElementById('resolution-form');
@@ -273,14 +625,23 @@ async function removeStep(stepId) {
         const result = await response.json();
         
         if (result.success) {
+            app.adoptVersion(result.version);
+
+            if (result.step_count === 0) {
+                // Without steps the page hides the step list and resolution section
+                window.location.reload();
+                return;
+            }
+
             // Find and remove the step element with animation
             const stepElement = document.querySelector(`[data-step-id="${stepId}"]`);
             if (stepElement) {
                 stepElement.classList.add('step-removed');
                 setTimeout(() => {
-                    window.location.reload();
+                    stepElement.remove();
                 }, 300);
             }
+            app.updateStepCount(result.step_count);
         } else {
             app.showError('Failed to remove step');
         }
@@ -290,6 +651,59 @@ async function removeStep(stepId) {
     }
 }
 
+async function loadOlderSteps(button) {
+    const container = document.getElementById('steps-container');
+    const oldest = container.querySelector('[data-step-id]');
+    if (!oldest) return;
+
+    button.disabled = true;
+    try {
+        const response = await fetch(`/steps?before=${oldest.dataset.stepId}`);
+        const result = await response.json();
+
+        if (result.success) {
+            const loader = document.getElementById('older-steps');
+            loader.insertAdjacentHTML('afterend', result.html);
+            if (!result.has_more) {
+                loader.remove();
+            }
+        } else {
+            app.showError(result.error || 'Failed to load older steps');
+        }
+    } catch (error) {
+        console.error('Error loading steps:', error);
+        app.showError('Network error occurred');
+    } finally {
+        button.disabled = false;
+    }
+}
+
+async function toggleStepOutput(stepId, button) {
+    const output = button.nextElementSibling;
+
+    if (!output.dataset.loaded) {
+        try {
+            const response = await fetch(`/steps/${stepId}/output`);
+            if (!response.ok) {
+                app.showError('Failed to load step output');
+                return;
+            }
+            output.textContent = await response.text();
+            output.dataset.loaded = 'true';
+        } catch (error) {
+            console.error('Error loading step output:', error);
+            app.showError('Network error occurred');
+            return;
+        }
+    }
+
+    if (!button.dataset.label) {
+        button.dataset.label = button.textContent.trim();
+    }
+    const hidden = output.classList.toggle('hidden');
+    button.textContent = hidden ? button.dataset.label : 'Hide full output';
+}
+
 // Initialize the app when DOM is loaded
 let app;
 document.addEventListener('DOMContentLoaded', () => {
@@ -301,4 +715,7 @@ window.addEventListener('beforeunload', () => {
     if (app && app.autoSaveInterval) {
         clearInterval(app.autoSaveInterval);
     }
+    if (app && app.events) {
+        app.events.close();
+    }
 });
\ No newline at end of file
@@ -0,0 +1,92 @@
+import zlib
+from typing import Callable, Iterable, Iterator, Optional
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:
+    # Optional; without it responses are only gzip-compressed
+    brotli = None
+
+COMPRESSIBLE_TYPES = {'application/json', 'application/javascript', 'application/x-ndjson',
+                      'application/xml', 'image/svg+xml'}
+# Events have to reach the client as soon as they are written
+UNCOMPRESSED_TYPES = {'text/event-stream'}
+
+
+def is_compressible(mimetype: str) -> bool:
+    if mimetype in UNCOMPRESSED_TYPES:
+        return False
+    return mimetype.startswith('text/') or mimetype in COMPRESSIBLE_TYPES
+
+
+def negotiate_encoding() -> Optional[str]:
+    """The encoding the client prefers among those available, or None"""
+    encodings = ('br', 'gzip') if brotli is not None else ('gzip',)
+    return request.accept_encodings.best_match(encodings)
+
+
+class Encoder:
+    """Incremental gzip or brotli compression"""
+
+    def __init__(self, encoding: str, gzip_level: int = 6, brotli_quality: int = 4):
+        if encoding == 'br':
+            compressor = brotli.Compressor(quality=brotli_quality)
+            self.compress, self.finish = compressor.process, compressor.finish
+        else:
+            # wbits 31 writes a gzip header and trailer around the deflate stream
+            compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+            self.compress, self.finish = compressor.compress, compressor.flush
+
+    def encode(self, data: bytes) -> bytes:
+        return self.compress(data) + self.finish()
+
+
+def _compress_chunks(chunks: Iterable[bytes], encoder: Encoder, close: Optional[Callable[[], None]]) -> Iterator[bytes]:
+    try:
+        for chunk in chunks:
+            data = encoder.compress(chunk)
+            if data:
+                yield data
+        yield encoder.finish()
+    finally:
+        if close is not None:
+            close()
+
+
+def _compress_response(response):
+    if (response.status_code < 200 or response.status_code in (204, 206, 304) or response.direct_passthrough or
+            'Content-Encoding' in response.headers or response.cache_control.no_transform or
+            not is_compressible(response.mimetype or '')):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding()
+    if encoding is None:
+        return response
+
+    config = current_app.config
+    encoder = Encoder(encoding, config.get('COMPRESS_GZIP_LEVEL', 6), config.get('COMPRESS_BROTLI_QUALITY', 4))
+    if response.is_streamed:
+        # Streamed bodies are compressed as they are produced, whatever their size
+        close = getattr(response.response, 'close', None)
+        response.response = _compress_chunks(response.iter_encoded(), encoder, close)
+        response.content_length = None
+    else:
+        data = response.get_data()
+        if len(data) < config.get('COMPRESS_MIN_SIZE', 1024):
+            return response
+        response.set_data(encoder.encode(data))
+    response.content_encoding = encoding
+
+    # The compressed body is a different representation of the same content
+    etag, _ = response.get_etag()
+    if etag:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_compression(app):
+    """Compress responses for clients that accept gzip or brotli"""
+    app.after_request(_compress_response)
@@ -1,5 +1,5 @@
 from flask import render_template, request, jsonify
-import traceback
+from werkzeug.exceptions import HTTPException
 
 def register_error_handlers(app):
     """Register error handlers for the Flask application"""
@@ -13,8 +13,7 @@ def register_error_handlers(app):
     
     @app.errorhandler(500)
     def internal_error(error):
-        app.logger.error(f'Server Error: {error}')
-        app.logger.error(traceback.format_exc())
+        app.logger.error(f'Server Error: {error}', exc_info=getattr(error, 'original_exception', None) or error)
         if request.is_json:
             return jsonify({'error': 'Internal server error'}), 500
         return render_template('errors/500.html'), 500
@@ -28,8 +27,10 @@ def register_error_handlers(app):
     
     @app.errorhandler(Exception)
     def handle_exception(error):
-        app.logger.error(f'Unhandled exception: {error}')
-        app.logger.error(traceback.format_exc())
+        # Other HTTP errors (405, 413, ...) keep their own status
+        if isinstance(error, HTTPException):
+            return error
+        app.logger.error(f'Unhandled exception: {error}', exc_info=error)
         if request.is_json:
             return jsonify({'error': 'An unexpected error occurred'}), 500
         return render_template('errors/500.html'), 500
\ No newline at end of file
@@ -0,0 +1,32 @@
+import threading
+from contextlib import contextmanager
+from typing import Dict, List
+
+
+class KeyedLocks:
+    """One lock per key, created on first use and dropped once nobody holds
+    or waits for it, so memory stays proportional to the keys in use."""
+
+    def __init__(self):
+        self._guard = threading.Lock()
+        # key -> [lock, number of threads holding or waiting for it]
+        self._locks: Dict[str, List] = {}
+
+    @contextmanager
+    def hold(self, key: str):
+        with self._guard:
+            entry = self._locks.get(key)
+            if entry is None:
+                entry = self._locks[key] = [threading.Lock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._guard:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key]
+
+    def __len__(self) -> int:
+        return len(self._locks)
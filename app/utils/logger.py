@@ -1,47 +1,227 @@
+import atexit
+import json
 import logging
 import os
+import queue
+import random
+import re
+import uuid
 from datetime import datetime
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from flask import g, has_request_context, request, session
+from flask.logging import default_handler
+
+# Incoming X-Request-ID headers are reused only if they look like an ID
+REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+_exception_formatter = logging.Formatter()
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with the request context attached to the record"""
+
+    CONTEXT = ('request_id', 'session_id', 'method', 'path')
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for name in self.CONTEXT:
+            value = getattr(record, name, None)
+            if value:
+                entry[name] = value
+        entry['location'] = f'{record.pathname}:{record.lineno}'
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+class RequestContextFilter(logging.Filter):
+    """Attach request and session IDs to records and sample noisy paths.
+
+    Runs in the thread that logs, while the request context is still there.
+    Records below WARNING from requests to ``sampled_paths`` are kept at the
+    rate given for their level in ``sample_rates``.
+    """
+
+    def __init__(self, sample_rates=None, sampled_paths=()):
+        super().__init__()
+        self.sample_rates = sample_rates or {}
+        self.sampled_paths = tuple(sampled_paths)
+
+    def filter(self, record):
+        if not has_request_context():
+            return True
+
+        # Looked up once per request, on its first record
+        context = g.get('log_context')
+        if context is None:
+            path = request.path
+            context = g.log_context = (g.get('request_id'), request.method, path,
+                                       path.startswith(self.sampled_paths))
+        request_id, record.method, record.path, sampled = context
+
+        rate = self.sample_rates.get(record.levelno)
+        if sampled and rate is not None and random.random() >= rate:
+            return False
+
+        record.request_id = request_id
+        # dict.get skips the session's access tracking, so logging never adds Vary: Cookie
+        record.session_id = dict.get(session._get_current_object(), 'session_id')
+        return True
+
+class AsyncQueueHandler(QueueHandler):
+    """Hands records to the background writer without ever blocking the caller"""
+
+    def __init__(self, log_queue, max_size=10000):
+        super().__init__(log_queue)
+        self.max_size = max_size
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Resolve the message and traceback now: the arguments may change and the
+        # traceback frames go away once the caller moves on. The record is only
+        # handled by this handler, so it is updated in place rather than copied
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        # SimpleQueue has no size limit of its own; under a burst it is better
+        # to lose log lines than to stall requests or grow without bound
+        if self.queue.qsize() >= self.max_size:
+            self.dropped += 1
+            return
+        self.queue.put_nowait(record)
+
+class LogPipeline:
+    """Process-wide queue between the loggers and a background writer thread"""
+
+    def __init__(self, handlers, queue_size=10000):
+        self.handlers = handlers
+        self.queue_handler = AsyncQueueHandler(queue.SimpleQueue(), queue_size)
+        self.queue_handler._resolviq = True
+        self.listener = None
+        self.start()
+
+    def start(self):
+        self.listener = QueueListener(self.queue_handler.queue, *self.handlers, respect_handler_level=True)
+        self.listener.start()
+
+    def stop(self):
+        """Write out everything still queued and stop the writer thread"""
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def close(self):
+        self.stop()
+        for handler in self.handlers:
+            handler.close()
+
+    def restart_in_child(self):
+        # The inherited queue may have been locked by another thread mid-operation
+        self.queue_handler.queue = queue.SimpleQueue()
+        self.start()
+
+_pipeline = None
+
+def _stop_pipeline():
+    if _pipeline is not None:
+        _pipeline.stop()
+
+def _resume_in_parent():
+    if _pipeline is not None:
+        _pipeline.start()
+
+def _resume_in_child():
+    if _pipeline is not None:
+        _pipeline.restart_in_child()
+
+# A fork while the writer thread is inside a handler would leave the child
+# with locks nobody releases, so the writer is stopped around every fork
+atexit.register(_stop_pipeline)
+os.register_at_fork(before=_stop_pipeline, after_in_parent=_resume_in_parent, after_in_child=_resume_in_child)
+
+def _parse_sample_rates(value):
+    """Parse 'DEBUG:0.01,INFO:0.1' into {logging.DEBUG: 0.01, logging.INFO: 0.1}"""
+    rates = {}
+    for item in filter(None, (part.strip() for part in (value or '').split(','))):
+        level, _, rate = item.partition(':')
+        levelno = logging.getLevelName(level.strip().upper())
+        if isinstance(levelno, int) and levelno < logging.WARNING:
+            rates[levelno] = float(rate)
+    return rates
+
+def _assign_request_id():
+    header = request.headers.get('X-Request-ID', '')
+    g.request_id = header if REQUEST_ID_RE.match(header) else uuid.uuid4().hex
+
+def _echo_request_id(response):
+    request_id = g.get('request_id')
+    if request_id:
+        response.headers['X-Request-ID'] = request_id
+    return response
 
 def setup_logger(app):
-    """Setup application logging with file rotation"""
-    
-    # Create logs directory if it doesn't exist
-    if not os.path.exists('logs'):
-        os.makedirs('logs')
-    
+    """Setup application logging through a queue and a background writer.
+
+    Log calls only format the message and enqueue it; a listener thread does
+    the file I/O and rotation. Calling this again replaces the previous
+    pipeline instead of adding more handlers.
+    """
+    global _pipeline
+
     # Configure logging level based on debug mode
     log_level = logging.DEBUG if app.debug else logging.INFO
-    
-    # Create formatters
-    file_formatter = logging.Formatter(
-        '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
-    )
-    
-    console_formatter = logging.Formatter(
-        '%(levelname)s: %(message)s'
-    )
-    
-    # File handler with rotation
+
+    log_file = app.config.get('LOG_FILE', 'logs/resolviq.log')
+    log_dir = os.path.dirname(log_file)
+    if log_dir and not os.path.exists(log_dir):
+        os.makedirs(log_dir)
+
+    # File handler with rotation, written as JSON lines
     file_handler = RotatingFileHandler(
-        'logs/resolviq.log',
+        log_file,
         maxBytes=10240000,  # 10MB
         backupCount=10
     )
-    file_handler.setFormatter(file_formatter)
+    file_handler.setFormatter(JsonFormatter())
     file_handler.setLevel(log_level)
-    
-    # Console handler for development
+    handlers = [file_handler]
+
+    # Console output is readable text in development and JSON for log
+    # collectors in production
     console_handler = logging.StreamHandler()
-    console_handler.setFormatter(console_formatter)
+    console_handler.setFormatter(logging.Formatter('%(levelname)s: %(message)s') if app.debug else JsonFormatter())
     console_handler.setLevel(log_level)
-    
-    # Configure app logger
-    app.logger.addHandler(file_handler)
-    if app.debug:
-        app.logger.addHandler(console_handler)
-    
+    handlers.append(console_handler)
+
+    if _pipeline is not None:
+        _pipeline.close()
+    # Flask's default handler writes to stderr synchronously; the console
+    # handler above replaces it
+    app.logger.removeHandler(default_handler)
+    for handler in list(app.logger.handlers):
+        if getattr(handler, '_resolviq', False):
+            app.logger.removeHandler(handler)
+
+    _pipeline = LogPipeline(handlers, app.config.get('LOG_QUEUE_SIZE', 10000))
+    _pipeline.queue_handler.addFilter(RequestContextFilter(
+        _parse_sample_rates(app.config.get('LOG_SAMPLE_RATES')),
+        [path.strip() for path in (app.config.get('LOG_SAMPLED_PATHS') or '').split(',') if path.strip()]
+    ))
+    app.logger.addHandler(_pipeline.queue_handler)
     app.logger.setLevel(log_level)
+
+    app.before_request(_assign_request_id)
+    app.after_request(_echo_request_id)
+
     app.logger.info('ResolvIQ logging configured')
-    
-    return app.logger
\ No newline at end of file
+    return app.logger
@@ -0,0 +1,127 @@
+import hashlib
+import mimetypes
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+from flask import current_app, request
+from werkzeug.security import safe_join
+
+from app.utils.compression import Encoder, brotli, is_compressible, negotiate_encoding
+
+# Static files are compressed once per version, so at the highest settings
+STATIC_GZIP_LEVEL = 9
+STATIC_BROTLI_QUALITY = 11
+
+
+class StaticAssets:
+    """Content hashes and precompressed copies of the files in the static folder.
+
+    Both are computed once per version of a file (modification time and
+    size) and kept in memory; the static files are few and small.
+    """
+
+    def __init__(self, folder: Optional[str] = None):
+        self.folder = folder
+        self._versions: Dict[str, Tuple[Tuple[int, int], str, Dict[str, bytes]]] = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app) -> None:
+        self.folder = app.static_folder
+        with self._lock:
+            self._versions = {}
+        self.preload()
+
+    def _load(self, filename: str) -> Optional[Tuple[str, Dict[str, bytes]]]:
+        path = safe_join(self.folder, filename) if self.folder else None
+        try:
+            stat = os.stat(path) if path else None
+        except OSError:
+            return None
+        if stat is None:
+            return None
+        version = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            cached = self._versions.get(filename)
+        if cached is not None and cached[0] == version:
+            return cached[1], cached[2]
+
+        with open(path, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        compressed = {}
+        if is_compressible(mimetypes.guess_type(filename)[0] or ''):
+            compressed['gzip'] = Encoder('gzip', gzip_level=STATIC_GZIP_LEVEL).encode(data)
+            if brotli is not None:
+                compressed['br'] = Encoder('br', brotli_quality=STATIC_BROTLI_QUALITY).encode(data)
+        with self._lock:
+            self._versions[filename] = (version, digest, compressed)
+        return digest, compressed
+
+    def fingerprint(self, filename: str) -> Optional[str]:
+        """Short content hash of a static file, or None if there is no such file"""
+        loaded = self._load(filename)
+        return loaded[0] if loaded else None
+
+    def compressed(self, filename: str, encoding: str) -> Optional[bytes]:
+        loaded = self._load(filename)
+        return loaded[1].get(encoding) if loaded else None
+
+    def preload(self) -> None:
+        """Hash and compress every static file ahead of the first request"""
+        if not self.folder:
+            return
+        for root, _, files in os.walk(self.folder):
+            for name in files:
+                self._load(os.path.relpath(os.path.join(root, name), self.folder).replace(os.sep, '/'))
+
+
+static_assets = StaticAssets()
+
+
+def _add_fingerprint(endpoint, values):
+    # url_for('static', filename=...) gains ?v=<content hash>, so the URL changes with the file
+    if endpoint == 'static' and 'filename' in values and 'v' not in values:
+        digest = static_assets.fingerprint(values['filename'])
+        if digest:
+            values['v'] = digest
+
+
+def _serve_static(response):
+    if request.endpoint != 'static' or response.status_code not in (200, 304):
+        return response
+    filename = (request.view_args or {}).get('filename', '')
+
+    # Only the current fingerprint is immutable; a stale one must not pin new content
+    digest = static_assets.fingerprint(filename)
+    if digest and request.args.get('v') == digest:
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = current_app.config.get('STATIC_MAX_AGE', 365 * 24 * 3600)
+        response.cache_control.immutable = True
+
+    if not is_compressible(response.mimetype or ''):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding()
+    data = static_assets.compressed(filename, encoding) if encoding else None
+    if response.status_code == 200 and data is not None:
+        close = getattr(response.response, 'close', None)
+        if close is not None:
+            close()
+        response.direct_passthrough = False
+        response.set_data(data)
+        response.content_encoding = encoding
+    etag, _ = response.get_etag()
+    if etag and encoding:
+        # Weak, as for other compressed responses; conditional requests compare weakly
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_static_assets(app):
+    """Fingerprint static URLs and serve precompressed static files"""
+    static_assets.init_app(app)
+    app.url_defaults(_add_fingerprint)
+    app.after_request(_serve_static)
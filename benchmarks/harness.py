@@ -0,0 +1,214 @@
+"""Shared pieces of the benchmark and load-test scripts: synthetic sessions,
+an isolated application instance, timing, and baseline files.
+
+Results are stored as ``{"meta": {...}, "results": {name: {"median_ms": ...}}}``
+so runs of different scripts and revisions can be compared the same way.
+"""
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Changes smaller than this are treated as noise whatever their ratio
+NOISE_FLOOR_MS = 0.5
+
+_OUTPUT_LINES = (
+    '{time} {host} kernel: [{n}.{m:06d}] nvme0n1: I/O {n} QID {m} timeout, aborting',
+    '{time} {host} systemd[1]: service-{n}.service: Main process exited, code=exited, status=1/FAILURE',
+    '{time} {host} sshd[{n}]: Accepted publickey for deploy from 10.0.{m}.{n} port 5{n} ssh2',
+    'tcp   ESTAB  0  0  10.0.{m}.{n}:443  10.1.{n}.{m}:5{m}  users:(("nginx",pid={n},fd={m}))',
+    '/dev/sda{n}   {m}G  {n}G  {m}G  {n}% /var/lib/data{m}',
+    '  {n} root  20  0  {m}m  {n}m  {m}m S  {n}.{m}  1.{n}  0:{m}.{n} java',
+)
+
+
+def realistic_output(rng: random.Random, chars: int, host: str = 'web-01') -> str:
+    """Log-like command output of about ``chars`` characters"""
+    lines = []
+    size = 0
+    while size < chars:
+        line = rng.choice(_OUTPUT_LINES).format(
+            time=f'Mar {rng.randint(1, 28):2d} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:'
+                 f'{rng.randint(0, 59):02d}',
+            host=host, n=rng.randint(1, 9999), m=rng.randint(0, 255)
+        )
+        lines.append(line)
+        size += len(line) + 1
+    return '\n'.join(lines)[:chars]
+
+
+def build_session(steps: int, output_chars: int, seed: int = 42):
+    """A completed session with ``steps`` steps of ``output_chars`` characters of output each.
+
+    Outputs of the same size are shared between steps, so building large
+    sessions stays cheap; renderers do not care.
+    """
+    from app.models.troubleshooting import Priority, TroubleshootingSession
+
+    rng = random.Random(seed)
+    outputs = [realistic_output(rng, output_chars) for _ in range(min(steps, 8))]
+    session = TroubleshootingSession()
+    session.issue_info.title = f'Checkout latency spike ({steps} steps)'
+    session.issue_info.server = 'web-01'
+    session.issue_info.symptoms = 'p99 latency above 2s on /checkout; 502s from the load balancer'
+    session.issue_info.priority = Priority.HIGH
+    for i in range(steps):
+        session.add_step(f'journalctl -u service-{i % 50} --since "-{i % 60} min"',
+                         outputs[i % len(outputs)],
+                         f'Step {i}: nothing unusual' if i % 3 else '')
+    session.resolution.root_cause = 'Connection pool exhausted after a deploy doubled the worker count'
+    session.resolution.solution = 'Raised the pool size and restarted the service'
+    session.resolution.fix_commands = 'sed -i s/pool_size=20/pool_size=80/ /etc/app.conf\nsystemctl restart app'
+    session.resolution.verification = 'p99 back under 300ms for an hour'
+    session.resolution.prevention = 'Alert on pool saturation'
+    session.completed_at = datetime.now()
+    return session
+
+
+def configure_environment(store: str = 'memory') -> str:
+    """Point the application configuration at a throwaway directory.
+
+    Must run before ``app`` is imported, since the configuration is read from
+    the environment at import time. Search, similarity and metrics
+    databases are disabled so only the code under test is measured.
+    """
+    directory = tempfile.mkdtemp(prefix='resolviq-bench-')
+    os.environ.update({
+        'FLASK_ENV': 'production',
+        'SESSION_STORE': store,
+        'SESSION_DB_PATH': os.path.join(directory, 'resolviq.db'),
+        'BLOB_STORE_DIR': os.path.join(directory, 'blobs') if store == 'sqlite' else '',
+        'SEARCH_DB_PATH': '',
+        'SIMILARITY_DB_PATH': '',
+        'METRICS_DB_PATH': '',
+        'LOG_FILE': os.path.join(directory, 'resolviq.log'),
+        'SESSION_CACHE_MAX_BYTES': str(4 * 1024 ** 3),
+    })
+    return directory
+
+
+def _reference_workload() -> int:
+    counts: Dict[str, int] = {}
+    parts = []
+    for i in range(2000):
+        key = f'key-{i % 50}'
+        counts[key] = counts.get(key, 0) + i
+        parts.append(str(i))
+    return len(''.join(parts)) + len(sorted(counts.items()))
+
+
+def measure(fn: Callable[[], object], repeats: int = 5, min_seconds: float = 0.2,
+            max_seconds: float = 10.0, reference: bool = False) -> Dict[str, float]:
+    """Time ``fn`` after one warm-up call; at least ``repeats`` runs and ``min_seconds`` in total.
+
+    With ``reference``, every run is preceded by a fixed pure-Python workload
+    whose fastest time is reported as ``reference_ms``. Since both are timed
+    over the same period, comparisons can use it to discount a machine that
+    was faster or slower as a whole at the time (CPU frequency scaling,
+    noisy neighbours).
+    """
+    fn()
+    timings: List[float] = []
+    references: List[float] = []
+    started = time.perf_counter()
+    while len(timings) < repeats or time.perf_counter() - started < min_seconds:
+        if reference:
+            t0 = time.perf_counter()
+            _reference_workload()
+            references.append((time.perf_counter() - t0) * 1000)
+        t0 = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - t0) * 1000)
+        if time.perf_counter() - started > max_seconds and len(timings) >= 3:
+            break
+    result = {'median_ms': statistics.median(timings), 'min_ms': min(timings), 'runs': len(timings)}
+    if references:
+        result['reference_ms'] = min(references)
+    return result
+
+
+def percentiles(timings: List[float]) -> Dict[str, float]:
+    ordered = sorted(timings)
+
+    def at(fraction: float) -> float:
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+    return {'median_ms': at(0.5), 'p95_ms': at(0.95), 'p99_ms': at(0.99), 'runs': len(ordered)}
+
+
+def run_metadata() -> Dict[str, object]:
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                  text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        revision = ''
+    return {
+        'revision': revision,
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': f'{platform.system()} {platform.machine()} ({os.cpu_count()} CPUs)',
+    }
+
+
+def save_results(path: str, results: Dict[str, Dict[str, float]], meta: Dict) -> None:
+    with open(path, 'w') as f:
+        json.dump({'meta': meta, 'results': results}, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def compare_to_baseline(path: str, results: Dict[str, Dict[str, float]], threshold: float,
+                        statistic: str = 'median_ms', normalize: bool = True) -> bool:
+    """Print the comparison with the run saved in ``path``; True if nothing regressed"""
+    baseline, baseline_meta = load_results(path)
+    lines, regressions = compare_results(baseline, results, threshold, statistic, normalize)
+    print(f'\nCompared with {path} (revision {baseline_meta.get("revision") or "unknown"}):')
+    print('\n'.join(lines))
+    if regressions:
+        print(f'\n{len(regressions)} regression(s) above {threshold:.0%}')
+    return not regressions
+
+
+def load_results(path: str) -> Tuple[Dict[str, Dict[str, float]], Dict]:
+    """Results and metadata saved by ``save_results``"""
+    with open(path) as f:
+        saved = json.load(f)
+    return saved['results'], saved.get('meta', {})
+
+
+def compare_results(baseline: Dict[str, Dict[str, float]], results: Dict[str, Dict[str, float]],
+                    threshold: float, statistic: str = 'median_ms',
+                    normalize: bool = True) -> Tuple[List[str], List[str]]:
+    """Report lines for every benchmark in both runs, and the names that regressed.
+
+    With ``normalize``, a baseline timing is first scaled by how much slower
+    the reference workload ran next to the new timing than next to the old
+    one. A benchmark regressed when ``statistic`` is then more than
+    ``threshold`` (0.2 = 20%) slower than in the baseline and by more than
+    the noise floor.
+    """
+    lines, regressions = [], []
+    for name in sorted(results):
+        if name not in baseline:
+            lines.append(f'  {name:<52} {results[name][statistic]:>10.2f} ms   (new)')
+            continue
+        speed_factor = 1.0
+        if normalize and baseline[name].get('reference_ms') and results[name].get('reference_ms'):
+            speed_factor = results[name]['reference_ms'] / baseline[name]['reference_ms']
+        before, after = baseline[name][statistic] * speed_factor, results[name][statistic]
+        change = (after - before) / before if before else 0.0
+        regressed = change > threshold and after - before > NOISE_FLOOR_MS
+        if regressed:
+            regressions.append(name)
+        lines.append(f'  {name:<52} {before:>10.2f} -> {after:>10.2f} ms  {change:+7.1%}'
+                     f'{"  REGRESSION" if regressed else ""}')
+    return lines, regressions
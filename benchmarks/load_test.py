@@ -0,0 +1,240 @@
+"""Replay autosave/add-step traffic from many simulated users and report latencies.
+
+Every virtual user opens the main page, starts a session by adding a step,
+and then keeps working on it with a mix of requests similar to the
+browser's: mostly autosaves of the issue fields, new steps with outputs of
+realistic sizes, edits to earlier steps, and now and then a page reload, an
+older page of steps or the rendered report.
+
+By default the requests go to an in-process application through Flask's
+test client. With ``--url`` they are sent over HTTP to a running server,
+e.g. gunicorn started with ``gunicorn -c gunicorn.conf.py wsgi:app``.
+
+Usage:
+    python benchmarks/load_test.py [--users 8] [--duration 10] [--think-time 0]
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 --users 32 --duration 30
+    python benchmarks/load_test.py --save benchmarks/load_baseline.json
+    python benchmarks/load_test.py --compare benchmarks/load_baseline.json
+"""
+import argparse
+import http.cookiejar
+import json
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from typing import Dict, List, Optional, Tuple
+
+from harness import (compare_to_baseline, configure_environment, percentiles, realistic_output, run_metadata,
+                     save_results)
+
+# Share of requests per action once a session exists
+MIX = (
+    ('autosave', 0.55),
+    ('add_step', 0.20),
+    ('update_step', 0.08),
+    ('index', 0.07),
+    ('steps_page', 0.03),
+    ('generate_report', 0.05),
+    ('session_data', 0.02),
+)
+
+
+class TestClientTransport:
+    """Requests to an in-process application"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method: str, path: str, form: Optional[Dict] = None,
+                json_body: Optional[Dict] = None) -> Tuple[int, bytes]:
+        response = self.client.open(path, method=method, data=form, json=json_body)
+        return response.status_code, response.get_data()
+
+
+class HTTPTransport:
+    """Requests to a running server, with this user's own cookie jar"""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def request(self, method: str, path: str, form: Optional[Dict] = None,
+                json_body: Optional[Dict] = None) -> Tuple[int, bytes]:
+        data, headers = None, {}
+        if form is not None:
+            data = urllib.parse.urlencode(form).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        elif json_body is not None:
+            data = json.dumps(json_body).encode()
+            headers['Content-Type'] = 'application/json'
+        req = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        try:
+            with self.opener.open(req, timeout=30) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timings: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.conflicts = 0
+
+    def record(self, action: str, elapsed_ms: float, ok: bool) -> None:
+        with self.lock:
+            self.timings.setdefault(action, []).append(elapsed_ms)
+            if not ok:
+                self.errors[action] = self.errors.get(action, 0) + 1
+
+
+def output_size(rng: random.Random) -> int:
+    """Most outputs are a screenful; some are full log dumps"""
+    roll = rng.random()
+    if roll < 0.70:
+        return rng.randint(50, 2000)
+    if roll < 0.95:
+        return rng.randint(2000, 16000)
+    return rng.randint(16000, 256000)
+
+
+class VirtualUser:
+    def __init__(self, transport, recorder: Recorder, rng: random.Random, think_time: float):
+        self.transport = transport
+        self.recorder = recorder
+        self.rng = rng
+        self.think_time = think_time
+        self.version = 0
+        self.step_ids: List[int] = []
+        self.edits = 0
+
+    def call(self, action: str, method: str, path: str, **kwargs) -> Tuple[int, Optional[Dict]]:
+        started = time.perf_counter()
+        status, body = self.transport.request(method, path, **kwargs)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        data = None
+        if body[:1] == b'{':
+            data = json.loads(body)
+        ok = status == 200 and (data is None or data.get('success', True))
+        if action == 'autosave' and status == 409:
+            # Another tab won the race; the browser rebases on the returned version
+            ok = True
+            with self.recorder.lock:
+                self.recorder.conflicts += 1
+        self.recorder.record(action, elapsed_ms, ok)
+        if data and isinstance(data.get('version'), int):
+            self.version = data['version']
+        return status, data
+
+    def add_step(self) -> None:
+        _, data = self.call('add_step', 'POST', '/add_step', form={
+            'command': self.rng.choice(('journalctl -u nginx --since "-10 min"', 'ss -tanp', 'df -h',
+                                        'top -b -n 1', 'dmesg | tail -200', 'systemctl status app')),
+            'output': realistic_output(self.rng, output_size(self.rng)),
+            'analysis': 'Looks normal' if self.rng.random() < 0.5 else '',
+        })
+        if data and data.get('success'):
+            self.step_ids.append(data['step']['id'])
+
+    def act(self, action: str) -> None:
+        if action == 'autosave':
+            self.edits += 1
+            self.call(action, 'PATCH', '/api/session', json_body={
+                'base_version': self.version,
+                'issue_info': {'symptoms': f'Symptoms as typed so far, revision {self.edits}'},
+            })
+        elif action == 'add_step':
+            self.add_step()
+        elif action == 'update_step':
+            step_id = self.rng.choice(self.step_ids)
+            self.call(action, 'POST', f'/update_step/{step_id}',
+                      form={'analysis': f'Revised analysis {self.edits}'})
+        elif action == 'index':
+            self.call(action, 'GET', '/')
+        elif action == 'steps_page':
+            self.call(action, 'GET', f'/steps?before={self.rng.choice(self.step_ids)}')
+        elif action == 'generate_report':
+            self.call(action, 'GET', '/generate_report')
+        elif action == 'session_data':
+            self.call(action, 'GET', '/api/session_data')
+
+    def run(self, deadline: float) -> None:
+        self.call('index', 'GET', '/')
+        self.add_step()
+        actions, weights = zip(*MIX)
+        while time.monotonic() < deadline:
+            self.act(self.rng.choices(actions, weights)[0])
+            if self.think_time:
+                time.sleep(self.rng.expovariate(1 / self.think_time))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=8, help='Concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds to run')
+    parser.add_argument('--think-time', type=float, default=0.0, help='Mean pause between a user\'s requests')
+    parser.add_argument('--url', help='Base URL of a running server instead of an in-process app')
+    parser.add_argument('--store', choices=('memory', 'sqlite'), default='sqlite',
+                        help='Session store of the in-process app')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save', metavar='PATH', help='Write the latencies to PATH, e.g. as the new baseline')
+    parser.add_argument('--compare', metavar='PATH', help='Compare against the latencies saved in PATH')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Slowdown of a median that counts as a regression (default 0.2 = 20%%)')
+    args = parser.parse_args()
+
+    if args.url:
+        def transport():
+            return HTTPTransport(args.url)
+    else:
+        configure_environment(args.store)
+        from app import create_app
+        app = create_app()
+
+        def transport():
+            return TestClientTransport(app)
+
+    meta = run_metadata()
+    recorder = Recorder()
+    users = [VirtualUser(transport(), recorder, random.Random(args.seed * 1000 + i), args.think_time)
+             for i in range(args.users)]
+    deadline = time.monotonic() + args.duration
+    threads = [threading.Thread(target=user.run, args=(deadline,)) for user in users]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    target = args.url or f'in-process ({args.store} store)'
+    total = sum(len(timings) for timings in recorder.timings.values())
+    print(f'{target}: {args.users} users, {total} requests in {elapsed:.1f}s ({total / elapsed:.0f} req/s), '
+          f'{recorder.conflicts} autosave conflicts')
+    print(f'  {"action":<16} {"requests":>9} {"errors":>7} {"median":>9} {"p95":>9} {"p99":>9}')
+    results = {}
+    for action, _ in MIX:
+        timings = recorder.timings.get(action)
+        if not timings:
+            continue
+        stats = percentiles(timings)
+        results[f'load/{action}'] = stats
+        print(f'  {action:<16} {len(timings):>9} {recorder.errors.get(action, 0):>7} '
+              f'{stats["median_ms"]:>7.2f}ms {stats["p95_ms"]:>7.2f}ms {stats["p99_ms"]:>7.2f}ms')
+
+    if args.save:
+        save_results(args.save, results, meta)
+        print(f'Saved {len(results)} results to {args.save}')
+
+    if args.compare and not compare_to_baseline(args.compare, results, args.threshold, normalize=False):
+        return 1
+    return 1 if sum(recorder.errors.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,61 @@
+"""Measure the memory the session model spends per troubleshooting step.
+
+Step texts are generated before measuring starts, so the reported numbers
+are the model's own overhead per step: the Step object, its timestamp and
+the bookkeeping of the step list. Only public model APIs are used, so the
+script can be run unchanged against older revisions for comparison.
+
+Usage:
+    python benchmarks/memory_per_step.py [--steps 100000] [--output-chars 200]
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models.troubleshooting import TroubleshootingSession  # noqa: E402
+
+
+def generate_texts(count: int, output_chars: int, seed: int = 42):
+    rng = random.Random(seed)
+    alphabet = 'abcdefghijklmnopqrstuvwxyz0123456789 '
+    return [
+        (f'systemctl status service-{i % 50}',
+         ''.join(rng.choice(alphabet) for _ in range(output_chars)),
+         f'note {i}' if i % 3 else '')
+        for i in range(count)
+    ]
+
+
+def measure(texts) -> int:
+    gc.collect()
+    tracemalloc.start()
+    session = TroubleshootingSession()
+    for command, output, analysis in texts:
+        session.add_step(command, output, analysis)
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(session.steps) == len(texts)
+    return current
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--steps', type=int, default=100000)
+    parser.add_argument('--output-chars', type=int, default=200)
+    args = parser.parse_args()
+
+    texts = generate_texts(args.steps, args.output_chars)
+    total = measure(texts)
+    print(f'steps:           {args.steps}')
+    print(f'model bytes:     {total}')
+    print(f'bytes per step:  {total / args.steps:.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""Time the report generators and the main routes on synthetic sessions.
+
+Sessions range from 10 to 10k steps with outputs from a few hundred
+characters up to several MB. For every session size the script times the
+service renderers directly and the routes through Flask's test client, with
+the report cache emptied first wherever a cached copy would hide the cost.
+
+Save a run as the baseline, then compare later runs against it on the same
+machine; the script exits non-zero if any benchmark got slower than the
+threshold allows. The fastest run of each benchmark is compared by default,
+since it is the least affected by other load on the machine. A fixed
+reference workload is timed alongside every benchmark, and baseline timings
+are scaled by how much faster or slower it ran than when the baseline was
+taken.
+
+Usage:
+    python benchmarks/run_suite.py --save benchmarks/baseline.json
+    python benchmarks/run_suite.py --compare benchmarks/baseline.json [--threshold 0.2]
+    python benchmarks/run_suite.py --quick --filter markdown
+"""
+import argparse
+import sys
+
+from harness import build_session, compare_to_baseline, configure_environment, measure, run_metadata, save_results
+
+# (name, steps, output characters per step)
+CASES = [
+    ('steps10-out200', 10, 200),
+    ('steps100-out200', 100, 200),
+    ('steps1k-out200', 1000, 200),
+    ('steps10k-out200', 10000, 200),
+    ('steps100-out64k', 100, 64 * 1024),
+    ('steps10-out4m', 10, 4 * 1024 * 1024),
+]
+QUICK_CASES = ('steps10-out200', 'steps100-out200', 'steps1k-out200')
+
+
+def benchmarks_for(app, service, session):
+    """(name, callable) pairs for one stored session"""
+    session_id = session.session_id
+    client = app.test_client()
+    with client.session_transaction() as cookie:
+        cookie['session_id'] = session_id
+    middle_step = session.steps.page(limit=max(1, len(session.steps) // 2))[0][0].id
+
+    def get(path, cold=False):
+        def run():
+            if cold:
+                service.report_cache.discard_session(session_id)
+            response = client.get(path)
+            # Streamed bodies are only rendered while they are read
+            body = response.get_data()
+            assert response.status_code == 200, (path, response.status_code)
+            return body
+        return run
+
+    def revalidate(path):
+        etag = []
+        def run():
+            if not etag:
+                etag.append(client.get(path).headers['ETag'])
+            response = client.get(path, headers={'If-None-Match': etag[0]})
+            assert response.status_code == 304, (path, response.status_code)
+        return run
+
+    def add_step():
+        response = client.post('/add_step', data={'command': 'uptime', 'output': 'load average: 0.42',
+                                                  'analysis': ''})
+        assert response.get_json()['success']
+
+    def autosave():
+        version = service.get_session(session_id).version
+        response = client.patch('/api/session', json={'base_version': version,
+                                                      'issue_info': {'symptoms': f'edit {version}'}})
+        assert response.status_code == 200, response.get_json()
+
+    stored = service.get_session(session_id)
+    return [
+        ('service/markdown_report', lambda: service._generate_markdown_report(stored)),
+        ('service/rca_document', lambda: service._generate_rca_document(stored)),
+        ('route/index', get('/')),
+        ('route/steps_page', get(f'/steps?before={middle_step}')),
+        ('route/session_data', get('/api/session_data')),
+        ('route/session_data_preview', get('/api/session_data?output=preview&limit=20')),
+        ('route/session_data_304', revalidate('/api/session_data')),
+        ('route/generate_report', get('/generate_report', cold=True)),
+        ('route/generate_report_cached', get('/generate_report')),
+        ('route/download_rca', get(f'/download_rca/{session_id}', cold=True)),
+        ('route/autosave', autosave),
+        ('route/add_step', add_step),
+    ]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--store', choices=('memory', 'sqlite'), default='memory')
+    parser.add_argument('--quick', action='store_true', help='Only the sessions up to 1k small steps')
+    parser.add_argument('--filter', default='', help='Only benchmarks whose name contains this text')
+    parser.add_argument('--repeats', type=int, default=5, help='Minimum timed runs per benchmark')
+    parser.add_argument('--save', metavar='PATH', help='Write the results to PATH, e.g. as the new baseline')
+    parser.add_argument('--compare', metavar='PATH', help='Compare against the results saved in PATH')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Slowdown that counts as a regression (default 0.2 = 20%%)')
+    parser.add_argument('--statistic', choices=('min', 'median'), default='min',
+                        help='Which timing of each benchmark to compare')
+    parser.add_argument('--no-normalize', action='store_true',
+                        help='Compare raw timings without correcting for the machine\'s speed')
+    args = parser.parse_args()
+
+    configure_environment(args.store)
+    from app import create_app
+    from app.routes.troubleshooting import service
+
+    app = create_app()
+    meta = run_metadata()
+    results = {}
+    for case, steps, output_chars in CASES:
+        if args.quick and case not in QUICK_CASES:
+            continue
+        session = build_session(steps, output_chars)
+        list(service.store.import_sessions([session]))
+        for name, fn in benchmarks_for(app, service, session):
+            full_name = f'{name}/{args.store}/{case}'
+            if args.filter not in full_name:
+                continue
+            results[full_name] = measure(fn, repeats=args.repeats, reference=True)
+            print(f'  {full_name:<52} {results[full_name]["median_ms"]:>10.2f} ms '
+                  f'(min {results[full_name]["min_ms"]:.2f}, {results[full_name]["runs"]} runs)', flush=True)
+        service.reset_session(session.session_id)
+
+    if args.save:
+        save_results(args.save, results, meta)
+        print(f'Saved {len(results)} results to {args.save}')
+
+    if args.compare and not compare_to_baseline(args.compare, results, args.threshold,
+                                                f'{args.statistic}_ms', not args.no_normalize):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,160 @@
+"""Hammer a single session from many threads and check that it stays consistent.
+
+Writer threads add, update, move and remove steps and patch the issue fields
+of one session, while reader threads render reports and page through the
+steps of whatever version they fetched. Afterwards:
+
+- every step ID handed out is unique,
+- the stored steps are exactly the added ones minus the removed ones,
+- the version counts every successful write, so no update was lost,
+- no reader saw a session change while it was reading it, or failed.
+
+Only the public service API is used, so the script can be run against older
+revisions for comparison.
+
+Usage:
+    python benchmarks/stress_session.py [--store memory|sqlite] [--threads 16] [--ops 300]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.session_store import (MemorySessionStore, SQLiteSessionStore,  # noqa: E402
+                                        VersionConflictError)
+from app.services.troubleshooting_service import TroubleshootingService  # noqa: E402
+
+
+class Tally:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.added = []
+        self.removed = set()
+        self.writes = 0
+        self.conflicts = 0
+        self.reads = 0
+        self.errors = []
+
+    def error(self, message: str) -> None:
+        with self.lock:
+            self.errors.append(message)
+
+
+def writer(service, session_id, tally, ops, seed):
+    rng = random.Random(seed)
+    for i in range(ops):
+        try:
+            with tally.lock:
+                known = [step_id for step_id in tally.added if step_id not in tally.removed]
+            action = rng.random()
+            if action < 0.4 or not known:
+                step = service.add_step(session_id, f'cmd {seed}-{i}', f'output {seed}-{i}', 'note')
+                with tally.lock:
+                    tally.added.append(step.id)
+                    tally.writes += 1
+            elif action < 0.6:
+                if service.update_step(session_id, rng.choice(known), {'analysis': f'edit {seed}-{i}'}):
+                    with tally.lock:
+                        tally.writes += 1
+            elif action < 0.75:
+                if service.move_step(session_id, rng.choice(known), rng.choice(known + [None])):
+                    with tally.lock:
+                        tally.writes += 1
+            elif action < 0.9:
+                step_id = rng.choice(known)
+                if service.remove_step(session_id, step_id):
+                    with tally.lock:
+                        tally.removed.add(step_id)
+                        tally.writes += 1
+            else:
+                session = service.get_session(session_id)
+                try:
+                    service.patch_session(session_id, session.version, {'title': f'title {seed}-{i}'})
+                    with tally.lock:
+                        tally.writes += 1
+                except VersionConflictError:
+                    with tally.lock:
+                        tally.conflicts += 1
+        except Exception as e:
+            tally.error(f'writer {seed}: {type(e).__name__}: {e}')
+
+
+def reader(service, session_id, tally, stop):
+    while not stop.is_set():
+        try:
+            session = service.get_session(session_id)
+            before = session.to_dict()
+            ids = [step.id for step in session.steps]
+            if len(ids) != len(set(ids)) or len(ids) != len(session.steps):
+                tally.error(f'reader: inconsistent step list at version {session.version}')
+            service.get_steps_page(session, limit=10)
+            ''.join(service.render(session, 'markdown'))
+            if session.to_dict() != before:
+                tally.error(f'reader: session changed while being read at version {session.version}')
+            with tally.lock:
+                tally.reads += 1
+        except Exception as e:
+            tally.error(f'reader: {type(e).__name__}: {e}')
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--store', choices=('memory', 'sqlite'), default='memory')
+    parser.add_argument('--threads', type=int, default=16, help='Writer threads')
+    parser.add_argument('--readers', type=int, default=4, help='Reader threads')
+    parser.add_argument('--ops', type=int, default=300, help='Operations per writer')
+    args = parser.parse_args()
+
+    # Small switch interval so threads interleave as often as possible
+    sys.setswitchinterval(1e-5)
+
+    directory = tempfile.mkdtemp(prefix='resolviq-stress-')
+    store = (SQLiteSessionStore(os.path.join(directory, 'stress.db')) if args.store == 'sqlite'
+             else MemorySessionStore())
+    service = TroubleshootingService(store=store)
+    session_id = service.create_session().session_id
+    initial_version = service.get_session(session_id).version
+
+    tally = Tally()
+    stop = threading.Event()
+    writers = [threading.Thread(target=writer, args=(service, session_id, tally, args.ops, seed))
+               for seed in range(args.threads)]
+    readers = [threading.Thread(target=reader, args=(service, session_id, tally, stop))
+               for _ in range(args.readers)]
+    started = time.perf_counter()
+    for thread in readers + writers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    stop.set()
+    for thread in readers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    session = service.get_session(session_id)
+    stored = [step.id for step in session.steps]
+    expected = set(tally.added) - tally.removed
+    if len(tally.added) != len(set(tally.added)):
+        tally.error(f'{len(tally.added) - len(set(tally.added))} duplicate step IDs handed out')
+    if len(stored) != len(set(stored)) or set(stored) != expected:
+        tally.error(f'stored steps differ: {len(stored)} stored, {len(expected)} expected')
+    if session.version - initial_version != tally.writes:
+        tally.error(f'version advanced by {session.version - initial_version} for {tally.writes} writes')
+
+    print(f'store:      {args.store}')
+    print(f'writes:     {tally.writes} ({tally.conflicts} version conflicts) in {elapsed:.2f}s')
+    print(f'reads:      {tally.reads}')
+    print(f'steps:      {len(stored)}')
+    print(f'errors:     {len(tally.errors)}')
+    for message in tally.errors[:20]:
+        print(f'  {message}')
+    return 1 if tally.errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
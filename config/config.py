@@ -5,6 +5,125 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
     PERMANENT_SESSION_LIFETIME = timedelta(hours=2)
     
+    # Session storage backend: 'sqlite' (durable, shared by all workers) or 'memory'
+    SESSION_STORE = os.environ.get('SESSION_STORE') or 'sqlite'
+    SESSION_DB_PATH = os.environ.get('SESSION_DB_PATH') or 'data/resolviq.db'
+    
+    # Limits for the in-memory store; sessions idle longer than
+    # PERMANENT_SESSION_LIFETIME are expired, the rest are evicted LRU-first
+    SESSION_CACHE_MAX_SESSIONS = int(os.environ.get('SESSION_CACHE_MAX_SESSIONS', 1000))
+    SESSION_CACHE_MAX_BYTES = int(os.environ.get('SESSION_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+    SESSION_SPILL_DIR = os.environ.get('SESSION_SPILL_DIR') or None
+    
+    # The SQLite store deletes sessions unchanged for SESSION_RETENTION_SECONDS
+    # (0 keeps them forever) and stored outputs no step refers to anymore,
+    # checking at most every SESSION_PURGE_INTERVAL_SECONDS (0 disables it)
+    SESSION_RETENTION_SECONDS = int(os.environ.get('SESSION_RETENTION_SECONDS', 90 * 24 * 3600))
+    SESSION_PURGE_INTERVAL_SECONDS = int(os.environ.get('SESSION_PURGE_INTERVAL_SECONDS', 3600))
+    
+    # Step outputs of at least BLOB_THRESHOLD_CHARS characters are stored compressed
+    # and deduplicated in BLOB_STORE_DIR; set it to an empty string to keep them inline
+    BLOB_STORE_DIR = os.environ.get('BLOB_STORE_DIR', 'data/blobs')
+    BLOB_THRESHOLD_CHARS = int(os.environ.get('BLOB_THRESHOLD_CHARS', 4096))
+    
+    # Number of steps rendered per page on the main interface
+    STEPS_PAGE_SIZE = int(os.environ.get('STEPS_PAGE_SIZE', 20))
+    
+    # Rendered reports are memoized per session version
+    REPORT_CACHE_MAX_ENTRIES = int(os.environ.get('REPORT_CACHE_MAX_ENTRIES', 256))
+    REPORT_CACHE_MAX_BYTES = int(os.environ.get('REPORT_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    
+    # Outputs streamed to /api/capture (resolviq.py capture) are stored as they
+    # arrive; uploads larger than CAPTURE_MAX_BYTES are rejected
+    CAPTURE_MAX_BYTES = int(os.environ.get('CAPTURE_MAX_BYTES', 256 * 1024 * 1024))
+    # Without a blob store a capture is kept in memory until it is stored inline,
+    # so it may be no larger than CAPTURE_INLINE_MAX_BYTES
+    CAPTURE_INLINE_MAX_BYTES = int(os.environ.get('CAPTURE_INLINE_MAX_BYTES', 1024 * 1024))
+    
+    # /api/export and /api/import?replace=1 require this token as a bearer token;
+    # when unset they are only available through resolviq.py
+    ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN') or None
+    
+    # Step outputs of at least OUTPUT_CONDENSE_MIN_CHARS characters are condensed
+    # in Markdown reports (0 always includes them in full): repeated lines are
+    # collapsed, and besides the first and last lines only those matching
+    # OUTPUT_CONDENSE_ERROR_PATTERN (a lowercase regular expression, matched
+    # against lowercased lines) are kept. Condensed outputs are cached by
+    # content up to OUTPUT_CONDENSE_CACHE_MAX_BYTES
+    OUTPUT_CONDENSE_MIN_CHARS = int(os.environ.get('OUTPUT_CONDENSE_MIN_CHARS', 16000))
+    OUTPUT_CONDENSE_HEAD_LINES = int(os.environ.get('OUTPUT_CONDENSE_HEAD_LINES', 50))
+    OUTPUT_CONDENSE_TAIL_LINES = int(os.environ.get('OUTPUT_CONDENSE_TAIL_LINES', 50))
+    OUTPUT_CONDENSE_MAX_ERROR_LINES = int(os.environ.get('OUTPUT_CONDENSE_MAX_ERROR_LINES', 200))
+    OUTPUT_CONDENSE_MAX_LINE_CHARS = int(os.environ.get('OUTPUT_CONDENSE_MAX_LINE_CHARS', 1000))
+    OUTPUT_CONDENSE_ERROR_PATTERN = os.environ.get('OUTPUT_CONDENSE_ERROR_PATTERN', '')
+    OUTPUT_CONDENSE_CACHE_MAX_BYTES = int(os.environ.get('OUTPUT_CONDENSE_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+    
+    # Full-text search index over all sessions; set SEARCH_DB_PATH to an empty
+    # string to disable it. Only the first SEARCH_MAX_OUTPUT_CHARS characters
+    # of each step output are indexed
+    SEARCH_DB_PATH = os.environ.get('SEARCH_DB_PATH', 'data/search.db')
+    SEARCH_MAX_OUTPUT_CHARS = int(os.environ.get('SEARCH_MAX_OUTPUT_CHARS', 1000000))
+    
+    # MinHash signatures used to suggest similar resolved incidents; set
+    # SIMILARITY_DB_PATH to an empty string to disable suggestions
+    SIMILARITY_DB_PATH = os.environ.get('SIMILARITY_DB_PATH', 'data/similarity.db')
+    SIMILARITY_NUM_HASHES = int(os.environ.get('SIMILARITY_NUM_HASHES', 64))
+    
+    # Session counts, step counts and MTTR rolled up by day, priority and
+    # server, kept up to date as sessions change; set ANALYTICS_DB_PATH to an
+    # empty string to disable them
+    ANALYTICS_DB_PATH = os.environ.get('ANALYTICS_DB_PATH', 'data/analytics.db')
+    
+    # Log records are queued and written by a background thread; when more
+    # than LOG_QUEUE_SIZE are waiting, new ones are dropped. Below WARNING,
+    # records from requests to LOG_SAMPLED_PATHS are only kept at the rate
+    # given per level in LOG_SAMPLE_RATES
+    LOG_FILE = os.environ.get('LOG_FILE', 'logs/resolviq.log')
+    LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+    LOG_SAMPLE_RATES = os.environ.get('LOG_SAMPLE_RATES', 'DEBUG:0.01,INFO:0.1')
+    LOG_SAMPLED_PATHS = os.environ.get('LOG_SAMPLED_PATHS', '/healthz,/readyz,/static/')
+    
+    # Responses of at least COMPRESS_MIN_SIZE bytes, and all streamed ones, are
+    # compressed for clients that accept it: with brotli if the brotli package
+    # is installed, otherwise gzip. Static URLs carry a content hash and may be
+    # cached for STATIC_MAX_AGE seconds
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+    COMPRESS_GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL', 6))
+    COMPRESS_BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 4))
+    STATIC_MAX_AGE = int(os.environ.get('STATIC_MAX_AGE', 365 * 24 * 3600))
+    
+    # Changes to sessions are streamed to viewers as Server-Sent Events. Events
+    # of all workers are shared through EVENTS_DB_PATH (empty: per process) and
+    # kept for EVENTS_RETENTION_SECONDS, so reconnecting clients can catch up.
+    # Each open stream occupies a server thread until it ends after
+    # EVENTS_STREAM_SECONDS and the browser reconnects, so a worker keeps at
+    # most EVENTS_MAX_STREAMS open (default: half of its threads); pages that
+    # are refused poll for changes every EVENTS_FALLBACK_POLL_SECONDS instead
+    EVENTS_DB_PATH = os.environ.get('EVENTS_DB_PATH', 'data/events.db')
+    EVENTS_RETENTION_SECONDS = int(os.environ.get('EVENTS_RETENTION_SECONDS', 3600))
+    EVENTS_POLL_INTERVAL = float(os.environ.get('EVENTS_POLL_INTERVAL', 0.5))
+    EVENTS_KEEPALIVE_SECONDS = int(os.environ.get('EVENTS_KEEPALIVE_SECONDS', 15))
+    EVENTS_STREAM_SECONDS = int(os.environ.get('EVENTS_STREAM_SECONDS', 300))
+    EVENTS_MAX_STREAMS = int(os.environ.get('EVENTS_MAX_STREAMS') or
+                             max(1, int(os.environ.get('GUNICORN_THREADS', 4)) // 2))
+    EVENTS_FALLBACK_POLL_SECONDS = int(os.environ.get('EVENTS_FALLBACK_POLL_SECONDS', 10))
+    
+    # Bulk RCA archives render up to RCA_BULK_MAX_SESSIONS documents in a pool
+    # of RCA_BULK_WORKERS processes (default: one per CPU; 1 renders in the
+    # request thread)
+    RCA_BULK_MAX_SESSIONS = int(os.environ.get('RCA_BULK_MAX_SESSIONS', 1000))
+    RCA_BULK_WORKERS = int(os.environ.get('RCA_BULK_WORKERS', 0)) or os.cpu_count() or 1
+    
+    # Metrics from all worker processes are added up in METRICS_DB_PATH, each
+    # worker writing its share at most every METRICS_FLUSH_INTERVAL seconds.
+    # Set it empty to keep metrics per process
+    METRICS_DB_PATH = os.environ.get('METRICS_DB_PATH', 'data/metrics.db')
+    METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+    
+    # While this file exists /readyz answers 503, so load balancers stop
+    # routing new requests to the instance before it is restarted
+    DRAIN_FILE = os.environ.get('DRAIN_FILE') or None
+    
 class DevelopmentConfig(Config):
     DEBUG = True
     
@@ -0,0 +1,56 @@
+"""Gunicorn settings for running ResolvIQ in production.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Every setting can be overridden through the environment variables below.
+"""
+import gc
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:1337')
+
+# Each worker is a process with a pool of threads; SQLite writes are
+# serialized anyway, so threads mostly overlap reads and network I/O
+workers = int(os.environ.get('GUNICORN_WORKERS') or os.environ.get('WEB_CONCURRENCY') or
+              multiprocessing.cpu_count() * 2 + 1)
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = 'gthread'
+
+# Load the app (and fill the search and similarity indexes) once in the
+# master so workers start warm and share its memory copy-on-write. Code
+# changes then need a USR2 + WINCH binary upgrade; HUP only replaces workers
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1').lower() in ('1', 'true', 'yes')
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+# Time in-flight requests get to finish on HUP or TERM
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# Recycle workers after this many requests (0 disables), jittered so they
+# do not all restart at once
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 50))
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+
+# Collections while the app is loading would free objects between live
+# ones and leave holes that children later write into; collect once the
+# master is idle instead
+if preload_app:
+    gc.disable()
+
+
+def when_ready(server):
+    if preload_app:
+        # Move everything loaded so far out of the collector's reach, so
+        # collections in the workers never touch (and copy) the shared pages
+        gc.freeze()
+        gc.enable()
+    if os.environ.get('SESSION_STORE') == 'memory' and workers > 1:
+        server.log.warning('SESSION_STORE=memory keeps sessions per worker; use sqlite with several workers')
+
+
+def post_fork(server, worker):
+    gc.enable()
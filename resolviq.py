@@ -0,0 +1,221 @@
+"""ResolvIQ command line tools.
+
+Usage:
+    python resolviq.py export [-o FILE] [--since DATE] [--until DATE] [--priority P] [--completed yes|no]
+    python resolviq.py import [FILE] [--replace]
+    python resolviq.py rca [-o FILE] [--workers N] [--since DATE] [--until DATE] [--priority P]
+                           [--completed yes|no] [SESSION_ID ...]
+    python resolviq.py capture --session SESSION_ID [--url URL] [--analysis TEXT] [--quiet] -- COMMAND ...
+    python resolviq.py purge
+
+Sessions are read from and written to the storage configured for the app
+(see config/config.py), as newline-delimited JSON with one session per line.
+The rca command writes a ZIP archive with the RCA document of every listed
+or matching session, rendered in parallel.
+
+The capture command runs a command locally, shows its output and streams it
+(stdout and stderr combined) to a running ResolvIQ server as a new step of
+the given session.
+
+The purge command deletes the sessions unchanged for longer than
+SESSION_RETENTION_SECONDS and the stored outputs no step refers to anymore,
+which the server otherwise does on its own every SESSION_PURGE_INTERVAL_SECONDS.
+"""
+import argparse
+import json
+import os
+import shlex
+import subprocess
+import sys
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from app import create_app
+from app.routes.troubleshooting import service
+from app.services.session_store import SessionFilter
+from app.services.troubleshooting_service import CAPTURE_CHUNK_SIZE
+
+
+def export_command(args) -> int:
+    try:
+        session_filter = SessionFilter.parse(args.since, args.until, args.priority, args.completed)
+    except ValueError as e:
+        print(f'error: {e}', file=sys.stderr)
+        return 2
+
+    out = open(args.output, 'w', encoding='utf-8') if args.output != '-' else sys.stdout
+    try:
+        count = 0
+        for line in service.export_sessions(session_filter):
+            out.write(line)
+            count += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    print(f'Exported {count} sessions', file=sys.stderr)
+    return 0
+
+
+def import_command(args) -> int:
+    source = open(args.input, 'r', encoding='utf-8') if args.input != '-' else sys.stdin
+    try:
+        result = service.import_sessions(source, replace=args.replace)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+    print(json.dumps(result.to_dict(), indent=2), file=sys.stderr)
+    return 1 if result.failed else 0
+
+
+def rca_command(args) -> int:
+    if args.session_ids:
+        session_ids = list(dict.fromkeys(args.session_ids))
+    else:
+        try:
+            session_filter = SessionFilter.parse(args.since, args.until, args.priority, args.completed)
+        except ValueError as e:
+            print(f'error: {e}', file=sys.stderr)
+            return 2
+        session_ids = service.select_session_ids(session_filter)
+    if not session_ids:
+        print('error: no sessions found', file=sys.stderr)
+        return 1
+
+    out = open(args.output, 'wb') if args.output != '-' else sys.stdout.buffer
+    try:
+        for chunk in service.rca_archive(session_ids, workers=args.workers or os.cpu_count() or 1):
+            out.write(chunk)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+
+    print(f'Wrote RCA documents for {len(session_ids)} sessions to {args.output}', file=sys.stderr)
+    return 0
+
+
+def capture_command(args) -> int:
+    command = args.cmd[1:] if args.cmd[:1] == ['--'] else args.cmd
+    if not command:
+        print('error: no command given', file=sys.stderr)
+        return 2
+    if not args.session:
+        print('error: --session or RESOLVIQ_SESSION is required', file=sys.stderr)
+        return 2
+
+    url = args.url.rstrip('/')
+    # Check the session before running the command; a rejected upload cannot be retried
+    query = urllib.parse.urlencode({'session_id': args.session, 'fields': 'version'})
+    try:
+        with urllib.request.urlopen(f'{url}/api/session_data?{query}') as response:
+            found = json.load(response).get('success')
+    except (OSError, ValueError) as e:
+        print(f'error: cannot reach {url}: {e}', file=sys.stderr)
+        return 1
+    if not found:
+        print(f'error: session {args.session} not found', file=sys.stderr)
+        return 1
+
+    try:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    except OSError as e:
+        print(f'error: {e}', file=sys.stderr)
+        return 127
+
+    def output():
+        # A slow upload stops these reads, and the full pipe then pauses the command
+        for chunk in iter(lambda: process.stdout.read1(CAPTURE_CHUNK_SIZE), b''):
+            if not args.quiet:
+                sys.stdout.buffer.write(chunk)
+                sys.stdout.buffer.flush()
+            yield chunk
+
+    query = urllib.parse.urlencode({'session_id': args.session, 'command': shlex.join(command),
+                                    'analysis': args.analysis})
+    # An iterable body without a length is sent with chunked transfer encoding
+    upload = urllib.request.Request(f'{url}/api/capture?{query}', data=output(), method='POST',
+                                    headers={'Content-Type': 'text/plain; charset=utf-8'})
+    try:
+        with urllib.request.urlopen(upload) as response:
+            result = json.load(response)
+    except urllib.error.HTTPError as e:
+        try:
+            result = json.load(e)
+        except ValueError:
+            result = {'error': f'HTTP {e.code}'}
+    except OSError as e:
+        # The server stops reading once the output is over its size limit
+        result = {'error': f'upload failed, possibly because the output is too large: {e}'}
+
+    # Let the command finish even if the upload did not
+    for _ in output():
+        pass
+    returncode = process.wait()
+
+    if result.get('success'):
+        print(f'Added step {result["step"]["id"]} ({result["step"]["output_length"]} characters) '
+              f'to session {args.session}', file=sys.stderr)
+    else:
+        print(f'error: {result.get("error", "upload failed")}', file=sys.stderr)
+    return returncode if result.get('success') else returncode or 1
+
+
+def purge_command(args) -> int:
+    result = service.purge_expired()
+    print(f'Purged {result["sessions"]} expired sessions and {result["blobs"]} unused outputs', file=sys.stderr)
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='resolviq', description='ResolvIQ command line tools')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = commands.add_parser('export', help='Export sessions as NDJSON')
+    export_parser.add_argument('-o', '--output', default='-', help='Output file (default: stdout)')
+    export_parser.add_argument('--since', help='Only sessions created at or after this ISO date/time')
+    export_parser.add_argument('--until', help='Only sessions created before this ISO date/time')
+    export_parser.add_argument('--priority', help='Only sessions with this priority')
+    export_parser.add_argument('--completed', help='Only completed (yes) or open (no) sessions')
+    export_parser.set_defaults(handler=export_command)
+
+    import_parser = commands.add_parser('import', help='Import sessions from NDJSON')
+    import_parser.add_argument('input', nargs='?', default='-', help='Input file (default: stdin)')
+    import_parser.add_argument('--replace', action='store_true', help='Overwrite sessions that already exist')
+    import_parser.set_defaults(handler=import_command)
+
+    rca_parser = commands.add_parser('rca', help='Write the RCA documents of many sessions to a ZIP archive')
+    rca_parser.add_argument('session_ids', nargs='*', metavar='SESSION_ID',
+                            help='Sessions to include (default: all matching the filters)')
+    rca_parser.add_argument('-o', '--output', default='rca-reports.zip', help='Output file (- for stdout)')
+    rca_parser.add_argument('-w', '--workers', type=int, default=0, help='Rendering processes (default: one per CPU)')
+    rca_parser.add_argument('--since', help='Only sessions created at or after this ISO date/time')
+    rca_parser.add_argument('--until', help='Only sessions created before this ISO date/time')
+    rca_parser.add_argument('--priority', help='Only sessions with this priority')
+    rca_parser.add_argument('--completed', help='Only completed (yes) or open (no) sessions')
+    rca_parser.set_defaults(handler=rca_command)
+
+    capture_parser = commands.add_parser('capture', help='Run a command and stream its output into a session')
+    capture_parser.add_argument('-s', '--session', default=os.environ.get('RESOLVIQ_SESSION'),
+                                help='Session to add the step to (default: $RESOLVIQ_SESSION)')
+    capture_parser.add_argument('--url', default=os.environ.get('RESOLVIQ_URL', 'http://localhost:1337'),
+                                help='ResolvIQ server (default: $RESOLVIQ_URL or http://localhost:1337)')
+    capture_parser.add_argument('-a', '--analysis', default='', help='Analysis to record with the step')
+    capture_parser.add_argument('-q', '--quiet', action='store_true', help='Do not show the output while capturing')
+    capture_parser.add_argument('cmd', nargs=argparse.REMAINDER, metavar='-- COMMAND',
+                                help='Command to run, with its arguments')
+    # Talks to a server instead of opening the storage itself
+    capture_parser.set_defaults(handler=capture_command, local=False)
+
+    purge_parser = commands.add_parser('purge', help='Delete expired sessions and unused stored outputs')
+    purge_parser.set_defaults(handler=purge_command)
+
+    args = parser.parse_args(argv)
+    if getattr(args, 'local', True):
+        create_app()
+    return args.handler(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,4 +3,5 @@ from app import create_app
 app = create_app()
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=1337)
+    # Development server only; production runs wsgi:app under gunicorn
+    app.run(debug=app.debug, host='0.0.0.0', port=1337)